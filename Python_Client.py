@@ -1,34 +1,566 @@
 import socket, os
+import asyncio
 import logging
+import itertools
+import time
+import struct
+import threading
+from collections import namedtuple
 
-sock = None
+HOST = "127.0.0.1"
+PORT = 65432  # Ensure IP and port match Lua script
+DEFAULT_TIMEOUT = 10.0
+FLUSH_TIMEOUT = 120.0
+SWAP_SEPARATOR = "|"  # Not allowed in Windows file names
+
+# Binary framing, negotiated per connection with "binary <version>". Every frame is
+# a header (payload length, opcode, request id) followed by the payload; command
+# arguments are separated by NUL bytes, so paths may contain any other character.
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct(">IBI")
+REPLY_HEADER = struct.Struct(">Bd")  # Status (0 ok, 1 error) and elapsed ms
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+OP_TEXT = 0  # Payload is a text command line
+OP_REPLY = 128
+OP_EVENT = 129
+OPCODES = {'loadrom': 1, 'savestate': 2, 'loadstate': 3, 'swap': 4, 'statepool': 5, 'flush': 6, 'status': 7, 'ping': 8,
+           'forget': 9}
+ARGUMENT_SEPARATOR = b"\0"
+EVENT_PREFIX = "!"  # Text lines pushed by the server: "!<name> <arg>|<arg>"
+
+# Reply to a tagged command: status is "ok" or "error", elapsed_ms is the time the
+# Lua server spent running the command and round_trip_ms the time seen from Python.
+CommandResult = namedtuple('CommandResult', ['request_id', 'status', 'elapsed_ms', 'round_trip_ms', 'message'])
+
+
+class CommandTimeout(TimeoutError):
+    """Raised when the emulator does not acknowledge a command in time."""
+
+
+def parse_reply(line):
+    """Parse a '#<id> <status> <elapsed_ms> [message]' reply line, or return None."""
+    parts = line.split(" ", 3)
+    if len(parts) < 3 or not parts[0].startswith("#"):
+        return None
+    try:
+        request_id = int(parts[0][1:])
+        elapsed_ms = float(parts[2])
+    except ValueError:
+        return None
+    message = parts[3] if len(parts) > 3 else ""
+    return request_id, parts[1], elapsed_ms, message
+
+
+def encode_frame(opcode, request_id, payload=b""):
+    return FRAME_HEADER.pack(len(payload), opcode, request_id) + payload
+
+
+def encode_command_frame(request_id, command, args):
+    """Encode a command as a binary frame; commands without an opcode travel as text."""
+    if command in OPCODES:
+        payload = ARGUMENT_SEPARATOR.join(arg.encode() for arg in args)
+        return encode_frame(OPCODES[command], request_id, payload)
+    return encode_frame(OP_TEXT, request_id, " ".join([command, *args]).encode())
+
+
+def encode_command_line(request_id, command, args):
+    if any("\n" in arg or "\r" in arg for arg in args):
+        raise ValueError("Arguments cannot contain line breaks in the text protocol")
+    if len(args) > 1 and any(SWAP_SEPARATOR in arg for arg in args):
+        raise ValueError(f"Arguments cannot contain '{SWAP_SEPARATOR}' in the text protocol")
+    line = f"#{request_id} {command}"
+    if args:
+        line += " " + SWAP_SEPARATOR.join(args)
+    return (line + "\n").encode()
+
+
+def split_arguments(command, argument):
+    """Split the argument part of a text command the way bizhawk_server.lua does."""
+    if not argument:
+        return []
+    if command == "swap":
+        return argument.split(SWAP_SEPARATOR)
+    return [argument]
+
+
+def parse_event_line(line):
+    """Parse a '!<name> <arg>|<arg>' event line into (name, args), or return None."""
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    name, _, argument = line[len(EVENT_PREFIX):].partition(" ")
+    return name, argument.split(SWAP_SEPARATOR) if argument else []
+
+
+def parse_event_frame(payload):
+    name, *args = payload.decode(errors='replace').split("\0")
+    return name, args
+
+
+def parse_reply_frame(opcode, request_id, payload):
+    """Turn a reply frame into the same tuple parse_reply returns, or None for other frames."""
+    if opcode != OP_REPLY or len(payload) < REPLY_HEADER.size:
+        return None
+    status, elapsed_ms = REPLY_HEADER.unpack_from(payload)
+    message = payload[REPLY_HEADER.size:].decode(errors='replace')
+    return request_id, "ok" if status == 0 else "error", elapsed_ms, message
+
+
+class AsyncEmulatorClient:
+    """asyncio client for bizhawk_server.lua.
+
+    Replies are matched to requests by id, so any number of requests can be in
+    flight at once; a reply that arrives after its request timed out is dropped.
+    The connection is opened lazily and re-opened after failures, waiting between
+    attempts with an exponential backoff capped at ``max_backoff`` seconds. The
+    heartbeat task pings the server when the link has been idle, so a dead peer is
+    noticed before the next swap rather than in the middle of it.
+
+    Each connection asks the server for binary framing and falls back to the text
+    protocol when the server does not support it. Events the server pushes on its
+    own ("frames", "romloaded", "stateloaded") go to the handlers registered with
+    ``add_event_handler``, which are called on the client loop as
+    ``handler(name, args)``.
+    """
+
+    def __init__(self, host=HOST, port=PORT, connect_timeout=3.0, send_timeout=5.0,
+                 heartbeat_interval=5.0, heartbeat_timeout=3.0, initial_backoff=0.5, max_backoff=10.0,
+                 prefer_binary=True):
+        self.host = host
+        self.port = port
+        self.prefer_binary = prefer_binary
+        self.binary = False
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._heartbeat_task = None
+        self._connect_lock = None
+        self._pending = {}
+        self._event_handlers = []
+        self._request_ids = itertools.count(1)
+        self._backoff = initial_backoff
+        self._next_attempt = 0.0
+        self._last_activity = time.monotonic()
+
+        # Metrics
+        self.ever_connected = False
+        self.reconnect_count = 0
+        self.failed_attempts = 0
+        self.disconnected_since = time.monotonic()
+        self.total_disconnected_time = 0.0
+        self.last_heartbeat_ms = None
+
+    def is_connected(self):
+        return self._writer is not None
+
+    async def connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None:
+                return
+            now = time.monotonic()
+            if now < self._next_attempt:
+                raise ConnectionError(f"Emulator unreachable, next attempt in {self._next_attempt - now:.1f} seconds")
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.failed_attempts += 1
+                self._next_attempt = now + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+                if isinstance(e, OSError):
+                    raise
+                raise ConnectionError(f"Connecting to the emulator timed out after {self.connect_timeout} seconds")
+            sock = writer.get_extra_info('socket')
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                self.binary = await self._negotiate(reader, writer)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                self.failed_attempts += 1
+                raise ConnectionError(f"Emulator dropped the connection during setup: {e}")
+            self._reader, self._writer = reader, writer
+            self._reader_task = asyncio.ensure_future(self._read_loop(reader, self.binary))
+            self._backoff = self.initial_backoff
+            self._last_activity = time.monotonic()
+            if self.ever_connected and self.disconnected_since is not None:
+                self.total_disconnected_time += self._last_activity - self.disconnected_since
+            self.disconnected_since = None
+            if self.ever_connected:
+                self.reconnect_count += 1
+                logging.info("Reconnected to emulator (reconnect #%d)", self.reconnect_count)
+            else:
+                logging.info("Connected to emulator at %s:%d", self.host, self.port)
+            self.ever_connected = True
+
+    async def _negotiate(self, reader, writer):
+        """Ask the server for binary framing; returns False if it only speaks text."""
+        if not self.prefer_binary:
+            return False
+        request_id = next(self._request_ids)
+        writer.write(f"#{request_id} binary {PROTOCOL_VERSION}\n".encode())
+        await asyncio.wait_for(writer.drain(), self.send_timeout)
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.connect_timeout)
+        except asyncio.TimeoutError:
+            # Servers older than request tags never reply, so don't ask them again
+            self.prefer_binary = False
+            return False
+        if not line:
+            raise asyncio.IncompleteReadError(line, None)
+        reply = parse_reply(line.decode(errors='replace').rstrip("\r\n"))
+        if reply and reply[0] == request_id and reply[1] == "ok":
+            logging.debug("Using binary framing, protocol version %d", PROTOCOL_VERSION)
+            return True
+        logging.info("Emulator does not support binary framing, using the text protocol")
+        return False
+
+    def _drop_connection(self, error):
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._reader = self._writer = None
+        self.disconnected_since = time.monotonic()
+        # Nothing will answer the requests sent on this connection any more
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._drop_connection(ConnectionError("Connection closed"))
+
+    def add_event_handler(self, handler):
+        self._event_handlers.append(handler)
+
+    def remove_event_handler(self, handler):
+        if handler in self._event_handlers:
+            self._event_handlers.remove(handler)
+
+    def _dispatch_event(self, name, args):
+        for handler in list(self._event_handlers):
+            try:
+                handler(name, args)
+            except Exception as e:
+                logging.error(f"Error handling emulator event {name}: {e}")
+
+    async def _read_loop(self, reader, binary):
+        try:
+            while True:
+                if binary:
+                    reply = await self._read_frame(reader)
+                else:
+                    line = await reader.readline()
+                    if not line:
+                        raise ConnectionError("Emulator closed the connection")
+                    text = line.decode(errors='replace').rstrip("\r\n")
+                    if event := parse_event_line(text):
+                        self._last_activity = time.monotonic()
+                        self._dispatch_event(*event)
+                        continue
+                    reply = parse_reply(text)
+                self._last_activity = time.monotonic()
+                if not reply:
+                    continue
+                future = self._pending.pop(reply[0], None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.IncompleteReadError:
+            if self._reader is reader:
+                self._drop_connection(ConnectionError("Emulator closed the connection"))
+        except (OSError, ConnectionError) as e:
+            if self._reader is reader:
+                self._drop_connection(e if isinstance(e, ConnectionError) else ConnectionError(str(e)))
+
+    async def _read_frame(self, reader):
+        length, opcode, request_id = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+        if length > MAX_FRAME_BYTES:
+            raise ConnectionError(f"Emulator sent an oversized frame ({length} bytes)")
+        payload = await reader.readexactly(length)
+        if opcode == OP_EVENT:
+            self._dispatch_event(*parse_event_frame(payload))
+            return None
+        return parse_reply_frame(opcode, request_id, payload)
+
+    async def send_line(self, line):
+        """Send an untagged command; the server runs it without replying."""
+        await self.connect()
+        if self.binary:
+            await self._write(encode_frame(OP_TEXT, 0, line.encode()))
+        else:
+            await self._write((line + "\n").encode())  # Append newline to command
+
+    async def _write(self, data):
+        try:
+            self._writer.write(data)
+            await asyncio.wait_for(self._writer.drain(), self.send_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self._drop_connection(ConnectionError(str(e) or "Send timed out"))
+            raise ConnectionError(f"Could not send to the emulator: {e}")
+        self._last_activity = time.monotonic()
+
+    async def _send_requests(self, requests):
+        """Write (request_id, command, args) triples in one go, framed for the current connection."""
+        await self.connect()
+        encode = encode_command_frame if self.binary else encode_command_line
+        await self._write(b"".join(encode(request_id, command, args) for request_id, command, args in requests))
+
+    async def request(self, command, timeout=DEFAULT_TIMEOUT):
+        """Send a command tagged with a request id and wait for the emulator's reply.
+
+        With ``timeout=None`` this waits indefinitely. Otherwise a CommandTimeout is
+        raised if no reply arrives within ``timeout`` seconds.
+        """
+        name, _, argument = command.partition(" ")
+        return (await self.request_batch([(name, split_arguments(name, argument))], timeout))[0]
+
+    async def request_batch(self, commands, timeout=DEFAULT_TIMEOUT):
+        """Send several (command, args) pairs in a single write and wait for every reply.
+
+        The server runs them in order; ``timeout`` covers the whole batch. Returns
+        one CommandResult per command.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        requests = [(next(self._request_ids), command, list(args)) for command, args in commands]
+        deadline = None if timeout is None else loop.time() + timeout
+        results = []
+
+        def register():
+            futures = [loop.create_future() for _ in requests]
+            for (request_id, _, _), future in zip(requests, futures):
+                self._pending[request_id] = future
+            return futures
+
+        try:
+            futures = register()
+            was_connected = self.is_connected()
+            try:
+                await self._send_requests(requests)
+            except ConnectionError:
+                if not was_connected:
+                    raise
+                # The old socket was stale and the server never got the commands, so one retry is safe.
+                # Dropping it failed the first futures, so the retry needs fresh ones.
+                for future in futures:
+                    if future.done():
+                        future.exception()  # Nobody else will look at it
+                futures = register()
+                await self._send_requests(requests)
+            for (request_id, command, _), future in zip(requests, futures):
+                remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    _, status, elapsed_ms, message = await asyncio.wait_for(asyncio.shield(future), remaining)
+                except asyncio.TimeoutError:
+                    raise CommandTimeout(f"No reply to '{command}' within {timeout} seconds")
+                round_trip_ms = (time.perf_counter() - started) * 1000
+                if status != "ok":
+                    logging.warning("Emulator reported %s for request %d: %s", status, request_id, message)
+                results.append(CommandResult(request_id, status, elapsed_ms, round_trip_ms, message))
+        finally:
+            for request_id, _, _ in requests:
+                self._pending.pop(request_id, None)
+        return results
+
+    def start_heartbeat(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.ensure_future(self._heartbeat_loop())
+
+    def stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if self._pending:
+                continue  # Don't queue up behind a long-running command
+            if self.is_connected() and time.monotonic() - self._last_activity < self.heartbeat_interval:
+                continue  # Recent traffic already proves the peer is alive
+            try:
+                self.last_heartbeat_ms = (await self.request("ping", self.heartbeat_timeout)).round_trip_ms
+            except CommandTimeout as e:
+                logging.warning("Emulator missed a heartbeat, reconnecting: %s", e)
+                self._drop_connection(ConnectionError(str(e)))
+            except (OSError, ConnectionError) as e:
+                logging.debug("Emulator heartbeat failed: %s", e)
+
+    def get_metrics(self):
+        disconnected_time = self.total_disconnected_time
+        if self.disconnected_since is not None and self.ever_connected:
+            disconnected_time += time.monotonic() - self.disconnected_since
+        return {
+            'connected': self.is_connected(),
+            'reconnects': self.reconnect_count,
+            'failed_attempts': self.failed_attempts,
+            'disconnected_seconds': disconnected_time,
+            'last_heartbeat_ms': self.last_heartbeat_ms,
+            'in_flight': len(self._pending),
+        }
+
+    async def load_rom(self, rom_path, timeout=DEFAULT_TIMEOUT):
+        path = to_absolute_path(rom_path)
+        logging.info("Loading ROM from path: %s", path)
+        return await self.request(f"loadrom {path}", timeout)
+
+    async def save_state(self, state_path, timeout=DEFAULT_TIMEOUT):
+        path = to_absolute_path(state_path)
+        logging.info("Saving state to path: %s", path)
+        return await self.request(f"savestate {path}", timeout)
+
+    async def load_state(self, state_path, timeout=DEFAULT_TIMEOUT):
+        path = to_absolute_path(state_path)
+        logging.info("Loading state from path: %s", path)
+        return await self.request(f"loadstate {path}", timeout)
+
+    async def swap(self, save_path, rom_path, state_path, timeout=DEFAULT_TIMEOUT):
+        """Save the running game, load another ROM and its state in one emulator frame.
+
+        ``save_path`` may be None when no game is running yet. If the incoming game has
+        no state file yet the server creates one right after loading the ROM. An
+        "error" status means nothing was swapped and the outgoing ROM is still loaded.
+        """
+        paths = [to_absolute_path(path) if path else "" for path in (save_path, rom_path, state_path)]
+        logging.info("Swapping to ROM %s (save: %s, state: %s)", paths[1], paths[0] or "none", paths[2])
+        return (await self.request_batch([("swap", paths)], timeout))[0]
+
+    async def configure_state_pool(self, budget_mb, timeout=DEFAULT_TIMEOUT):
+        """Keep recently played states in emulator memory, up to ``budget_mb`` (0 disables)."""
+        logging.info("Setting in-memory savestate budget to %s MB", budget_mb)
+        return await self.request(f"statepool {budget_mb}", timeout)
+
+    async def flush_states(self, timeout=FLUSH_TIMEOUT):
+        """Write every in-memory savestate to its file. Can take several ROM loads."""
+        logging.info("Flushing in-memory savestates to disk")
+        return await self.request("flush", timeout)
+
+    async def forget_state(self, state_path, timeout=DEFAULT_TIMEOUT):
+        """Discard the emulator's in-memory copy of a state, so the file is used on the next swap-in."""
+        path = to_absolute_path(state_path)
+        logging.info("Dropping in-memory savestate: %s", path)
+        return await self.request(f"forget {path}", timeout)
+
+    async def get_status(self, timeout=DEFAULT_TIMEOUT):
+        """Return the server's counters, e.g. {'queued': 0, 'dropped': 0}."""
+        result = await self.request("status", timeout)
+        status = {}
+        for field in result.message.split():
+            key, _, value = field.partition("=")
+            status[key] = int(value) if value.isdigit() else value
+        return status
+
+    async def ping(self, timeout=DEFAULT_TIMEOUT):
+        return await self.request("ping", timeout)
+
+
+class EmulatorConnection:
+    """Synchronous facade over AsyncEmulatorClient.
+
+    The client runs on a private event loop in a daemon thread, so callers on any
+    thread (including the Qt GUI thread) can either block on a result or use
+    ``submit`` to get a concurrent.futures.Future and carry on.
+    """
+
+    def __init__(self, **client_options):
+        self.client = AsyncEmulatorClient(**client_options)
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _get_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="EmulatorClientLoop", daemon=True).start()
+            return self._loop
+
+    def submit(self, coroutine):
+        """Schedule a coroutine of ``self.client`` and return a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop())
+
+    def call_soon(self, callback, *args):
+        self._get_loop().call_soon_threadsafe(callback, *args)
+
+    def run(self, coroutine):
+        return self.submit(coroutine).result()
+
+    def request(self, command, timeout=DEFAULT_TIMEOUT):
+        return self.run(self.client.request(command, timeout))
+
+    def request_batch(self, commands, timeout=DEFAULT_TIMEOUT):
+        return self.run(self.client.request_batch(commands, timeout))
+
+    def send_line(self, line):
+        self.run(self.client.send_line(line))
+
+    def is_connected(self):
+        return self.client.is_connected()
+
+    def close(self):
+        self.run(self.client.close())
+
+    def start_heartbeat(self):
+        self.call_soon(self.client.start_heartbeat)
+
+    def stop_heartbeat(self):
+        self.call_soon(self.client.stop_heartbeat)
+
+    def get_metrics(self):
+        return self.client.get_metrics()
+
+
+connection = EmulatorConnection()
 
 def send_command(command):
-    
-    global sock
-    if sock is None or sock.fileno() == -1:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect(("127.0.0.1", 65432))  # Ensure IP and port match Lua script
-    sock.sendall((command + "\n").encode())  # Append newline to command
+    """Send a command without waiting for the emulator to acknowledge it."""
+    connection.send_line(command)
+
+def send_request(command, timeout=DEFAULT_TIMEOUT):
+    return connection.request(command, timeout)
+
+def send_batch(commands, timeout=DEFAULT_TIMEOUT):
+    """Send (command, args) pairs in one write; returns a CommandResult for each."""
+    return connection.request_batch(commands, timeout)
 
 def to_absolute_path(relative_path):
     return os.path.abspath(relative_path)
 
-def load_rom(rom_path):
-    path = to_absolute_path(rom_path)
-    logging.info("Loading ROM from path: %s", path)
-    send_command(f"loadrom {path}")
-    
-def save_state(state_path):
-    path = to_absolute_path(state_path)
-    logging.info("Saving state to path: %s", path)
-    send_command(f"savestate {path}")
+def load_rom(rom_path, timeout=DEFAULT_TIMEOUT):
+    return connection.run(connection.client.load_rom(rom_path, timeout))
+
+def save_state(state_path, timeout=DEFAULT_TIMEOUT):
+    return connection.run(connection.client.save_state(state_path, timeout))
+
+def load_state(state_path, timeout=DEFAULT_TIMEOUT):
+    return connection.run(connection.client.load_state(state_path, timeout))
+
+def swap(save_path, rom_path, state_path, timeout=DEFAULT_TIMEOUT):
+    return connection.run(connection.client.swap(save_path, rom_path, state_path, timeout))
 
-def load_state(state_path):
-    path = to_absolute_path(state_path)
-    logging.info("Loading state from path: %s", path)
-    send_command(f"loadstate {path}")   
+def configure_state_pool(budget_mb, timeout=DEFAULT_TIMEOUT):
+    return connection.run(connection.client.configure_state_pool(budget_mb, timeout))
 
+def flush_states(timeout=FLUSH_TIMEOUT):
+    return connection.run(connection.client.flush_states(timeout))
 
+def forget_state(state_path, timeout=DEFAULT_TIMEOUT):
+    return connection.run(connection.client.forget_state(state_path, timeout))
 
+def get_status(timeout=DEFAULT_TIMEOUT):
+    return connection.run(connection.client.get_status(timeout))
 
+def ping(timeout=DEFAULT_TIMEOUT):
+    return connection.run(connection.client.ping(timeout))
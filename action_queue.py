@@ -0,0 +1,209 @@
+import time, logging, threading
+from collections import deque, Counter
+
+FORCE_SWAP = 'force_swap'
+PAUSE = 'pause'
+TOGGLE_COMPLETION = 'toggle_completion'
+
+
+class ActionQueue:
+    """Buffers force swaps, pauses and completion toggles in front of the shuffle engine.
+
+    Triggers (Twitch redemptions, hotkeys) may ``submit_*`` from any thread;
+    the owner calls ``process()`` on its own thread, right after submitting and
+    again once ``next_wakeup()`` seconds have passed. Bursts are collapsed:
+
+    - a force swap within ``swap_cooldown`` seconds of the last one joins it,
+      and at most ``max_queued_swaps`` more wait for the cooldown to end;
+    - overlapping pauses merge into one pause lasting until the latest end;
+    - a completion toggle within ``debounce`` seconds of the previous one is
+      ignored, as key repeat would otherwise flip it back.
+
+    Each callback returns False when its action cannot be applied yet (say, a
+    swap is already in flight); it is retried until ``stale_after`` seconds
+    have passed and then dropped.
+    """
+
+    RETRY_INTERVAL = 0.5
+
+    def __init__(self, force_swap, pause, resume, toggle_completion=None, clock=time.monotonic,
+                 swap_cooldown=5.0, max_queued_swaps=0, stale_after=30.0, debounce=0.5):
+        self.force_swap = force_swap
+        self.pause = pause
+        self.resume = resume
+        self.toggle_completion = toggle_completion
+        self.clock = clock
+        self.swap_cooldown = swap_cooldown
+        self.max_queued_swaps = max(0, max_queued_swaps)
+        self.stale_after = stale_after
+        self.debounce = debounce
+
+        self._lock = threading.Lock()
+        self._swaps = deque()  # Submission times of swaps waiting to run
+        self._toggles = deque()
+        self._last_toggle = None
+        self._last_swap = None
+        self._pause_requested = None  # Submission time of a pause not applied yet
+        self._pause_until = None
+        self._pause_applied = False
+        self._retry_at = None
+
+        self.submitted = Counter()
+        self.coalesced = Counter()
+        self.dropped = Counter()
+        self.executed = Counter()
+        self.max_depth = 0
+
+    def _in_cooldown(self, now):
+        return self._last_swap is not None and now - self._last_swap < self.swap_cooldown
+
+    def _note_depth(self):
+        self.max_depth = max(self.max_depth, self._depth())
+
+    def _depth(self):
+        return len(self._swaps) + len(self._toggles) + (self._pause_requested is not None)
+
+    def depth(self):
+        with self._lock:
+            return self._depth()
+
+    def submit_force_swap(self):
+        with self._lock:
+            now = self.clock()
+            self.submitted[FORCE_SWAP] += 1
+            capacity = self.max_queued_swaps + (0 if self._in_cooldown(now) else 1)
+            if len(self._swaps) >= capacity:
+                self.coalesced[FORCE_SWAP] += 1
+                return False
+            self._swaps.append(now)
+            self._note_depth()
+            return True
+
+    def submit_pause(self, seconds):
+        with self._lock:
+            now = self.clock()
+            self.submitted[PAUSE] += 1
+            until = now + seconds
+            if self._pause_until is not None:
+                self.coalesced[PAUSE] += 1
+                self._pause_until = max(self._pause_until, until)
+                return False
+            self._pause_until = until
+            self._pause_requested = now
+            self._note_depth()
+            return True
+
+    def submit_toggle_completion(self):
+        with self._lock:
+            now = self.clock()
+            self.submitted[TOGGLE_COMPLETION] += 1
+            if self._last_toggle is not None and now - self._last_toggle < self.debounce:
+                self.coalesced[TOGGLE_COMPLETION] += 1
+                return False
+            self._last_toggle = now
+            self._toggles.append(now)
+            self._note_depth()
+            return True
+
+    def clear(self):
+        """Drop everything pending, e.g. when the shuffle stops."""
+        with self._lock:
+            self.dropped[FORCE_SWAP] += len(self._swaps)
+            self.dropped[TOGGLE_COMPLETION] += len(self._toggles)
+            self.dropped[PAUSE] += self._pause_requested is not None
+            self._swaps.clear()
+            self._toggles.clear()
+            self._pause_requested = self._pause_until = None
+            self._pause_applied = False
+
+    def _drop_stale(self, kind, pending, now):
+        while pending and now - pending[0] > self.stale_after:
+            pending.popleft()
+            self.dropped[kind] += 1
+            logging.info("Dropped a stale %s action", kind)
+
+    def _run(self, kind, callback, count=True):
+        """Run a callback outside the lock: True when applied, False to retry, None when it failed."""
+        try:
+            applied = callback() is not False
+        except Exception as e:
+            logging.error(f"Error running queued {kind} action: {e}")
+            self.dropped[kind] += count
+            return None
+        if applied:
+            self.executed[kind] += count
+        return applied
+
+    def process(self):
+        """Apply whatever is due. Callbacks run on the calling thread."""
+        now = self.clock()
+        self._retry_at = None
+        with self._lock:
+            self._drop_stale(FORCE_SWAP, self._swaps, now)
+            self._drop_stale(TOGGLE_COMPLETION, self._toggles, now)
+            toggles = len(self._toggles)
+            self._toggles.clear()
+            if self._pause_requested is not None and now - self._pause_requested > self.stale_after:
+                self.dropped[PAUSE] += 1
+                self._pause_requested = self._pause_until = None
+            apply_pause = self._pause_requested is not None
+            end_pause = self._pause_applied and now >= self._pause_until
+            swap_due = bool(self._swaps) and not self._in_cooldown(now)
+
+        for _ in range(toggles):
+            if self.toggle_completion:
+                self._run(TOGGLE_COMPLETION, self.toggle_completion)
+
+        if apply_pause:
+            applied = self._run(PAUSE, self.pause)
+            with self._lock:
+                if applied:
+                    self._pause_requested, self._pause_applied = None, True
+                elif applied is None:
+                    self._pause_requested = self._pause_until = None
+                else:
+                    self._retry_at = now + self.RETRY_INTERVAL
+        elif end_pause:
+            with self._lock:
+                self._pause_until, self._pause_applied = None, False
+            self._run(PAUSE, self.resume, count=False)  # Ends the pause already counted
+
+        if swap_due:
+            applied = self._run(FORCE_SWAP, self.force_swap)
+            with self._lock:
+                if applied is None or applied:
+                    if self._swaps:
+                        self._swaps.popleft()
+                    if applied:
+                        self._last_swap = now
+                else:
+                    self._retry_at = now + self.RETRY_INTERVAL
+
+    def next_wakeup(self):
+        """Seconds until ``process()`` has something to do, or None when idle."""
+        with self._lock:
+            now = self.clock()
+            due = self._retry_at if self._retry_at is not None else now
+            times = []
+            if self._swaps:
+                times.append(max(due, self._last_swap + self.swap_cooldown) if self._in_cooldown(now) else due)
+            if self._pause_requested is not None:
+                times.append(due)
+            if self._pause_applied and self._pause_until is not None:
+                times.append(self._pause_until)
+            if self._toggles:
+                times.append(now)
+            if not times:
+                return None
+            return max(0.0, min(times) - now)
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                'depth': self._depth(),
+                'max_depth': self.max_depth,
+                'submitted': dict(self.submitted),
+                'coalesced': dict(self.coalesced),
+                'dropped': dict(self.dropped),
+                'executed': dict(self.executed),
+            }
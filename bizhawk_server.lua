@@ -11,53 +11,385 @@ end
 bizhawkSocket:settimeout(0)  -- Non-blocking accept
 local connectionSocket = nil
 
+-- In-memory savestate pool, enabled by the "statepool <budget_mb>" command.
+-- Entries are keyed by state path: {id, romPath, bytes, lastUsed, dirty}.
+-- A dirty entry holds progress that is not in its .state file yet.
+local statePool = {}
+local statePoolBudget = 0
+local statePoolBytes = 0
+local statePoolClock = 0
+local currentRomPath = nil
+local currentStatePath = nil
+local flushCountdown = nil
+-- Dirty entries evicted from the pool, written to disk one per idle frame outside any swap.
+-- pendingSpills is keyed by state path; spillQueue holds the paths in eviction order.
+local pendingSpills = {}
+local spillQueue = {}
+
+-- Commands received but not yet run, as a FIFO indexed from queueHead to queueTail - 1.
+-- Entries are {requestId, command, args, binary}; requestId is nil when no reply is wanted.
+local commandQueue = {}
+local queueHead = 1
+local queueTail = 1
+local droppedCommands = 0
+local partialLine = nil
+
+-- Binary framing, switched on per connection by the "binary <version>" command.
+-- A frame is a header packed as ">I4 B I4" (payload length, opcode, request id)
+-- followed by the payload; arguments in a payload are separated by NUL bytes.
+local binaryMode = false
+local frameBuffer = ""
+
+-- Frames emulated since the last "frames" event, and the running system's nominal frame rate
+local framesSinceEvent = 0
+local lastEventTime = socket.gettime()
+local frameRate = 60
+
+MAX_QUEUED_COMMANDS = 64
+FRAME_BUDGET_MS = 8  -- Time per frame spent running queued commands
+
+PROTOCOL_VERSION = 1
+FRAME_HEADER = ">I4 B I4"
+FRAME_HEADER_BYTES = 9
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+RECEIVE_CHUNK_BYTES = 65536
+OP_TEXT = 0  -- Payload is a text command line
+OP_REPLY = 128
+OP_EVENT = 129  -- Pushed by the server with request id 0
+OPCODE_COMMANDS = {"loadrom", "savestate", "loadstate", "swap", "statepool", "flush", "status", "ping", "forget"}
+
+EVENT_INTERVAL_FRAMES = 60  -- How often to report emulated frames
+-- Nominal NTSC frame rates; PAL systems run at 50
+SYSTEM_FRAME_RATES = {
+    NES = 60.0988, SNES = 60.0988, GB = 59.7275, GBC = 59.7275, SGB = 59.7275, GBA = 59.7275,
+    NDS = 59.8261, N64 = 60.0, PSX = 59.94, SAT = 59.94, GEN = 59.92, SMS = 59.92, GG = 59.92,
+    SG = 59.92, PCE = 59.82, PCECD = 59.82, SGX = 59.82, A26 = 59.92, A78 = 59.92, VB = 50.27,
+    WSWAN = 75.47, Lynx = 75.0, NGP = 60.25,
+}
+
+DEFAULT_STATE_BYTES = 16 * 1024 * 1024  -- Size estimate for states never written to disk
+FLUSH_DELAY_FRAMES = 300  -- Frames to wait after a swap before writing the running game's state
+
 function acceptConnection()
-    if not connectionSocket then
-        connectionSocket = bizhawkSocket:accept()
+    -- Poll even while connected: a new connection means the client gave up on the old one
+    local newSocket = bizhawkSocket:accept()
+    if newSocket then
         if connectionSocket then
+            print("Client reconnected, dropping stale connection")
+            connectionSocket:close()
+            clearCommandQueue()
+        else
             print("Client connected")
-            connectionSocket:settimeout(0)  -- Non-blocking receive
         end
+        connectionSocket = newSocket
+        connectionSocket:settimeout(0)  -- Non-blocking receive
+        resetFraming()
+    end
+end
+
+function dropConnection()
+    connectionSocket:close()
+    connectionSocket = nil
+    resetFraming()
+    clearCommandQueue()
+end
+
+function clearCommandQueue()
+    -- Queued commands belong to the connection that sent them; running them later would send
+    -- the next client replies tagged with ids it never issued
+    if queueTail > queueHead then
+        print("Discarding commands from the old connection:", queueTail - queueHead)
+    end
+    commandQueue = {}
+    queueHead = 1
+    queueTail = 1
+end
+
+function resetFraming()
+    partialLine = nil
+    binaryMode = false
+    frameBuffer = ""
+end
+
+function parseCommandLine(line)
+    -- Tagged commands look like "#<id> <command> <args>" and get a reply line
+    local requestId, body = line:match("^#(%d+) (.+)$")
+    if not requestId then
+        body = line
+    end
+    local command, argument = body:match("^(%S+) ?(.*)$")
+    local args = {}
+    if command == "swap" then
+        -- "<save_path>|<rom_path>|<state_path>"; save_path is empty on the first swap
+        local savePath, romPath, statePath = argument:match("^([^|]*)|([^|]+)|([^|]+)$")
+        if romPath then
+            args = {savePath, romPath, statePath}
+        end
+    elseif argument and argument ~= "" then
+        args = {argument}
     end
+    return {requestId = tonumber(requestId), command = command, args = args, binary = false}
 end
 
-function handleCommand(fullCommand)
-    local command, path = fullCommand:match("^(%S+) (.+)$")
+function parseFrame(opcode, requestId, payload)
+    local entry
+    if opcode == OP_TEXT then
+        entry = parseCommandLine(payload)
+    else
+        local args = {}
+        if payload ~= "" then
+            for arg in (payload .. "\0"):gmatch("([^\0]*)\0") do
+                table.insert(args, arg)
+            end
+        end
+        entry = {command = OPCODE_COMMANDS[opcode] or ("opcode " .. opcode), args = args}
+    end
+    -- Request id 0 asks for no reply
+    entry.requestId = requestId ~= 0 and requestId or nil
+    entry.binary = true
+    return entry
+end
+
+function handleCommand(entry)
+    local command, args = entry.command, entry.args
+    local startTime = socket.gettime()
+    local ok, message
     if command == "loadrom" then
-        loadROM(path)
+        ok, message = loadROM(args[1])
     elseif command == "savestate" then
-        saveState(path)
+        ok, message = saveState(args[1])
     elseif command == "loadstate" then
-        loadState(path)
+        ok, message = loadState(args[1])
+    elseif command == "swap" then
+        ok, message = swapGame(args[1], args[2], args[3])
+    elseif command == "statepool" then
+        ok, message = configureStatePool(tonumber(args[1] or ""))
+    elseif command == "flush" then
+        ok, message = flushStatePool()
+    elseif command == "forget" then
+        ok, message = forgetState(args[1])
+    elseif command == "status" then
+        ok, message = serverStatus()
+    elseif command == "ping" then
+        ok = true
+    else
+        ok, message = false, "unknown command " .. tostring(command)
     end
     -- other commands...
+
+    if entry.requestId then
+        local elapsedMs = (socket.gettime() - startTime) * 1000
+        sendReply(entry, ok, elapsedMs, message)
+    end
 end
 
-function receiveCommand()
-    if connectionSocket then
-        local command, err = connectionSocket:receive('*l')  -- Receive one line
-        if command then
-            print("Received command:", command)
-            return command
-        elseif err and err ~= "timeout" and err ~= "closed" then
-            print("Error receiving command:", err)
-            connectionSocket:close()
-            connectionSocket = nil
-            -- Reattempt connection
-            connectionSocket = bizhawkSocket:accept()
+function sendReply(entry, ok, elapsedMs, message)
+    if not connectionSocket then
+        return
+    end
+    local reply
+    if entry.binary then
+        -- Reply payload: status byte (0 ok, 1 error), elapsed ms as a double, then the message
+        local payload = string.pack(">B d", ok and 0 or 1, elapsedMs) .. (message and tostring(message) or "")
+        reply = string.pack(FRAME_HEADER, #payload, OP_REPLY, entry.requestId) .. payload
+    else
+        reply = string.format("#%d %s %.3f", entry.requestId, ok and "ok" or "error", elapsedMs)
+        if message then
+            reply = reply .. " " .. (tostring(message):gsub("[\r\n]", " "))
+        end
+        reply = reply .. "\n"
+    end
+    local sent, err = connectionSocket:send(reply)
+    if not sent then
+        print("Error sending reply:", err)
+    end
+end
+
+function sendEvent(name, ...)
+    -- Events are lines starting with "!" ("!<name> <arg>|<arg>") or OP_EVENT frames with NUL-separated fields
+    if not connectionSocket then
+        return
+    end
+    local message
+    if binaryMode then
+        local payload = table.concat({name, ...}, "\0")
+        message = string.pack(FRAME_HEADER, #payload, OP_EVENT, 0) .. payload
+    else
+        message = "!" .. name .. " " .. (table.concat({...}, "|"):gsub("[\r\n]", " ")) .. "\n"
+    end
+    local sent, err = connectionSocket:send(message)
+    if not sent then
+        print("Error sending event:", err)
+    end
+end
+
+function countFrame()
+    framesSinceEvent = framesSinceEvent + 1
+    if framesSinceEvent >= EVENT_INTERVAL_FRAMES then
+        emitFrameEvent()
+    end
+end
+
+function emitFrameEvent()
+    -- "frames <count>|<nominal fps>|<measured fps>": the client turns frames into play time
+    if framesSinceEvent == 0 then
+        return
+    end
+    local now = socket.gettime()
+    local measured = framesSinceEvent / math.max(now - lastEventTime, 0.001)
+    sendEvent("frames", tostring(framesSinceEvent), string.format("%.4f", frameRate), string.format("%.2f", measured))
+    framesSinceEvent = 0
+    lastEventTime = now
+end
+
+function nominalFrameRate()
+    local ok, displayType = pcall(emu.getdisplaytype)
+    if ok and displayType == "PAL" then
+        return 50
+    end
+    local found, systemId = pcall(emu.getsystemid)
+    return found and SYSTEM_FRAME_RATES[systemId] or 60
+end
+
+function negotiateFraming(line)
+    -- "#<id> binary <version>" switches this connection to binary frames after the reply
+    local requestId, version = line:match("^#(%d+) binary (%d+)$")
+    if not requestId then
+        return false
+    end
+    local entry = {requestId = tonumber(requestId), binary = false}
+    if tonumber(version) ~= PROTOCOL_VERSION or not string.pack then
+        sendReply(entry, false, 0, "unsupported protocol version " .. version)
+    else
+        sendReply(entry, true, 0)
+        binaryMode = true
+        print("Client switched to binary framing")
+    end
+    return true
+end
+
+function receiveCommands()
+    -- Read every complete line or frame waiting on the socket into the command queue
+    while connectionSocket and not binaryMode do
+        local line, err, partial = connectionSocket:receive('*l', partialLine)
+        if line then
+            partialLine = nil
+            print("Received command:", line)
+            if not negotiateFraming(line) then
+                enqueueCommand(parseCommandLine(line))
+            end
+        else
+            partialLine = partial ~= "" and partial or nil
+            handleReceiveError(err)
+            return
+        end
+    end
+    if connectionSocket and binaryMode then
+        receiveFrames()
+    end
+end
+
+function receiveFrames()
+    while connectionSocket do
+        local data, err, partial = connectionSocket:receive(RECEIVE_CHUNK_BYTES)
+        local chunk = data or partial
+        if chunk and chunk ~= "" then
+            frameBuffer = frameBuffer .. chunk
+        end
+        if not data then
+            handleReceiveError(err)
+            break
+        end
+    end
+
+    local position = 1
+    while #frameBuffer - position + 1 >= FRAME_HEADER_BYTES do
+        local length, opcode, requestId = string.unpack(FRAME_HEADER, frameBuffer, position)
+        if length > MAX_FRAME_BYTES then
+            print("Frame too large, dropping connection:", length)
             if connectionSocket then
-                connectionSocket:settimeout(0)  -- Non-blocking receive
-                print("Client reconnected")
+                dropConnection()
             end
+            return
+        end
+        local frameEnd = position + FRAME_HEADER_BYTES + length - 1
+        if frameEnd > #frameBuffer then
+            break
+        end
+        local entry = parseFrame(opcode, requestId, frameBuffer:sub(position + FRAME_HEADER_BYTES, frameEnd))
+        print("Received command:", entry.command)
+        enqueueCommand(entry)
+        position = frameEnd + 1
+    end
+    frameBuffer = frameBuffer:sub(position)
+end
+
+function handleReceiveError(err)
+    if err == "closed" then
+        print("Client disconnected")
+        dropConnection()
+    elseif err and err ~= "timeout" then
+        print("Error receiving command:", err)
+        dropConnection()
+    end
+end
+
+function enqueueCommand(entry)
+    if queueTail - queueHead >= MAX_QUEUED_COMMANDS then
+        droppedCommands = droppedCommands + 1
+        print("Command queue full, dropping:", entry.command)
+        if entry.requestId then
+            sendReply(entry, false, 0, "queue full")
         end
+        return
     end
-    return nil
+    commandQueue[queueTail] = entry
+    queueTail = queueTail + 1
+end
+
+function queueDepth()
+    return queueTail - queueHead
 end
 
+function processCommands()
+    -- Run queued commands until the frame budget is spent; at least one always runs
+    local frameStart = socket.gettime()
+    while queueHead < queueTail do
+        local entry = commandQueue[queueHead]
+        commandQueue[queueHead] = nil
+        queueHead = queueHead + 1
+        handleCommand(entry)
+        if (socket.gettime() - frameStart) * 1000 >= FRAME_BUDGET_MS then
+            break
+        end
+    end
+end
+
+function serverStatus()
+    local spills = 0
+    for _ in pairs(pendingSpills) do
+        spills = spills + 1
+    end
+    return true, string.format("queued=%d dropped=%d spills=%d", queueDepth(), droppedCommands, spills)
+end
 
 function loadROM(romPath)
     print("Loading ROM:", romPath)
-    client.openrom(romPath)
+    -- Frames so far belong to the outgoing game
+    emitFrameEvent()
+    local success, result = pcall(function() return client.openrom(romPath) end)
+    lastEventTime = socket.gettime()
+    if not success then
+        print("Error loading ROM:", result)
+        return false, result
+    end
+    -- Older BizHawk versions return nothing from openrom
+    if result == false then
+        return false, "openrom failed"
+    end
+    frameRate = nominalFrameRate()
+    sendEvent("romloaded", romPath)
+    return true
 end
 
 function loadState(statePath)
@@ -66,11 +398,15 @@ function loadState(statePath)
         local success, err = pcall(function() savestate.load(statePath) end)
         if success then
             print("State loaded successfully:", statePath)
+            sendEvent("stateloaded", statePath)
+            return true
         else
             print("Error loading state:", err)
+            return false, err
         end
     else
         print("State file not found:", statePath)
+        return false, "state file not found"
     end
 end
 
@@ -78,9 +414,289 @@ function saveState(statePath)
     local success, err = pcall(function() savestate.save(statePath) end)
     if success then
         print("State saved successfully:", statePath)
+        return true
     else
         print("Error saving state:", err)
+        return false, err
+    end
+end
+
+function swapGame(savePath, romPath, statePath)
+    -- savePath is empty on the first swap
+    if not romPath or not statePath then
+        return false, "malformed swap arguments"
+    end
+
+    -- Abort before touching the ROM so a failed save never loses the outgoing game
+    if savePath ~= "" then
+        local saved, err
+        local bytes = fileSize(savePath) or DEFAULT_STATE_BYTES
+        local incoming = statePool[statePath]
+        if statePoolBudget > 0 and currentRomPath and bytes + (incoming and incoming.bytes or 0) <= statePoolBudget then
+            saved, err = poolStore(savePath, currentRomPath, bytes)
+            evictStatePool(statePath)
+        else
+            -- Too big for the pool next to the incoming game, write it out directly
+            poolRemove(savePath)
+            saved, err = saveState(savePath)
+        end
+        if not saved then
+            return false, "savestate: " .. tostring(err)
+        end
+    end
+
+    local loaded, err = loadROM(romPath)
+    if not loaded then
+        return false, "loadrom: " .. tostring(err)
+    end
+    currentRomPath = romPath
+    currentStatePath = statePath
+    flushCountdown = nil
+
+    -- The new ROM is running from here on, so the swap itself succeeded
+    if poolLoad(statePath) then
+        return true
+    end
+    if fileExists(statePath) then
+        local stateLoaded, stateErr = loadState(statePath)
+        if not stateLoaded then
+            return true, "loadstate: " .. tostring(stateErr)
+        end
+    elseif statePoolBudget > 0 then
+        flushCountdown = FLUSH_DELAY_FRAMES
+    else
+        saveState(statePath)
+    end
+    return true
+end
+
+function configureStatePool(budgetMb)
+    if not budgetMb or budgetMb < 0 then
+        return false, "invalid budget"
+    end
+    statePoolBudget = budgetMb * 1024 * 1024
+    if statePoolBudget == 0 then
+        -- Disabling the pool writes everything out before dropping it
+        local ok, err = flushStatePool()
+        for path in pairs(statePool) do
+            poolRemove(path)
+        end
+        return ok, err
+    end
+    if statePoolBytes > statePoolBudget then
+        withRunningGameParked(function() evictStatePool(currentStatePath) end)
+    end
+    return true
+end
+
+function forgetState(statePath)
+    -- Drop the in-memory copy without writing it, e.g. after its file was replaced
+    if not statePath then
+        return false, "missing state path"
+    end
+    poolRemove(statePath)
+    if statePath == currentStatePath then
+        flushCountdown = nil
+    end
+    return true
+end
+
+function fileSize(path)
+    local f = io.open(path, "rb")
+    if not f then
+        return nil
+    end
+    local size = f:seek("end")
+    f:close()
+    return size
+end
+
+function poolRemove(statePath)
+    local entry = statePool[statePath]
+    if entry then
+        pcall(function() memorysavestate.removestate(entry.id) end)
+        statePoolBytes = statePoolBytes - entry.bytes
+        statePool[statePath] = nil
+    end
+    -- A newer state (or a forget) supersedes an evicted one still waiting to be written
+    local pending = pendingSpills[statePath]
+    if pending then
+        pcall(function() memorysavestate.removestate(pending.id) end)
+        pendingSpills[statePath] = nil
+    end
+end
+
+function poolStore(statePath, romPath, bytes)
+    local success, id = pcall(function() return memorysavestate.savecorestate() end)
+    if not success or not id then
+        print("Error saving memory state:", id)
+        -- Fall back to the disk so the outgoing game is never lost
+        return saveState(statePath)
+    end
+    poolRemove(statePath)
+    statePoolClock = statePoolClock + 1
+    statePool[statePath] = {id = id, romPath = romPath, bytes = bytes, lastUsed = statePoolClock, dirty = true}
+    statePoolBytes = statePoolBytes + bytes
+    return true
+end
+
+function poolLoad(statePath)
+    local entry = statePool[statePath]
+    if not entry and pendingSpills[statePath] then
+        -- Evicted but not written yet, so its file is stale: take it back into the pool instead
+        entry = pendingSpills[statePath]
+        pendingSpills[statePath] = nil
+        statePool[statePath] = entry
+        statePoolBytes = statePoolBytes + entry.bytes
+    end
+    if not entry then
+        return false
+    end
+    local success, err = pcall(function() memorysavestate.loadcorestate(entry.id) end)
+    if not success then
+        print("Error loading memory state:", err)
+        if entry.dirty then
+            return false
+        end
+        poolRemove(statePath)
+        return false
+    end
+    statePoolClock = statePoolClock + 1
+    entry.lastUsed = statePoolClock
+    sendEvent("stateloaded", statePath)
+    if entry.dirty then
+        -- Written from the running game a little later, outside the swap frame
+        flushCountdown = FLUSH_DELAY_FRAMES
+    end
+    return true
+end
+
+function spillEntry(statePath, entry)
+    -- A state can only be written to disk while its own ROM is running
+    entry = entry or statePool[statePath]
+    if not loadROM(entry.romPath) then
+        return false, "loadrom failed for " .. entry.romPath
+    end
+    local success, err = pcall(function() memorysavestate.loadcorestate(entry.id) end)
+    if not success then
+        return false, err
+    end
+    local saved, saveErr = saveState(statePath)
+    if saved then
+        entry.dirty = false
+    end
+    return saved, saveErr
+end
+
+function evictStatePool(keepPath)
+    while statePoolBytes > statePoolBudget do
+        local victim, oldest = nil, nil
+        for path, entry in pairs(statePool) do
+            if path ~= keepPath and (not oldest or entry.lastUsed < oldest) then
+                victim, oldest = path, entry.lastUsed
+            end
+        end
+        if not victim then
+            return
+        end
+        local entry = statePool[victim]
+        if entry.dirty then
+            -- Writing it needs its ROM loaded, so leave that to processPendingSpill rather than the swap
+            statePool[victim] = nil
+            statePoolBytes = statePoolBytes - entry.bytes
+            pendingSpills[victim] = entry
+            table.insert(spillQueue, victim)
+        else
+            poolRemove(victim)
+        end
+    end
+end
+
+function processPendingSpill()
+    -- Write out at most one evicted state, on a frame with no commands waiting
+    if queueDepth() > 0 then
+        return
+    end
+    while #spillQueue > 0 do
+        local path = table.remove(spillQueue, 1)
+        local entry = pendingSpills[path]
+        if entry then
+            print("Writing evicted state to disk:", path)
+            withRunningGameParked(function()
+                local saved, err = spillEntry(path, entry)
+                if not saved then
+                    print("Error writing evicted state:", path, err)
+                end
+            end)
+            pendingSpills[path] = nil
+            pcall(function() memorysavestate.removestate(entry.id) end)
+            return
+        end
+    end
+end
+
+function processDeferredFlush()
+    if not flushCountdown then
+        return
+    end
+    flushCountdown = flushCountdown - 1
+    if flushCountdown > 0 then
+        return
+    end
+    flushCountdown = nil
+    if currentStatePath and saveState(currentStatePath) and statePool[currentStatePath] then
+        statePool[currentStatePath].dirty = false
+    end
+end
+
+function withRunningGameParked(fn)
+    -- Spilling switches ROMs, so keep the running game in memory and bring it back afterwards
+    if not currentRomPath then
+        fn()
+        return
+    end
+    local parked = memorysavestate.savecorestate()
+    fn()
+    loadROM(currentRomPath)
+    memorysavestate.loadcorestate(parked)
+    memorysavestate.removestate(parked)
+end
+
+function flushStatePool()
+    local dirtyPaths = {}
+    for path, entry in pairs(statePool) do
+        if entry.dirty and path ~= currentStatePath then
+            table.insert(dirtyPaths, path)
+        end
+    end
+    for path in pairs(pendingSpills) do
+        table.insert(dirtyPaths, path)
     end
+
+    local ok, message = true, nil
+    if #dirtyPaths > 0 then
+        withRunningGameParked(function()
+            for _, path in ipairs(dirtyPaths) do
+                local saved, err = spillEntry(path, statePool[path] or pendingSpills[path])
+                if not saved then
+                    ok, message = false, path .. ": " .. tostring(err)
+                end
+            end
+        end)
+    end
+    for path, entry in pairs(pendingSpills) do
+        pcall(function() memorysavestate.removestate(entry.id) end)
+    end
+    pendingSpills = {}
+    spillQueue = {}
+
+    if currentStatePath then
+        flushCountdown = nil
+        if saveState(currentStatePath) and statePool[currentStatePath] then
+            statePool[currentStatePath].dirty = false
+        end
+    end
+    return ok, message
 end
 
 function fileExists(name)
@@ -88,14 +704,21 @@ function fileExists(name)
     if f ~= nil then io.close(f) return true else return false end
 end
 
+event.onexit(function()
+    -- Memory states do not survive the emulator, so write them out on shutdown
+    local success, err = pcall(flushStatePool)
+    if not success then
+        print("Error flushing savestates on exit:", err)
+    end
+end)
+
 while true do
     acceptConnection()
 
-    -- Receive a command
-    local receivedCommand = receiveCommand()
-
-    if receivedCommand then
-        handleCommand(receivedCommand)
-    end
+    receiveCommands()
+    processCommands()
+    processDeferredFlush()
+    processPendingSpill()
     emu.frameadvance() -- Keep BizHawk responsive
+    countFrame()
 end
@@ -0,0 +1,195 @@
+"""Run and control Retro Roulette without the GUI.
+
+    python cli.py run "My Session"          # shuffle a session in the foreground
+    python cli.py status                     # ask the running daemon what it is doing
+    python cli.py pause --seconds 60         # also: start, stop, resume, force-swap, shutdown
+    python cli.py sessions | games NAME | stats NAME
+    python cli.py export NAME FILE | import FILE [--name NAME]          # session.json only
+    python cli.py export-archive NAME FILE | import-archive FILE [--name NAME]  # with savestates
+
+Nothing here imports Qt, and only ``run`` loads the shuffle machinery, so
+control commands return almost immediately.
+"""
+import argparse, json, logging, os, socket, sys
+
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 65433
+CONTROL_COMMANDS = ('start', 'stop', 'pause', 'resume', 'force-swap', 'status', 'shutdown')
+
+
+def send_control(command, host=DAEMON_HOST, port=DAEMON_PORT, timeout=15.0, **args):
+    """Send one command to a running daemon and return its reply."""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(json.dumps(dict(args, command=command)).encode() + b"\n")
+        with sock.makefile('rb') as reply:
+            line = reply.readline()
+    if not line:
+        raise ConnectionError("The daemon closed the connection without replying")
+    return json.loads(line)
+
+
+def format_time(seconds):
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def print_status(status):
+    state = "paused" if status['paused'] else "running" if status['running'] else "stopped"
+    print(f"Session: {status['session']} ({state}, {status['policy']} policy)")
+    print(f"Current game: {status['current_game'] or 'None'}")
+    if status['time_until_swap'] is not None:
+        print(f"Next swap in: {status['time_until_swap']:.0f} s")
+    print(f"Swaps: {status['total_swaps']}  Time: {format_time(status['total_time'])}")
+    print(f"Current game swaps: {status['current_game_swaps']}  Time: {format_time(status['current_game_time'])}")
+    actions = status['actions']
+    print(f"Action queue: depth {actions['depth']}, coalesced {sum(actions['coalesced'].values())}, "
+          f"dropped {sum(actions['dropped'].values())}")
+
+
+def load_config():
+    from config import ConfigManager
+    config_manager = ConfigManager()
+    return config_manager.load_config() if os.path.isfile(config_manager.config_file) else {}
+
+
+def open_sessions(sessions_dir):
+    """A SessionManager on the session backend config.json selects."""
+    from session_manager import SessionManager
+    return SessionManager(sessions_dir, backend=load_config().get('session_backend', 'json'))
+
+
+def load_session_or_exit(sessions, name):
+    session_data = sessions.get_session_info(name)
+    if session_data is None:
+        sys.exit(f"Session '{name}' not found in {sessions.directory}")
+    return session_data
+
+
+def run_archive_command(options, sessions):
+    from savestate_store import SavestateStore
+    from session_archive import export_session, import_session, ArchiveError
+
+    def progress(done, total):
+        print(f"\r{done * 100 // total if total else 100:3d}%", end='', file=sys.stderr, flush=True)
+    store = SavestateStore(load_config().get('savestate_store_dir', 'savestate_store'))
+    try:
+        if options.command == 'export-archive':
+            manifest = export_session(sessions, store, options.session, options.file, progress)
+            message = f"Exported '{options.session}' to {options.file} ({len(manifest['files'])} files)"
+        else:
+            message = f"Imported session '{import_session(sessions, store, options.file, options.name, progress)}'"
+    except (ArchiveError, OSError) as e:
+        print(file=sys.stderr)
+        sys.exit(str(e))
+    print(file=sys.stderr)
+    print(message)
+    return 0
+
+
+def run_daemon(options):
+    from daemon import ShuffleDaemon
+    logging.basicConfig(level=logging.DEBUG if options.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    daemon = ShuffleDaemon(options.session, sessions_dir=options.sessions_dir, host=options.host, port=options.port)
+    try:
+        daemon.run(start=not options.idle)
+    except KeyboardInterrupt:
+        pass
+    except FileNotFoundError as e:
+        sys.exit(str(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=DAEMON_HOST)
+    parser.add_argument('--port', type=int, default=DAEMON_PORT, help="Daemon control port")
+    parser.add_argument('--sessions-dir', default='sessions')
+    parser.add_argument('--json', action='store_true', help="Print replies as JSON")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Shuffle a session until interrupted or shut down")
+    run_parser.add_argument('session')
+    run_parser.add_argument('--idle', action='store_true', help="Wait for a 'start' command instead of starting")
+    run_parser.add_argument('--verbose', action='store_true')
+
+    for command in CONTROL_COMMANDS:
+        control_parser = commands.add_parser(command, help=f"Send '{command}' to the running daemon")
+        if command == 'pause':
+            control_parser.add_argument('--seconds', type=float, help="Resume automatically after this long")
+
+    commands.add_parser('sessions', help="List sessions")
+    commands.add_parser('games', help="List the games of a session").add_argument('session')
+    commands.add_parser('stats', help="Show the saved stats of a session").add_argument('session')
+    export_parser = commands.add_parser('export', help="Write a session out as a session.json file")
+    export_parser.add_argument('session')
+    export_parser.add_argument('file')
+    import_parser = commands.add_parser('import', help="Add a session from a session.json file")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--name', help="Session name (default: the name in the file)")
+    export_archive_parser = commands.add_parser('export-archive', help="Write a session with its savestates into one archive")
+    export_archive_parser.add_argument('session')
+    export_archive_parser.add_argument('file')
+    import_archive_parser = commands.add_parser('import-archive', help="Add a session from an archive")
+    import_archive_parser.add_argument('file')
+    import_archive_parser.add_argument('--name', help="Session name (default: the name in the archive)")
+    options = parser.parse_args(argv)
+
+    if options.command == 'run':
+        return run_daemon(options)
+
+    if options.command in CONTROL_COMMANDS:
+        args = {'seconds': options.seconds} if options.command == 'pause' and options.seconds else {}
+        try:
+            reply = send_control(options.command, options.host, options.port, **args)
+        except OSError as e:
+            sys.exit(f"Could not reach the daemon on {options.host}:{options.port}: {e}")
+        if options.json:
+            print(json.dumps(reply, indent=4))
+        elif 'status' in reply:
+            print_status(reply['status'])
+        elif not reply.get('ok'):
+            print(reply.get('error') or f"'{options.command}' had no effect")
+        return 0 if reply.get('ok') else 1
+
+    sessions = open_sessions(options.sessions_dir)
+    if options.command == 'sessions':
+        print("\n".join(sessions.list_sessions()))
+        return 0
+    if options.command == 'import':
+        try:
+            name = sessions.import_session_json(options.file, options.name)
+        except (OSError, ValueError, KeyError) as e:
+            sys.exit(f"Could not import {options.file}: {e}")
+        print(f"Imported session '{name}'")
+        return 0
+    if options.command == 'export':
+        if not sessions.export_session_json(options.session, options.file):
+            sys.exit(f"Session '{options.session}' not found in {sessions.directory}")
+        return 0
+    if options.command in ('export-archive', 'import-archive'):
+        return run_archive_command(options, sessions)
+
+    session_data = load_session_or_exit(sessions, options.session)
+    if options.command == 'games':
+        games = session_data.get('games', {})
+        if options.json:
+            print(json.dumps(games, indent=4))
+            return 0
+        for path, game in games.items():
+            print(f"{'[x]' if game.get('completed') else '[ ]'} {game.get('name', path)}  ({path})")
+        return 0
+
+    stats = session_data.get('stats')
+    game_stats, total_swaps, total_time = stats if isinstance(stats, list) and len(stats) == 3 else ({}, 0, 0)
+    if options.json:
+        print(json.dumps({'game_stats': game_stats, 'total_swaps': total_swaps, 'total_time': total_time}, indent=4))
+        return 0
+    print(f"Swaps: {total_swaps}  Time: {format_time(total_time)}")
+    for name, values in sorted(game_stats.items(), key=lambda item: -item[1].get('time_spent', 0)):
+        print(f"{name}: {values.get('swaps', 0)} swaps, {format_time(values.get('time_spent', 0))}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import json
 import logging
+from file_utils import write_json_atomic
 
 
 class ConfigManager:
@@ -8,8 +9,7 @@ class ConfigManager:
 
     def save_config(self, config_data):
         self.config = config_data  # Update the current configuration in memory
-        with open(self.config_file, 'w') as file:
-            json.dump(config_data, file, indent=4)
+        write_json_atomic(self.config_file, config_data)
 
     def load_config(self):
         try:
@@ -25,6 +25,20 @@ class ConfigManager:
             'bizhawk_path': '',
             'min_shuffle_interval': 30,
             'max_shuffle_interval': 60,
+            'emulator_timeout': 10,
+            'memory_state_budget_mb': 0,
+            'shuffle_lookahead': 2,
+            'prefetch_enabled': True,
+            'savestate_history_size': 5,
+            'savestate_history_quota_mb': 512,
+            'shuffle_policy': 'random',
+            'session_shuffle_policies': {},
+            'force_swap_cooldown': 5,
+            'max_queued_force_swaps': 0,
+            'stats_file_output': True,
+            'overlay_server_enabled': False,
+            'overlay_port': 8765,
+            'session_backend': 'json',
             'stats_preferences': {
                 'individual_game_stats': False,
                 'total_stats': True,
@@ -0,0 +1,352 @@
+import os, json, time, queue, logging, threading, socketserver
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait
+import Python_Client
+from config import ConfigManager
+from game_manager import GameManager
+from session_manager import SessionManager
+from session_database import swap_event
+from event_log import SessionEventLog
+from stat_tracker import StatsTracker
+from shuffle_engine import ShuffleEngine, ConnectionEmulator
+from shuffle_policy import DEFAULT_POLICY
+from shuffle_schedule import new_seed, create_seeded_policy
+from action_queue import ActionQueue
+from savestate_store import SavestateStore
+from stats_output import StatsFileWriter, OverlayServer, OVERLAY_PORT
+from cli import DAEMON_HOST, DAEMON_PORT
+
+
+class MainThreadEmulator:
+    """Hands swap results back to the daemon's own thread instead of the connection's event loop."""
+
+    def __init__(self, emulator, post):
+        self.emulator = emulator
+        self.post = post
+
+    def swap(self, save_path, rom_path, state_path, timeout, callback):
+        self.emulator.swap(save_path, rom_path, state_path, timeout,
+                           lambda future: self.post(lambda: callback(future)))
+
+
+class ShuffleDaemon:
+    """Runs one session's shuffle without any GUI, controlled over a local socket.
+
+    Everything that touches the session runs on the thread calling ``run()``:
+    control requests, emulator events and swap results are posted to it as
+    tasks, and the loop otherwise sleeps until the next swap is due. Session
+    files, working savestates and stats files are laid out as the GUI lays
+    them out, so either can pick up a session the other ran.
+    """
+
+    STATS_INTERVAL = 1.0
+    REQUEST_TIMEOUT = 30.0  # Longest a control connection waits for the daemon thread
+
+    def __init__(self, session_name, config=None, sessions_dir='sessions', host=DAEMON_HOST, port=DAEMON_PORT,
+                 connection=None):
+        self.session_name = session_name
+        self.config = config if config is not None else ConfigManager().load_config()
+        self.session_manager = SessionManager(sessions_dir, backend=self.config.get('session_backend', 'json'))
+        self.game_manager = GameManager()
+        self.connection = connection or Python_Client.connection
+        self.host, self.port = host, port
+        self.tasks = queue.Queue()
+        self.shutting_down = False
+        self.shuffle_seed = None
+        self.savestate_store = SavestateStore(self.config.get('savestate_store_dir', 'savestate_store'))
+        self._ingests = {}  # {game path: newest savestate ingest future}
+        self._server = None
+        self._last_stats_output = 0.0
+        self.stats_file_writer = StatsFileWriter(os.path.join(self.get_session_path(), 'stats'))
+        self.overlay_server = None
+        if self.config.get('overlay_server_enabled', False):
+            self.overlay_server = OverlayServer(port=self.config.get('overlay_port', OVERLAY_PORT))
+
+        self.engine = ShuffleEngine(
+            self.game_manager, MainThreadEmulator(ConnectionEmulator(self.connection), self.post),
+            self.get_state_path, lookahead=self.config.get('shuffle_lookahead', 2),
+            swap_timeout=self.config.get('emulator_timeout', Python_Client.DEFAULT_TIMEOUT))
+        self.engine.subscribe('swap_started', self.on_swap_started)
+        self.engine.subscribe('swapped', self.on_swapped)
+        self.engine.subscribe('paused', lambda reason: logging.info(f"Shuffle paused ({reason})"))
+        self.engine.subscribe('unavailable', lambda reason: logging.warning(f"Shuffle stopped: {reason}"))
+        self.actions = ActionQueue(
+            force_swap=lambda: self.engine.running and not self.engine.paused and self.engine.swap_now(),
+            pause=self.engine.pause, resume=self.engine.resume,
+            swap_cooldown=self.config.get('force_swap_cooldown', 5),
+            max_queued_swaps=self.config.get('max_queued_force_swaps', 0))
+
+    def get_session_path(self):
+        return os.path.join(self.session_manager.directory, self.session_name)
+
+    def get_state_path(self, game_file):
+        game_id = os.path.splitext(os.path.basename(game_file))[0]
+        return os.path.join(self.get_session_path(), 'savestates', f"{game_id}.state")
+
+    def on_swap_started(self, game_path, state_path):
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        # Sessions last run by the GUI may only reference their states in the shared store
+        digest = self.game_manager.save_states.get(game_path)
+        if not os.path.exists(state_path) and isinstance(digest, str) and self.savestate_store.has(digest):
+            try:
+                self.savestate_store.materialize(digest, state_path)
+            except Exception as e:
+                logging.error(f"Error restoring savestate for {game_path}: {e}")
+
+    def on_swapped(self, previous_path, game_path, result):
+        self.session_manager.record_swap(self.session_name, swap_event(
+            previous_path, game_path, self.engine.last_swap_latency_ms))
+        self.session_manager.save_swap_later(self.session_name, self.game_manager, self.shuffle_seed)
+        if previous_path and not self.config.get('memory_state_budget_mb', 0):
+            # With the in-memory pool the file is stale until the flush in stop_shuffle
+            self.store_savestate(previous_path)
+
+    def store_savestate(self, game_path):
+        """Ingest a game's working state file into the shared store in a worker process, as the GUI does."""
+        state_path = self.get_state_path(game_path)
+        if not os.path.isfile(state_path):
+            return None
+        if game_path in self._ingests:
+            self.savestate_store.release(self._ingests[game_path])  # Superseded; its digest won't be used
+        future = self.savestate_store.put_async(state_path)
+        self._ingests[game_path] = future
+        future.add_done_callback(lambda done: self.post(lambda: self._on_savestate_stored(game_path, done)))
+        return future
+
+    def _on_savestate_stored(self, game_path, future):
+        if self._ingests.get(game_path) is not future:
+            return  # Superseded by a later ingest of the same game, or already handled
+        del self._ingests[game_path]
+        try:
+            digest = future.result()[0]
+        except Exception as e:
+            logging.error(f"Error storing savestate for {game_path}: {e}")
+            return
+        if game_path not in self.game_manager.games:
+            self.savestate_store.release(future)
+            return
+        self.game_manager.set_save_state(game_path, digest)
+        # Once the session on disk references the blob the working file can go; it is materialized again on swap-in
+        self.session_manager.after_write(self.session_name,
+                                         lambda: self.post(lambda: self.release_savestate(game_path, future)))
+        self.save_session()
+
+    def release_savestate(self, game_path, future):
+        keep = (self.engine.swap_in_flight or game_path == self.engine.current_game_path
+                or game_path in self.engine.plan.upcoming)
+        self.savestate_store.release(future, drop_source=not keep)
+
+    def store_all_savestates(self):
+        """Ingest every working state file and wait, so the session saved next references the latest blobs."""
+        for game_path in list(self.game_manager.games):
+            self.store_savestate(game_path)
+        wait(list(self._ingests.values()))
+        for game_path, future in list(self._ingests.items()):
+            self._on_savestate_stored(game_path, future)
+
+    def post(self, task):
+        """Run ``task`` on the daemon thread; safe to call from any thread."""
+        self.tasks.put(task)
+
+    def load_session(self):
+        session_data = self.session_manager.load_session(self.session_name)
+        if session_data is None:
+            raise FileNotFoundError(f"Session '{self.session_name}' does not exist")
+        self.game_manager.load_games(session_data.get('games', {}))
+        self.game_manager.load_save_states(session_data.get('save_states', {}))
+        stats = session_data.get('stats')
+        initial_stats = None
+        if isinstance(stats, list) and len(stats) == 3:
+            initial_stats = {'game_stats': stats[0], 'total_swaps': stats[1], 'total_shuffling_time': stats[2]}
+        event_log = SessionEventLog(self.get_session_path(), writer=self.session_manager.writer)
+        self.game_manager.stats_tracker = StatsTracker(initial_stats, event_log=event_log)
+        self.shuffle_seed = session_data.get('shuffle_seed')
+        if self.shuffle_seed is None:
+            self.shuffle_seed = new_seed()
+
+    def save_session(self, flush=False):
+        """Queue a write of the session; ``flush`` waits until it is on disk."""
+        self.session_manager.save_session_later(self.session_name, self.game_manager, self.shuffle_seed)
+        if flush:
+            self.session_manager.flush(self.session_name)
+
+    def on_emulator_event(self, name, args):
+        if name == 'frames' and len(args) >= 2:
+            self.post(lambda: self._add_frames(args))
+
+    def _add_frames(self, args):
+        if self.engine.running and not self.engine.paused and self.game_manager.current_game:
+            try:
+                self.game_manager.stats_tracker.add_emulated_frames(int(args[0]), float(args[1]))
+            except ValueError:
+                logging.warning(f"Malformed frames event from the emulator: {args}")
+
+    def start_shuffle(self):
+        if self.engine.running:
+            return self.engine.resume() or True
+        session_policies = self.config.get('session_shuffle_policies', {})
+        policy_name = session_policies.get(self.session_name, self.config.get('shuffle_policy', DEFAULT_POLICY))
+        self.engine.set_intervals(self.config.get('min_shuffle_interval', 30), self.config.get('max_shuffle_interval', 60))
+        self.engine.reseed(self.shuffle_seed, self.game_manager.stats_tracker.total_swaps)
+        self.engine.set_policy(create_seeded_policy(policy_name, self.game_manager, self.shuffle_seed,
+                                                    self.engine.min_interval, self.engine.max_interval,
+                                                    self.game_manager.stats_tracker.total_swaps, self.engine.rng))
+        self.connection.start_heartbeat()
+        budget_mb = self.config.get('memory_state_budget_mb', 0)
+        self.connection.submit(self.connection.client.configure_state_pool(budget_mb, self.engine.swap_timeout))
+        return self.engine.start()
+
+    def stop_shuffle(self):
+        self.actions.clear()
+        if not self.engine.stop():
+            return False
+        if self.config.get('memory_state_budget_mb', 0):
+            try:
+                self.connection.run(self.connection.client.flush_states())
+            except Exception as e:
+                logging.error(f"Some savestates could not be written to disk: {e}")
+        self.store_all_savestates()
+        self.game_manager.stats_tracker.event_log.sync()
+        self.save_session(flush=True)
+        return True
+
+    def status(self):
+        tracker = self.game_manager.stats_tracker
+        game_stats, total_swaps, total_time = tracker.get_stats()
+        current_game = self.game_manager.current_game
+        current_time = tracker.current_time_spent() if current_game else 0
+        return {
+            'session': self.session_name,
+            'running': self.engine.running,
+            'paused': self.engine.paused,
+            'current_game': current_game,
+            'time_until_swap': self.engine.time_until_swap(),
+            'games': len(self.game_manager.games),
+            'total_swaps': total_swaps,
+            'total_time': total_time + current_time,
+            'current_game_swaps': game_stats.get(current_game, {}).get('swaps', 0),
+            'current_game_time': game_stats.get(current_game, {}).get('time_spent', 0) + current_time,
+            'policy': self.engine.policy.name,
+            'last_swap_latency_ms': self.engine.last_swap_latency_ms,
+            'actions': self.actions.get_metrics(),
+        }
+
+    def handle_command(self, command, args):
+        """Apply a control command on the daemon thread and return the reply."""
+        if command == 'start':
+            return {'ok': bool(self.start_shuffle())}
+        if command == 'stop':
+            return {'ok': self.stop_shuffle()}
+        if command == 'pause':
+            if args.get('seconds'):
+                if not self.engine.running:
+                    return {'ok': False, 'error': "Shuffle is not running"}
+                self.actions.submit_pause(float(args['seconds']))
+                self.actions.process()
+                return {'ok': True}
+            return {'ok': self.engine.pause()}
+        if command == 'resume':
+            return {'ok': self.engine.resume()}
+        if command == 'force-swap':
+            queued = self.actions.submit_force_swap()
+            self.actions.process()
+            return {'ok': queued}
+        if command == 'status':
+            return {'ok': True, 'status': self.status()}
+        if command == 'shutdown':
+            self.shutting_down = True
+            return {'ok': True}
+        return {'ok': False, 'error': f"Unknown command '{command}'"}
+
+    def request(self, command, args):
+        """Called from control connections; waits for the daemon thread to answer."""
+        reply = Future()
+
+        def task():
+            try:
+                reply.set_result(self.handle_command(command, args))
+            except Exception as e:
+                logging.error(f"Error handling control command '{command}': {e}")
+                reply.set_result({'ok': False, 'error': str(e)})
+        self.post(task)
+        try:
+            return reply.result(timeout=self.REQUEST_TIMEOUT)
+        except FutureTimeoutError:
+            return {'ok': False, 'error': f"The daemon did not answer '{command}' within {self.REQUEST_TIMEOUT} seconds"}
+
+    def start_control_server(self):
+        daemon = self
+
+        class ControlHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        message = json.loads(line)
+                        reply = daemon.request(message.get('command'), message)
+                    except ValueError as e:
+                        reply = {'ok': False, 'error': f"Malformed request: {e}"}
+                    self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port), ControlHandler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="DaemonControl", daemon=True).start()
+        logging.info(f"Control server listening on {self.host}:{self.port}")
+
+    def output_stats(self):
+        """Publish the same stats as the GUI, to the overlay and the stats text files."""
+        status = self.status()
+        format_time = self.game_manager.stats_tracker.format_time
+        stats = {
+            'total_swaps': str(status['total_swaps']),
+            'total_time': format_time(status['total_time']),
+            'current_game': status['current_game'] or "None",
+            'current_game_swaps': str(status['current_game_swaps']),
+            'current_game_time': format_time(status['current_game_time']),
+        }
+        if self.overlay_server:
+            self.overlay_server.publish(stats)
+        if self.config.get('stats_file_output', True):
+            self.stats_file_writer.write(stats)
+
+    def _wait_time(self):
+        waits = [self.STATS_INTERVAL]
+        for wait in (self.engine.time_until_swap(), self.actions.next_wakeup()):
+            if wait is not None:
+                waits.append(wait)
+        return max(0.0, min(waits))
+
+    def run(self, start=True):
+        self.load_session()
+        self.connection.call_soon(self.connection.client.add_event_handler, self.on_emulator_event)
+        self.start_control_server()
+        if self.overlay_server:
+            self.overlay_server.start()
+        if start:
+            self.start_shuffle()
+        try:
+            while not self.shutting_down:
+                try:
+                    task = self.tasks.get(timeout=self._wait_time())
+                except queue.Empty:
+                    pass
+                else:
+                    try:
+                        task()
+                    except Exception as e:
+                        # One failing task (a bad command or swap result) must not take the daemon down
+                        logging.exception(f"Error in daemon task: {e}")
+                self.engine.poll()
+                self.actions.process()
+                if time.monotonic() - self._last_stats_output >= self.STATS_INTERVAL:
+                    self._last_stats_output = time.monotonic()
+                    self.output_stats()
+        finally:
+            self.stop_shuffle()
+            self.game_manager.stats_tracker.event_log.close()
+            self.savestate_store.shutdown()
+            if self.overlay_server:
+                self.overlay_server.stop()
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
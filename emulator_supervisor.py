@@ -0,0 +1,98 @@
+import logging, subprocess, threading
+from collections import defaultdict
+
+EMULATOR_PROCESS_NAMES = ('EmuHawk.exe', 'BizHawk.exe')
+
+
+class EmulatorSupervisor:
+    """Keeps track of the BizHawk process so checking on it costs nothing.
+
+    A process started through ``launch`` is tracked by its Popen handle; one
+    started some other way is found by a scan of the process list by name
+    (psutil), done once and again only on ``refresh()``. A watcher thread waits
+    for the tracked process to exit, so ``is_running()`` just reads a flag.
+
+    Subscribers registered with ``subscribe`` are called on the watcher thread:
+
+        attached(pid)
+        exited(pid, returncode)   - returncode is None when it isn't known
+    """
+
+    def __init__(self, process_names=EMULATOR_PROCESS_NAMES):
+        self.process_names = process_names
+        self.pid = None
+        self._alive = False
+        self._scanned = False
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(list)
+
+    def subscribe(self, event, callback):
+        self._subscribers[event].append(callback)
+
+    def _emit(self, event, *args):
+        for callback in list(self._subscribers[event]):
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.error(f"Error in emulator supervisor subscriber for '{event}': {e}")
+
+    def is_running(self):
+        """O(1) after the first call; only scans the process list when nothing was ever tracked."""
+        if not self._alive and not self._scanned:
+            self.refresh()
+        return self._alive
+
+    def launch(self, command):
+        process = subprocess.Popen(command)
+        self._watch(process.pid, process.wait)
+        return process
+
+    def attach_pid(self, pid):
+        """Track a process started elsewhere; needs psutil to wait on a process that isn't our child."""
+        import psutil
+        try:
+            process = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            return False
+        self._watch(pid, process.wait)
+        return True
+
+    def refresh(self):
+        """Look for an emulator started outside the app, unless one is already tracked."""
+        if self._alive:
+            return True
+        self._scanned = True
+        pid = self.find_running_pid()
+        return pid is not None and self.attach_pid(pid)
+
+    def find_running_pid(self):
+        try:
+            import psutil
+        except ImportError:
+            logging.warning("psutil is not installed; emulators started outside the app can't be found")
+            return None
+        for process in psutil.process_iter(['name', 'pid']):
+            if process.info['name'] in self.process_names:
+                return process.info['pid']
+        return None
+
+    def _watch(self, pid, wait):
+        with self._lock:
+            self.pid, self._alive = pid, True
+        logging.info(f"Watching emulator process {pid}")
+        self._emit('attached', pid)
+        threading.Thread(target=self._wait_for_exit, args=(pid, wait), name="EmulatorSupervisor",
+                         daemon=True).start()
+
+    def _wait_for_exit(self, pid, wait):
+        returncode = None
+        try:
+            returncode = wait()
+        except Exception as e:
+            logging.debug(f"Stopped waiting for emulator process {pid}: {e}")
+        with self._lock:
+            if self.pid != pid:
+                return  # Another process was attached since
+            self._alive = False
+        logging.info(f"Emulator process {pid} exited with code {returncode}")
+        self._emit('exited', pid, returncode)
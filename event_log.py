@@ -0,0 +1,227 @@
+import os, json, time, logging, threading
+from file_utils import write_json_atomic
+
+LOG_FILE = 'events.jsonl'
+CHECKPOINT_FILE = 'events.checkpoint.json'
+
+# Record types; each record is a JSON array on its own line: [type, unix time, ...]
+START = 's'   # [s, time, game]                 a game was swapped in
+END = 'e'     # [e, time, game, seconds played] a game was swapped out
+RESET = 'r'   # [r, time]                       all stats were reset
+
+
+class SessionEventLog:
+    """Append-only log of a session's swaps, kept next to its savestates.
+
+    Every ``start``/``end``/``reset`` appends one short line, so recording a
+    swap costs the same however large the session is, and the full timeline
+    is kept (see ``events``). Lines reach the OS right away; ``fsync`` is
+    batched to every ``fsync_every`` records or ``fsync_interval`` seconds,
+    and done on ``sync``/``close``.
+
+    Per-game swaps and play time are rebuilt from the log only when
+    ``aggregate`` is first called, starting from the last checkpoint: every
+    ``checkpoint_every`` records the totals and the log offset they cover
+    are written to events.checkpoint.json, so startup replays at most that
+    many records. With a ``writer`` (session_manager.SessionWriter) that
+    write, and the fsync it needs first, happen on the writer's thread.
+    """
+
+    def __init__(self, directory, fsync_interval=2.0, fsync_every=64, checkpoint_every=500, clock=time.monotonic,
+                 writer=None):
+        self.directory = directory
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_FILE)
+        self.fsync_interval = fsync_interval
+        self.fsync_every = fsync_every
+        self.checkpoint_every = checkpoint_every
+        self.clock = clock
+        self.writer = writer
+        self.replayed = 0  # Records replayed by the last aggregate() rebuild
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = clock()
+        self._since_checkpoint = 0
+        self._stats = None  # (game_stats, totals) once aggregate() has rebuilt them
+        self._lock = threading.RLock()  # Checkpoints read the stats and the log offset from the writer thread
+
+    def exists(self):
+        return os.path.exists(self.log_path) or os.path.exists(self.checkpoint_path)
+
+    def seed(self, game_stats, total_swaps, total_time):
+        """Start a new log from stats kept elsewhere (a session saved before it had a log)."""
+        if self.exists():
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        self._store_checkpoint(0, game_stats, {'swaps': total_swaps, 'time': total_time})
+        return True
+
+    def rebase(self, game_stats, total_swaps, total_time):
+        """Count from stats kept elsewhere from now on; the records before stay in the log but no longer add up."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            offset = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+            os.makedirs(self.directory, exist_ok=True)
+            self._stats = ({name: dict(stats) for name, stats in game_stats.items()},
+                           {'swaps': total_swaps, 'time': total_time})
+            self._since_checkpoint = 0
+            self._store_checkpoint(offset, game_stats, self._stats[1])
+
+    def record_start(self, game_name):
+        self._append([START, round(time.time(), 3), game_name])
+
+    def record_end(self, game_name, time_spent):
+        self._append([END, round(time.time(), 3), game_name, round(time_spent, 3)])
+
+    def record_reset(self):
+        self._append([RESET, round(time.time(), 3)])
+
+    def _append(self, record):
+        with self._lock:
+            if self._file is None:
+                self._open_for_append()
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self._file.flush()
+            self._unsynced += 1
+            self._since_checkpoint += 1
+            if self._stats is not None:
+                self._apply(record, *self._stats)
+        if self._unsynced >= self.fsync_every or self.clock() - self._last_sync >= self.fsync_interval:
+            self.sync()
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def _open_for_append(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.log_path, 'a+b', buffering=0)
+        size = self._file.seek(0, os.SEEK_END)
+        if size:
+            # Drop a record cut short by a crash, so the next one starts on its own line
+            self._file.seek(max(0, size - 4096))
+            tail = self._file.read()
+            if not tail.endswith(b'\n'):
+                self._file.truncate(size - len(tail) + tail.rfind(b'\n') + 1)
+        self._file.close()
+        self._file = open(self.log_path, 'a', encoding='utf-8', newline='\n')
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = self.clock()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.flush(self.checkpoint_path)  # Before the session folder can be renamed or deleted
+        with self._lock:
+            if self._file is not None:
+                self.sync()
+                self._file.close()
+                self._file = None
+
+    def checkpoint(self):
+        """Record the current totals and the log offset they cover, on the writer's thread if there is one."""
+        self._since_checkpoint = 0
+        if self.writer is None:
+            self._write_checkpoint()
+        else:
+            # Pending checkpoints coalesce; the one written covers everything appended by then
+            self.writer.mark_dirty(self.checkpoint_path, self._write_checkpoint)
+
+    def _write_checkpoint(self):
+        with self._lock:
+            game_stats, totals = self._aggregate()
+            if self._file is not None:
+                self._file.flush()
+            offset = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+            game_stats, totals = {name: dict(stats) for name, stats in game_stats.items()}, dict(totals)
+        if offset:
+            # The records a checkpoint covers must be on disk before it is
+            with open(self.log_path, 'rb') as file:
+                os.fsync(file.fileno())
+        self._store_checkpoint(offset, game_stats, totals)
+
+    def _store_checkpoint(self, offset, game_stats, totals):
+        write_json_atomic(self.checkpoint_path, {
+            'version': 1, 'offset': offset, 'game_stats': game_stats,
+            'total_swaps': totals['swaps'], 'total_time': totals['time'],
+        })
+
+    def aggregate(self):
+        """(game_stats, total_swaps, total_time), as StatsTracker keeps them; the caller gets its own copy."""
+        game_stats, totals = self._aggregate()
+        return {name: dict(stats) for name, stats in game_stats.items()}, totals['swaps'], totals['time']
+
+    def _aggregate(self):
+        with self._lock:
+            if self._stats is None:
+                self._stats = self._rebuild()
+            return self._stats
+
+    def _rebuild(self):
+        game_stats, totals, offset = {}, {'swaps': 0, 'time': 0}, 0
+        try:
+            with open(self.checkpoint_path, 'r') as file:
+                checkpoint = json.load(file)
+            game_stats, offset = checkpoint['game_stats'], checkpoint['offset']
+            totals = {'swaps': checkpoint['total_swaps'], 'time': checkpoint['total_time']}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable checkpoint {self.checkpoint_path}: {e}")
+        if self._file is not None:
+            self._file.flush()
+        if offset > (os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0):
+            logging.warning(f"{self.log_path} is shorter than its checkpoint; replaying it from the start")
+            game_stats, totals, offset = {}, {'swaps': 0, 'time': 0}, 0
+        self.replayed = 0
+        for record in self._read(offset):
+            self._apply(record, game_stats, totals)
+            self.replayed += 1
+        self._since_checkpoint = self.replayed
+        return game_stats, totals
+
+    def _read(self, offset=0):
+        try:
+            file = open(self.log_path, 'rb')
+        except FileNotFoundError:
+            return
+        with file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break  # Cut short by a crash; the next append drops it
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logging.warning(f"Skipping a malformed record in {self.log_path}")
+
+    def events(self):
+        """Every record in the log, oldest first."""
+        return self._read()
+
+    @staticmethod
+    def _apply(record, game_stats, totals):
+        kind = record[0]
+        if kind == START:
+            stats = game_stats.setdefault(record[2], {'swaps': 0, 'time_spent': 0})
+            stats['swaps'] += 1
+            totals['swaps'] += 1
+        elif kind == END:
+            stats = game_stats.setdefault(record[2], {'swaps': 0, 'time_spent': 0})
+            stats['time_spent'] += record[3]
+            stats['formatted_time_spent'] = format_duration(record[3])
+            totals['time'] += record[3]
+        elif kind == RESET:
+            for name in game_stats:
+                game_stats[name] = {'swaps': 0, 'time_spent': 0}
+            totals['swaps'], totals['time'] = 0, 0
+
+
+def format_duration(seconds):
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,11 @@
+import os, json
+
+
+def write_json_atomic(file_path, data):
+    """Write JSON next to ``file_path`` and rename it into place, so a crash never leaves half a file."""
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
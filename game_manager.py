@@ -1,22 +1,56 @@
 import json
 import os
 import logging
+import threading
 from stat_tracker import StatsTracker
+from selection_index import SelectionIndex
 
 class GameManager:
     def __init__(self, file_path='games.json'):
         self.file_path = file_path
         self.games = {}
+        self.selection_index = SelectionIndex()  # Kept in step with self.games by the methods below
         self.stats_tracker = StatsTracker()
         self.current_game = None
         self.save_states = {}
+        # Paths whose game entry or savestate changed since the session was last written
+        self.changed_games = set()
+        self.all_games_changed = True
+        self.written_session = None  # Name of the session these changes are relative to
+        # Held while games or savestates change, so the session writer thread sees each change whole
+        self.lock = threading.RLock()
+
+    def take_changes(self):
+        """Paths changed since the last call, or None when every game has to be written."""
+        if self.all_games_changed:
+            self.all_games_changed = False
+            self.changed_games.clear()
+            return None
+        changed = set()
+        while self.changed_games:
+            changed.add(self.changed_games.pop())  # pop is atomic, so concurrent marks aren't lost
+        return changed
+
+    def snapshot(self, paths=None):
+        """Copies of (games, save_states) to write elsewhere, limited to ``paths`` when given."""
+        with self.lock:
+            if paths is None:
+                return {path: dict(game) for path, game in self.games.items()}, dict(self.save_states)
+            return ({path: dict(self.games[path]) for path in paths if path in self.games},
+                    {path: self.save_states[path] for path in paths if path in self.save_states})
+
+    def set_save_state(self, path, save_state):
+        with self.lock:
+            self.save_states[path] = save_state
+            self.changed_games.add(path)
 
     def switch_game(self, game_name):
         try:
-            if self.current_game:
-                self.stats_tracker.end_game(self.current_game)
-            self.current_game = game_name
-            self.stats_tracker.start_game(game_name)
+            with self.stats_tracker.lock:
+                if self.current_game:
+                    self.stats_tracker.end_game(self.current_game)
+                self.current_game = game_name
+                self.stats_tracker.start_game(game_name)
         except Exception as e:
             logging.error("Error switching game: %s", e)
             raise
@@ -25,7 +59,10 @@ class GameManager:
 
     def load_games(self, game_data):
         try:
-            self.games = game_data
+            with self.lock:
+                self.games = game_data
+                self.selection_index.rebuild(game_data)
+                self.all_games_changed = True
         except Exception as e:
             logging.error("Error loading games: %s", e)
             raise
@@ -40,15 +77,18 @@ class GameManager:
 
     def add_game(self, path, name=None, goals=None):
         try:
-            normalized_path = os.path.abspath(path)
-            if normalized_path in self.games:
-                return
+            with self.lock:
+                normalized_path = os.path.abspath(path)
+                if normalized_path in self.games:
+                    return
 
             self.games[normalized_path] = {
                 'name': name or os.path.basename(path),
                 'completed': False,
                 'goals': goals or "Beat the Game"
             }
+            self.selection_index.add(normalized_path, self.games[normalized_path])
+            self.changed_games.add(normalized_path)
             self.save_games()
         except Exception as e:
             logging.error("Error adding game: %s", e)
@@ -56,18 +96,23 @@ class GameManager:
 
     def set_game_goals(self, path, goals):
         try:
-            if path in self.games:
-                self.games[path]['goals'] = goals
-                self.save_games()
+            with self.lock:
+                if path in self.games:
+                    self.games[path]['goals'] = goals
+                    self.changed_games.add(path)
+                    self.save_games()
         except Exception as e:
             logging.error("Error setting game goals: %s", e)
             raise
 
     def remove_game(self, path):
         try:
-            if path in self.games:
-                del self.games[path]
-                self.save_games()
+            with self.lock:
+                if path in self.games:
+                    del self.games[path]
+                    self.selection_index.remove(path)
+                    self.changed_games.add(path)
+                    self.save_games()
         except Exception as e:
             logging.error("Error removing game: %s", e)
             raise
@@ -76,37 +121,48 @@ class GameManager:
 
     def rename_game(self, path, new_name):
         try:
-            if path in self.games:
-                self.games[path]['name'] = new_name
-                self.save_games()
+            with self.lock:
+                if path in self.games:
+                    self.games[path]['name'] = new_name
+                    self.changed_games.add(path)
+                    self.save_games()
         except Exception as e:
             logging.error("Error renaming game: %s", e)
             raise
 
     def load_save_states(self, save_states_data):
         try:
-            # Implement based on how your application should handle save states
-            for game_path, save_state in save_states_data.items():
-                if game_path in self.games:
-                    self.save_states[game_path] = save_state
+            with self.lock:
+                # Savestate blob digests by game path, replaced wholesale when a session loads
+                self.save_states = {}
+                for game_path, save_state in save_states_data.items():
+                    if game_path in self.games:
+                        self.save_states[game_path] = save_state
+                self.all_games_changed = True
         except Exception as e:
             logging.error("Error loading save states: %s", e)
             raise
 
     def mark_game_as_completed(self, path):
         try:
-            if path in self.games:
-                self.games[path]['completed'] = True
-                self.save_games()
+            with self.lock:
+                if path in self.games:
+                    self.games[path]['completed'] = True
+                    self.selection_index.update(path, self.games[path])
+                    self.changed_games.add(path)
+                    self.save_games()
         except Exception as e:
             logging.error("Error marking game as completed: %s", e)
             raise
 
     def mark_game_as_not_completed(self, path):
         try:
-            if path in self.games:
-                self.games[path]['completed'] = False
-                self.save_games()
+            with self.lock:
+                if path in self.games:
+                    self.games[path]['completed'] = False
+                    self.selection_index.update(path, self.games[path])
+                    self.changed_games.add(path)
+                    self.save_games()
         except Exception as e:
             logging.error("Error marking game as not completed: %s", e)
             raise
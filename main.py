@@ -1,5 +1,6 @@
 import sys, os
 import logging
+import multiprocessing
 
 import datetime
 
@@ -26,6 +27,7 @@ from PySide6.QtWidgets import QApplication
 from ui.main_window import MainWindow
 
 def main():
+	multiprocessing.freeze_support()  # Savestate compression workers in the frozen build
 	app = QApplication(sys.argv)
 	main_window = MainWindow()
 	main_window.show()
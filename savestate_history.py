@@ -0,0 +1,188 @@
+import os, shutil, heapq, logging, threading, queue, time
+from collections import deque
+from concurrent.futures import Future
+
+SNAPSHOT_SUFFIX = '.state'
+
+
+class SavestateHistory:
+    """Rolling snapshots of each game's savestate within one session.
+
+    Every game keeps its last ``max_snapshots`` states under
+    ``<directory>/<game_id>/<timestamp>.state``, and once all snapshots together
+    exceed ``quota_bytes`` the oldest ones are deleted, whichever game they belong
+    to. Snapshots are copied by a background writer, so recording one never holds
+    up a swap; ``restore`` puts any of them back as the game's working state,
+    on the same thread.
+    """
+
+    def __init__(self, directory, max_snapshots=5, quota_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_snapshots = max(1, max_snapshots)
+        self.quota_bytes = quota_bytes
+        self._snapshots = None  # {game_id: deque of (snapshot_id, size)}, oldest first
+        self._total_bytes = 0
+        self._count = 0
+        # Heap of (snapshot_id, game_id) over every snapshot, so the quota finds the oldest one without
+        # scanning every game; snapshots already trimmed by their game's limit are skipped when popped
+        self._oldest = []
+        self._last_source = {}  # {game_id: (mtime, size)} of the file last copied
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def _load_index(self):
+        if self._snapshots is not None:
+            return
+        self._snapshots, self._total_bytes, self._count, self._oldest = {}, 0, 0, []
+        if not os.path.isdir(self.directory):
+            return
+        for game_id in os.listdir(self.directory):
+            game_dir = os.path.join(self.directory, game_id)
+            if not os.path.isdir(game_dir):
+                continue
+            entries = deque()
+            for name in sorted(os.listdir(game_dir)):
+                if name.endswith(SNAPSHOT_SUFFIX):
+                    size = os.path.getsize(os.path.join(game_dir, name))
+                    entries.append((name[:-len(SNAPSHOT_SUFFIX)], size))
+                    self._total_bytes += size
+            if entries:
+                self._snapshots[game_id] = entries
+                self._count += len(entries)
+                self._oldest.extend((snapshot_id, game_id) for snapshot_id, _ in entries)
+        heapq.heapify(self._oldest)
+
+    def _snapshot_path(self, game_id, snapshot_id):
+        return os.path.join(self.directory, game_id, snapshot_id + SNAPSHOT_SUFFIX)
+
+    def record(self, game_id, state_path):
+        """Queue a copy of ``state_path`` as the newest snapshot of ``game_id``.
+
+        Returns a future that resolves to the snapshot id, or None if the file
+        was missing or unchanged.
+        """
+        future = Future()
+        future.add_done_callback(lambda done: done.exception() and logging.error(
+            f"Error recording savestate history for {game_id}: {done.exception()}"))
+        return self._submit(self._write_snapshot, (game_id, state_path), future)
+
+    def _submit(self, function, args, future):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="SavestateHistory", daemon=True)
+            self._thread.start()
+        self._queue.put((function, args, future))
+        return future
+
+    def flush(self):
+        """Block until every queued snapshot has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        while True:
+            function, args, future = self._queue.get()
+            try:
+                result = function(*args)
+                if future is not None:
+                    future.set_result(result)
+            except Exception as e:
+                if future is not None:
+                    future.set_exception(e)
+                else:
+                    logging.error(f"Error recording savestate history for {args[0]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_snapshot(self, game_id, state_path):
+        try:
+            stat = os.stat(state_path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._load_index()
+            if self._last_source.get(game_id) == (stat.st_mtime_ns, stat.st_size):
+                return None  # Unchanged since the last snapshot
+            # Names sort chronologically; bump the timestamp if two land in the same nanosecond
+            snapshot_id = f"{time.time_ns():020d}"
+            entries = self._snapshots.setdefault(game_id, deque())
+            if entries and snapshot_id <= entries[-1][0]:
+                snapshot_id = f"{int(entries[-1][0]) + 1:020d}"
+
+        snapshot_path = self._snapshot_path(game_id, snapshot_id)
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        temp_path = snapshot_path + '.tmp'
+        shutil.copyfile(state_path, temp_path)
+        os.replace(temp_path, snapshot_path)
+
+        with self._lock:
+            entries.append((snapshot_id, stat.st_size))
+            self._total_bytes += stat.st_size
+            self._count += 1
+            heapq.heappush(self._oldest, (snapshot_id, game_id))
+            self._last_source[game_id] = (stat.st_mtime_ns, stat.st_size)
+            self._evict(game_id)
+        logging.debug(f"Recorded savestate snapshot {snapshot_id} for {game_id}")
+        return snapshot_id
+
+    def _evict(self, game_id):
+        """Trim the game just written to its limit, then drop the oldest snapshots of any game while over quota."""
+        entries = self._snapshots[game_id]
+        while len(entries) > self.max_snapshots:
+            self._remove(game_id, entries)
+        while self.quota_bytes and self._total_bytes > self.quota_bytes and self._oldest:
+            snapshot_id, oldest_game = heapq.heappop(self._oldest)
+            oldest_entries = self._snapshots.get(oldest_game)
+            if oldest_entries and oldest_entries[0][0] == snapshot_id:
+                self._remove(oldest_game, oldest_entries)
+        if len(self._oldest) > 2 * self._count + 64:
+            # Mostly trimmed entries by now; rebuild so the heap stays proportional to the snapshots kept
+            self._oldest = [(snapshot_id, game_id) for game_id, entries in self._snapshots.items()
+                            for snapshot_id, _ in entries]
+            heapq.heapify(self._oldest)
+
+    def _remove(self, game_id, entries):
+        snapshot_id, size = entries.popleft()
+        self._total_bytes -= size
+        self._count -= 1
+        try:
+            os.remove(self._snapshot_path(game_id, snapshot_id))
+        except OSError as e:
+            logging.error(f"Error removing savestate snapshot {snapshot_id} of {game_id}: {e}")
+
+    def snapshots(self, game_id):
+        """Return the snapshots of a game, newest first, as (snapshot_id, timestamp, size)."""
+        with self._lock:
+            self._load_index()
+            return [(snapshot_id, int(snapshot_id) / 1e9, size)
+                    for snapshot_id, size in reversed(self._snapshots.get(game_id, ()))]
+
+    def total_bytes(self):
+        with self._lock:
+            self._load_index()
+            return self._total_bytes
+
+    def restore(self, game_id, snapshot_id, state_path):
+        """Replace the working state with a snapshot; the state being replaced is kept as a snapshot too.
+
+        This runs on the writer thread, after every snapshot queued before it.
+        Returns a future that resolves to ``state_path``, or raises
+        FileNotFoundError if there is no such snapshot.
+        """
+        return self._submit(self._restore, (game_id, snapshot_id, state_path), Future())
+
+    def _restore(self, game_id, snapshot_id, state_path):
+        snapshot_path = self._snapshot_path(game_id, snapshot_id)
+        if not os.path.isfile(snapshot_path):
+            raise FileNotFoundError(f"No snapshot {snapshot_id} for {game_id}")
+        os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+        temp_path = state_path + '.tmp'
+        # Copy first: recording the current state may evict the very snapshot being restored
+        shutil.copyfile(snapshot_path, temp_path)
+        self._write_snapshot(game_id, state_path)
+        os.replace(temp_path, state_path)
+        # The restored file is already in the history, so don't copy it again
+        stat = os.stat(state_path)
+        with self._lock:
+            self._last_source[game_id] = (stat.st_mtime_ns, stat.st_size)
+        return state_path
@@ -0,0 +1,203 @@
+import os, hashlib, logging, threading, zlib
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+
+BLOB_SUFFIX = '.zz'
+
+
+def _blob_path(blob_dir, digest):
+    return os.path.join(blob_dir, digest[:2], digest + BLOB_SUFFIX)
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def compress_into_store(state_path, blob_dir, level):
+    """Hash a savestate file and store it compressed under its digest. Runs in a worker process."""
+    with open(state_path, 'rb') as file:
+        data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    blob_path = _blob_path(blob_dir, digest)
+    if os.path.exists(blob_path):
+        return digest, len(data), False  # Identical state already stored
+
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    temp_path = f"{blob_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(zlib.compress(data, level))
+    os.replace(temp_path, blob_path)
+    return digest, len(data), True
+
+
+def materialize_blob(blob_dir, digest, state_path):
+    """Write a blob back out as a plain state file BizHawk can load."""
+    with open(_blob_path(blob_dir, digest), 'rb') as file:
+        data = zlib.decompress(file.read())
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    # Unique, as the GUI may materialize the same state in the foreground and in a worker at once
+    temp_path = f"{state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, state_path)
+    return state_path
+
+
+class SavestateStore:
+    """Compressed, content-addressed savestate blobs shared by all sessions.
+
+    BizHawk reads and writes plain ``.state`` files, so each session keeps working
+    copies in its savestates folder. Those are ingested here by digest, and
+    sessions reference the digests, so identical states are stored once and a
+    copied session only needs its references.
+
+    A digest ingested with ``put_async`` is held back from ``collect_garbage``
+    until ``release`` says the caller has it in a session, and the working copy
+    can be dropped at the same time; ``materialize`` brings it back when needed.
+    """
+
+    def __init__(self, directory='savestate_store', compression_level=6, max_workers=None):
+        self.directory = directory
+        self.blob_dir = os.path.join(directory, 'blobs')
+        self.compression_level = compression_level
+        self.max_workers = max_workers
+        self._executor = None
+        self._condition = threading.Condition()
+        self._in_flight = set()  # Futures of ingests and materializations still running
+        self._sources = {}  # {ingest future: (state path, file signature when the ingest started)}
+        self._held = Counter()  # Digests ingested but not released yet
+        self._held_by = {}  # {ingest future: digest}
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _submit(self, function, args, source=None):
+        # Under the lock, so a worker never starts while collect_garbage is deleting blobs
+        with self._condition:
+            future = self._get_executor().submit(function, *args)
+            self._in_flight.add(future)
+            if source is not None:
+                self._sources[future] = source
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._condition:
+            self._in_flight.discard(future)
+            if future in self._sources:
+                if not future.cancelled() and future.exception() is None:
+                    digest = future.result()[0]
+                    self._held[digest] += 1
+                    self._held_by[future] = digest
+                else:
+                    del self._sources[future]
+            self._condition.notify_all()
+
+    def put_async(self, state_path):
+        """Ingest a state file in a worker process; the future resolves to (digest, size, newly_stored).
+
+        Pass the future to ``release`` once its digest is in a session.
+        """
+        state_path = os.path.abspath(state_path)
+        source = (state_path, _file_signature(state_path))
+        return self._submit(compress_into_store, (state_path, os.path.abspath(self.blob_dir), self.compression_level),
+                            source)
+
+    def release(self, future, drop_source=False):
+        """Let ``collect_garbage`` see the digest an ingest stored, now that a session references it.
+
+        With ``drop_source`` the ingested working file is deleted too, unless it
+        changed since the ingest started (the emulator wrote a newer state).
+        """
+        with self._condition:
+            state_path, signature = self._sources.pop(future, (None, None))
+            digest = self._held_by.pop(future, None)
+            if digest is not None:
+                self._held[digest] -= 1
+                if self._held[digest] <= 0:
+                    del self._held[digest]
+        if drop_source and digest is not None and signature is not None and _file_signature(state_path) == signature:
+            try:
+                os.remove(state_path)
+            except OSError as e:
+                logging.warning(f"Could not remove working savestate {state_path}: {e}")
+
+    def put_many_async(self, state_paths):
+        """Ingest several state files in parallel; the future resolves to {state_path: finished ingest future}."""
+        futures = {path: self.put_async(path) for path in state_paths if os.path.isfile(path)}
+        result = Future()
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def finished(_):
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done:
+                result.set_result(futures)
+
+        if not futures:
+            result.set_result(futures)
+        for future in futures.values():
+            future.add_done_callback(finished)
+        return result
+
+    def put_many(self, state_paths):
+        """Ingest several state files in parallel and wait; returns {state_path: digest}.
+
+        The digests are released straight away, so don't run ``collect_garbage``
+        before they are in a session; ``put_many_async`` leaves that to the caller.
+        """
+        digests = {}
+        for path, future in self.put_many_async(state_paths).result().items():
+            try:
+                digests[path] = future.result()[0]
+            except Exception as e:
+                logging.error(f"Error storing savestate {path}: {e}")
+            self.release(future)
+        return digests
+
+    def has(self, digest):
+        return os.path.exists(_blob_path(self.blob_dir, digest))
+
+    def blob_path(self, digest):
+        return _blob_path(self.blob_dir, digest)
+
+    def materialize(self, digest, state_path):
+        materialize_blob(self.blob_dir, digest, state_path)
+
+    def materialize_async(self, digest, state_path):
+        return self._submit(materialize_blob, (os.path.abspath(self.blob_dir), digest, os.path.abspath(state_path)))
+
+    def collect_garbage(self, referenced_digests):
+        """Delete blobs no session references any more; returns the number removed.
+
+        Waits for running ingests and materializations first, since an ingest's
+        digest isn't known until it finishes. Digests not released yet are kept.
+        """
+        removed = 0
+        with self._condition:
+            self._condition.wait_for(lambda: not self._in_flight)
+            keep = set(referenced_digests) | set(self._held)
+            for root, _, files in os.walk(self.blob_dir):
+                for name in files:
+                    if name.endswith(BLOB_SUFFIX) and name[:-len(BLOB_SUFFIX)] not in keep:
+                        try:
+                            os.remove(os.path.join(root, name))
+                            removed += 1
+                        except OSError as e:
+                            logging.error(f"Error removing savestate blob {name}: {e}")
+        return removed
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
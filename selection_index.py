@@ -0,0 +1,154 @@
+import random
+
+
+class SelectionIndex:
+    """Weighted random selection over a game library that stays cheap at 20k+ games.
+
+    Each game owns a slot in a Fenwick tree of weights; completed games weigh
+    nothing. Adding, removing, completing and reweighting a game are O(log n),
+    sampling is O(log n) and never copies the library, and whether anything is
+    left to play is a counter lookup. Slots of removed games are reused.
+    ``revision`` changes whenever games are added or removed, and
+    ``availability_revision`` whenever a game becomes available or unavailable.
+    """
+
+    def __init__(self, games=None):
+        self.revision = 0
+        self.availability_revision = 0
+        self.rebuild(games or {})
+
+    def rebuild(self, games):
+        """Index a whole {path: game} dict from scratch, e.g. after a session load. O(n)."""
+        self._slots = {}
+        self._paths = []
+        self._weights = []
+        self._free = []
+        self._available = 0
+        self.revision += 1
+        self.availability_revision += 1
+        for path, game in games.items():
+            self._slots[path] = len(self._paths)
+            self._paths.append(path)
+            weight = self._weight_of(game)
+            self._weights.append(weight)
+            if weight > 0:
+                self._available += 1
+        self._build_tree(max(16, len(self._paths)))
+
+    def _build_tree(self, capacity):
+        allocated = len(self._weights)
+        self._weights.extend([0.0] * (capacity - allocated))
+        self._paths.extend([None] * (capacity - allocated))
+        self._free.extend(range(capacity - 1, allocated - 1, -1))  # Lowest slot is popped first
+        self._tree = [0.0] + list(self._weights)
+        for position in range(1, capacity + 1):
+            parent = position + (position & -position)
+            if parent <= capacity:
+                self._tree[parent] += self._tree[position]
+
+    @staticmethod
+    def _weight_of(game):
+        if game.get('completed'):
+            return 0.0
+        return max(0.0, float(game.get('weight', 1.0)))
+
+    def _add_to_tree(self, slot, delta):
+        position = slot + 1
+        while position < len(self._tree):
+            self._tree[position] += delta
+            position += position & -position
+
+    def _set_slot_weight(self, slot, weight):
+        old_weight = self._weights[slot]
+        if weight == old_weight:
+            return
+        if (weight > 0) != (old_weight > 0):
+            self._available += 1 if weight > 0 else -1
+            self.availability_revision += 1
+        self._weights[slot] = weight
+        self._add_to_tree(slot, weight - old_weight)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, path):
+        return path in self._slots
+
+    def add(self, path, game):
+        """Index a new game, or refresh the weight of one already indexed."""
+        if path in self._slots:
+            self._set_slot_weight(self._slots[path], self._weight_of(game))
+            return
+        if not self._free:
+            self._build_tree(len(self._weights) * 2)
+        slot = self._free.pop()
+        self.revision += 1
+        self._slots[path] = slot
+        self._paths[slot] = path
+        self._set_slot_weight(slot, self._weight_of(game))
+
+    update = add
+
+    def remove(self, path):
+        slot = self._slots.pop(path, None)
+        if slot is None:
+            return
+        self.revision += 1
+        self._set_slot_weight(slot, 0.0)
+        self._paths[slot] = None
+        self._free.append(slot)
+
+    def is_available(self, path):
+        slot = self._slots.get(path)
+        return slot is not None and self._weights[slot] > 0
+
+    def available_count(self):
+        return self._available
+
+    def has_available(self, exclude=None):
+        """Whether any game other than ``exclude`` can still be picked. O(1)."""
+        return self._available - (1 if self.is_available(exclude) else 0) > 0
+
+    def sample(self, rng=None, exclude=None):
+        """Pick an available game with probability proportional to its weight, or None."""
+        if not self.has_available(exclude):
+            return None
+        rng = rng or random
+        excluded_slot = self._slots.get(exclude) if exclude is not None else None
+        excluded_weight = self._weights[excluded_slot] if excluded_slot is not None else 0.0
+        # Take the excluded game out of the tree for the draw instead of copying anything
+        if excluded_weight:
+            self._add_to_tree(excluded_slot, -excluded_weight)
+        try:
+            total = self._prefix_sum(len(self._weights))
+            for _ in range(3):
+                slot = self._find(rng.random() * total)
+                if slot < len(self._weights) and self._weights[slot] > 0 and slot != excluded_slot:
+                    return self._paths[slot]
+            # Rounding put the draw on an empty slot; settle for the first candidate
+            for slot, weight in enumerate(self._weights):
+                if weight > 0 and slot != excluded_slot:
+                    return self._paths[slot]
+            return None
+        finally:
+            if excluded_weight:
+                self._add_to_tree(excluded_slot, excluded_weight)
+
+    def _prefix_sum(self, count):
+        total, position = 0.0, count
+        while position > 0:
+            total += self._tree[position]
+            position -= position & -position
+        return total
+
+    def _find(self, target):
+        """Index of the slot whose cumulative weight range contains ``target``."""
+        position = 0
+        step = 1 << (len(self._weights).bit_length() - 1)
+        while step:
+            candidate = position + step
+            if candidate < len(self._tree) and self._tree[candidate] <= target:
+                position = candidate
+                target -= self._tree[candidate]
+            step >>= 1
+        return position
@@ -0,0 +1,244 @@
+import os, re, json, time, zlib, shutil, hashlib, logging, zipfile
+from savestate_store import BLOB_SUFFIX
+
+ARCHIVE_FORMAT = 'retro-roulette-session'
+ARCHIVE_VERSION = 1
+ARCHIVE_SUFFIX = '.rrsession'
+MANIFEST_NAME = 'manifest.json'
+SESSION_NAME = 'session.json'
+IMPORTED_SESSION_NAME = 'session.import.json'  # Not session.json, so the folder isn't listed as a session yet
+BLOB_PREFIX = 'blobs/'
+CHUNK_SIZE = 1024 * 1024
+DIGEST_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveCancelled(ArchiveError):
+    pass
+
+
+def _session_files(session_folder):
+    """(archive name, path) of everything in a session folder except session.json and temp files."""
+    for root, _, files in os.walk(session_folder):
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            arcname = os.path.relpath(path, session_folder).replace(os.sep, '/')
+            if arcname == SESSION_NAME or file_name.endswith('.tmp'):
+                continue
+            yield arcname, path
+
+
+def _check_arcname(arcname):
+    if arcname.startswith('/') or '\\' in arcname or '..' in arcname.split('/') or ':' in arcname:
+        raise ArchiveError(f"Unsafe path in archive: {arcname}")
+
+
+def _check_session_name(name):
+    if (not isinstance(name, str) or not name or name.startswith('.') or any(c in name for c in '/\\:')
+            or '..' in name or os.path.basename(name) != name):
+        raise ArchiveError(f"Unsafe session name in archive: {name!r}")
+
+
+class _Progress:
+    """Calls ``callback(done, total)`` at most every ``interval`` seconds and checks for cancellation."""
+
+    def __init__(self, total, callback=None, cancelled=None, interval=0.1):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self.cancelled = cancelled
+        self.interval = interval
+        self._last_report = 0.0
+
+    def advance(self, size):
+        self.done += size
+        if self.cancelled is not None and self.cancelled():
+            raise ArchiveCancelled("Cancelled")
+        now = time.monotonic()
+        if self.callback is not None and (now - self._last_report >= self.interval or self.done >= self.total):
+            self._last_report = now
+            self.callback(self.done, self.total)
+
+
+def _copy_stream(source, target, progress, limit=None):
+    """Copy in CHUNK_SIZE pieces, at most ``limit`` bytes, returning (bytes copied, sha256 hex digest)."""
+    digest, size = hashlib.sha256(), 0
+    while chunk := source.read(CHUNK_SIZE if limit is None else min(CHUNK_SIZE, limit - size)):
+        digest.update(chunk)
+        target.write(chunk)
+        size += len(chunk)
+        progress.advance(len(chunk))
+    return size, digest.hexdigest()
+
+
+class _BlobCheck:
+    """Decompresses blob data as it streams past and hashes the raw state, which is what the store names it by."""
+
+    def __init__(self, target):
+        self.target = target
+        self.decompressor = zlib.decompressobj()
+        self.digest = hashlib.sha256()
+
+    def write(self, chunk):
+        self.target.write(chunk)
+        self.digest.update(self.decompressor.decompress(chunk))
+
+    def state_digest(self):
+        try:
+            self.digest.update(self.decompressor.flush())
+        except zlib.error:
+            return None
+        return self.digest.hexdigest() if self.decompressor.eof else None
+
+
+def export_session(session_manager, savestate_store, name, archive_path, progress=None, cancelled=None):
+    """Write a session (its data, stats, event log, savestates and history) into one zip archive.
+
+    Files are streamed into the archive a chunk at a time, so memory use stays
+    flat however large the savestates are. Savestates only kept in the shared
+    store are included as their compressed blobs. A manifest with every
+    entry's size and SHA-256 is written last; the archive only appears under
+    ``archive_path`` once it is complete. Returns the manifest.
+    """
+    session_data = session_manager.load_session(name)
+    if session_data is None:
+        raise ArchiveError(f"Session '{name}' not found")
+    session_folder = os.path.join(session_manager.directory, name)
+    entries = list(_session_files(session_folder)) if os.path.isdir(session_folder) else []
+    present = {arcname for arcname, _ in entries}
+    for game_path, digest in session_data.get('save_states', {}).items():
+        state_name = f"savestates/{os.path.splitext(os.path.basename(game_path))[0]}.state"
+        if isinstance(digest, str) and state_name not in present and savestate_store.has(digest):
+            entries.append((f"{BLOB_PREFIX}{digest}{BLOB_SUFFIX}", savestate_store.blob_path(digest)))
+    # Sizes are taken now and nothing past them is copied, so files a running shuffle
+    # appends to (like the event log) are exported as they were at this point
+    sized = []
+    for arcname, path in entries:
+        try:
+            sized.append((arcname, path, os.path.getsize(path)))
+        except OSError:
+            logging.warning(f"{path} disappeared before it could be exported")
+    session_bytes = json.dumps(session_data, indent=4).encode('utf-8')
+    tracker = _Progress(len(session_bytes) + sum(size for _, _, size in sized), progress, cancelled)
+
+    manifest = {'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION, 'name': name, 'created': time.time(), 'files': {}}
+    temp_path = archive_path + '.part'
+    try:
+        with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            archive.writestr(SESSION_NAME, session_bytes)
+            manifest['files'][SESSION_NAME] = {'size': len(session_bytes),
+                                               'sha256': hashlib.sha256(session_bytes).hexdigest()}
+            tracker.advance(len(session_bytes))
+            for arcname, path, size in sized:
+                try:
+                    source = open(path, 'rb')
+                    modified = os.path.getmtime(path)
+                except OSError:
+                    logging.warning(f"{path} disappeared before it could be exported")
+                    tracker.advance(size)
+                    continue
+                # Blobs are zlib data already; deflating them again only costs time
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime(modified)[:6])
+                info.compress_type = zipfile.ZIP_STORED if arcname.startswith(BLOB_PREFIX) else zipfile.ZIP_DEFLATED
+                with source, archive.open(info, 'w', force_zip64=True) as target:
+                    size, digest = _copy_stream(source, target, tracker, size)
+                manifest['files'][arcname] = {'size': size, 'sha256': digest}
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=4))
+        os.replace(temp_path, archive_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return manifest
+
+
+def read_manifest(archive_path):
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            manifest = json.loads(archive.read(MANIFEST_NAME))
+    except (KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise ArchiveError(f"{archive_path} is not a session archive: {e}")
+    if manifest.get('format') != ARCHIVE_FORMAT or manifest.get('version', 0) > ARCHIVE_VERSION:
+        raise ArchiveError(f"{archive_path} is not a session archive this version can read")
+    return manifest
+
+
+def import_session(session_manager, savestate_store, archive_path, name=None, progress=None, cancelled=None):
+    """Add the session in an archive made by ``export_session``, as ``name`` or the name it was exported with.
+
+    Every entry is streamed out and checked against the manifest's size and
+    SHA-256 before anything becomes visible: files go to a hidden folder
+    that is renamed into place at the end, so a corrupt or cancelled import
+    leaves nothing behind. Returns the session name.
+    """
+    manifest = read_manifest(archive_path)
+    name = name or manifest.get('name')
+    _check_session_name(name)
+    session_folder = os.path.join(session_manager.directory, name)
+    if os.path.exists(session_folder) or session_manager.session_exists(name):
+        raise ArchiveError(f"Session '{name}' already exists")
+    files = manifest['files']
+    if SESSION_NAME not in files:
+        raise ArchiveError(f"{archive_path} has no {SESSION_NAME}")
+    for arcname in files:
+        _check_arcname(arcname)
+    tracker = _Progress(sum(entry['size'] for entry in files.values()), progress, cancelled)
+
+    temp_folder = os.path.join(session_manager.directory, f".{name}.import")
+    shutil.rmtree(temp_folder, ignore_errors=True)
+    imported_blobs = []
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            missing = set(files) - set(archive.namelist())
+            if missing:
+                raise ArchiveError(f"{archive_path} is incomplete: {', '.join(sorted(missing))} missing")
+            for arcname, expected in files.items():
+                if arcname.startswith(BLOB_PREFIX):
+                    digest = arcname[len(BLOB_PREFIX):-len(BLOB_SUFFIX)]
+                    if not DIGEST_PATTERN.fullmatch(digest):
+                        raise ArchiveError(f"Unexpected savestate blob in archive: {arcname}")
+                    target_path = savestate_store.blob_path(digest)
+                    if savestate_store.has(digest):
+                        tracker.advance(expected['size'])
+                        continue
+                elif arcname == SESSION_NAME:
+                    target_path = os.path.join(temp_folder, IMPORTED_SESSION_NAME)
+                else:
+                    target_path = os.path.join(temp_folder, *arcname.split('/'))
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                part_path = f"{target_path}.{os.getpid()}.part"
+                blob_check = None
+                try:
+                    with archive.open(arcname) as source, open(part_path, 'wb') as target:
+                        if arcname.startswith(BLOB_PREFIX):
+                            target = blob_check = _BlobCheck(target)
+                        size, digest = _copy_stream(source, target, tracker)
+                except (zipfile.BadZipFile, zlib.error) as e:
+                    os.remove(part_path)
+                    raise ArchiveError(f"{arcname} in {archive_path} is corrupt: {e}")
+                if size != expected['size'] or digest != expected['sha256']:
+                    os.remove(part_path)
+                    raise ArchiveError(f"{arcname} in {archive_path} is corrupt (checksum mismatch)")
+                # The manifest comes from the archive too; a blob must really hold the state it is named after
+                if blob_check is not None and blob_check.state_digest() != arcname[len(BLOB_PREFIX):-len(BLOB_SUFFIX)]:
+                    os.remove(part_path)
+                    raise ArchiveError(f"{arcname} in {archive_path} does not hold the savestate it is named after")
+                os.replace(part_path, target_path)
+                if arcname.startswith(BLOB_PREFIX):
+                    imported_blobs.append(target_path)
+
+        os.replace(temp_folder, session_folder)
+    except BaseException:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        for blob_path in imported_blobs:
+            os.remove(blob_path)
+        raise
+    # The session data goes in through the session manager, which renames it and knows the backend
+    imported_file = os.path.join(session_folder, IMPORTED_SESSION_NAME)
+    session_manager.import_session_json(imported_file, name)
+    os.remove(imported_file)
+    logging.info(f"Imported session '{name}' from {archive_path} ({len(files)} files)")
+    return name
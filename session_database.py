@@ -0,0 +1,269 @@
+import json, time, sqlite3, logging, threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    total_swaps INTEGER NOT NULL DEFAULT 0,
+    total_time REAL NOT NULL DEFAULT 0,
+    game_count INTEGER NOT NULL DEFAULT 0,
+    completed_count INTEGER NOT NULL DEFAULT 0,
+    shuffle_seed INTEGER,
+    goals TEXT
+);
+CREATE TABLE IF NOT EXISTS games (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    goals TEXT,
+    save_state TEXT,
+    extra TEXT,
+    PRIMARY KEY (session_id, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS games_by_name ON games (session_id, name);
+CREATE INDEX IF NOT EXISTS games_by_save_state ON games (save_state) WHERE save_state IS NOT NULL;
+CREATE TABLE IF NOT EXISTS game_stats (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    game_name TEXT NOT NULL,
+    swaps INTEGER NOT NULL DEFAULT 0,
+    time_spent REAL NOT NULL DEFAULT 0,
+    extra TEXT,
+    PRIMARY KEY (session_id, game_name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS swap_events (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    time REAL NOT NULL,
+    previous_path TEXT,
+    game_path TEXT NOT NULL,
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS swap_events_by_session ON swap_events (session_id, id);
+"""
+
+GAME_COLUMNS = ('name', 'completed', 'goals')
+STAT_COLUMNS = ('swaps', 'time_spent')
+
+
+def _extra(entry, columns):
+    extra = {key: value for key, value in entry.items() if key not in columns}
+    return json.dumps(extra) if extra else None
+
+
+class SessionDatabase:
+    """Sessions kept in one SQLite database instead of a session.json per session.
+
+    Games, per-game stats and swap events are rows keyed by session and path
+    (or game name), so a save given the paths that changed writes only those
+    rows, and the counts the session list and info panel show are kept on the
+    session row. The database runs in WAL mode and every thread gets its own
+    connection, so the GUI can read while the session writer thread commits.
+
+    ``load_session`` returns the same dict layout as session.json, which is
+    also what ``save_session`` accepts, so sessions move between the two
+    formats without loss.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.file_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _session_id(self, connection, name):
+        row = connection.execute("SELECT id FROM sessions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def list_sessions(self):
+        return [name for name, in self._connect().execute("SELECT name FROM sessions ORDER BY name")]
+
+    def has_session(self, name):
+        return self._session_id(self._connect(), name) is not None
+
+    def get_summary(self, name):
+        """(game_count, completed_count, total_swaps, total_time, shuffle_seed) from the session row alone."""
+        return self._connect().execute(
+            "SELECT game_count, completed_count, total_swaps, total_time, shuffle_seed FROM sessions WHERE name = ?",
+            (name,)).fetchone()
+
+    def load_session(self, name):
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT id, total_swaps, total_time, shuffle_seed, goals FROM sessions WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        session_id, total_swaps, total_time, shuffle_seed, goals = row
+        games, save_states, game_stats = {}, {}, {}
+        for path, game_name, completed, game_goals, save_state, extra in connection.execute(
+                "SELECT path, name, completed, goals, save_state, extra FROM games WHERE session_id = ?", (session_id,)):
+            games[path] = {'name': game_name, 'completed': bool(completed), 'goals': game_goals,
+                           **(json.loads(extra) if extra else {})}
+            if save_state is not None:
+                save_states[path] = save_state
+        for game_name, swaps, time_spent, extra in connection.execute(
+                "SELECT game_name, swaps, time_spent, extra FROM game_stats WHERE session_id = ?", (session_id,)):
+            game_stats[game_name] = {'swaps': swaps, 'time_spent': time_spent, **(json.loads(extra) if extra else {})}
+        session_data = {
+            'name': name,
+            'games': games,
+            'stats': [game_stats, total_swaps, total_time],
+            'save_states': save_states,
+            'goals': json.loads(goals) if goals else None,
+        }
+        if shuffle_seed is not None:
+            session_data['shuffle_seed'] = shuffle_seed
+        return session_data
+
+    def save_session(self, name, games, stats, save_states, goals, shuffle_seed=None,
+                     changed_games=None, changed_stats=None, swap_events=()):
+        """Write a session in one transaction.
+
+        ``changed_games`` (paths) and ``changed_stats`` (game names) limit the
+        write to those rows; None rewrites all of them, as for a session that
+        was just imported or loaded from elsewhere. ``swap_events`` are
+        ``(time, previous_path, game_path, latency_ms)`` tuples to append.
+        """
+        game_stats, total_swaps, total_time = stats if isinstance(stats, (list, tuple)) and len(stats) == 3 else ({}, 0, 0)
+        connection = self._connect()
+        with connection:
+            session_id = self._session_id(connection, name)
+            if session_id is None:
+                session_id = connection.execute("INSERT INTO sessions (name) VALUES (?)", (name,)).lastrowid
+                changed_games = changed_stats = None
+            count_delta = self._write_games(connection, session_id, games, save_states, changed_games)
+            self._write_stats(connection, session_id, game_stats, changed_stats)
+            if count_delta is None:
+                counts = "game_count = ?, completed_count = ?"
+                count_values = (len(games), sum(bool(game.get('completed', False)) for game in list(games.values())))
+            else:
+                counts = "game_count = game_count + ?, completed_count = completed_count + ?"
+                count_values = count_delta
+            connection.execute(
+                f"UPDATE sessions SET total_swaps = ?, total_time = ?, shuffle_seed = ?, goals = ?, {counts} WHERE id = ?",
+                (total_swaps, total_time, shuffle_seed, json.dumps(goals) if goals is not None else None,
+                 *count_values, session_id))
+            if swap_events:
+                connection.executemany(
+                    "INSERT INTO swap_events (session_id, time, previous_path, game_path, latency_ms) VALUES (?, ?, ?, ?, ?)",
+                    [(session_id, *event) for event in swap_events])
+
+    @staticmethod
+    def _game_row(session_id, path, game, save_states):
+        return (session_id, path, game.get('name') or path, int(bool(game.get('completed', False))), game.get('goals'),
+                save_states.get(path), _extra(game, GAME_COLUMNS))
+
+    def _write_games(self, connection, session_id, games, save_states, changed_paths):
+        """Returns the change in (game_count, completed_count), or None after rewriting every row."""
+        upsert = ("INSERT OR REPLACE INTO games (session_id, path, name, completed, goals, save_state, extra) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?)")
+        if changed_paths is None:
+            connection.execute("DELETE FROM games WHERE session_id = ?", (session_id,))
+            connection.executemany(upsert, [self._game_row(session_id, path, game, save_states)
+                                            for path, game in list(games.items())])
+            return None
+        game_delta = completed_delta = 0
+        for path in changed_paths:
+            old = connection.execute("SELECT completed FROM games WHERE session_id = ? AND path = ?",
+                                     (session_id, path)).fetchone()
+            game = games.get(path)
+            if game is None:
+                if old is not None:
+                    connection.execute("DELETE FROM games WHERE session_id = ? AND path = ?", (session_id, path))
+                    game_delta, completed_delta = game_delta - 1, completed_delta - old[0]
+                continue
+            row = self._game_row(session_id, path, game, save_states)
+            connection.execute(upsert, row)
+            game_delta += old is None
+            completed_delta += row[3] - (old[0] if old else 0)
+        return game_delta, completed_delta
+
+    def _write_stats(self, connection, session_id, game_stats, changed_names):
+        upsert = "INSERT OR REPLACE INTO game_stats (session_id, game_name, swaps, time_spent, extra) VALUES (?, ?, ?, ?, ?)"
+        if changed_names is None:
+            connection.execute("DELETE FROM game_stats WHERE session_id = ?", (session_id,))
+            names = list(game_stats)
+        else:
+            names = changed_names
+        rows = []
+        for game_name in names:
+            entry = game_stats.get(game_name)
+            if entry is None:
+                connection.execute("DELETE FROM game_stats WHERE session_id = ? AND game_name = ?",
+                                   (session_id, game_name))
+                continue
+            rows.append((session_id, game_name, entry.get('swaps', 0), entry.get('time_spent', 0),
+                         _extra(entry, STAT_COLUMNS)))
+        connection.executemany(upsert, rows)
+
+    def delete_session(self, name):
+        connection = self._connect()
+        with connection:
+            return connection.execute("DELETE FROM sessions WHERE name = ?", (name,)).rowcount > 0
+
+    def rename_session(self, old_name, new_name):
+        connection = self._connect()
+        try:
+            with connection:
+                return connection.execute("UPDATE sessions SET name = ? WHERE name = ?",
+                                          (new_name, old_name)).rowcount > 0
+        except sqlite3.IntegrityError:
+            logging.error(f"Session '{new_name}' already exists.")
+            return False
+
+    def clone_session(self, source_name, new_name, save_states=None):
+        connection = self._connect()
+        with connection:
+            source_id = self._session_id(connection, source_name)
+            if source_id is None or self._session_id(connection, new_name) is not None:
+                return False
+            new_id = connection.execute(
+                "INSERT INTO sessions (name, total_swaps, total_time, game_count, completed_count, shuffle_seed, goals) "
+                "SELECT ?, total_swaps, total_time, game_count, completed_count, shuffle_seed, goals "
+                "FROM sessions WHERE id = ?", (new_name, source_id)).lastrowid
+            connection.execute(
+                "INSERT INTO games (session_id, path, name, completed, goals, save_state, extra) "
+                "SELECT ?, path, name, completed, goals, save_state, extra FROM games WHERE session_id = ?",
+                (new_id, source_id))
+            connection.execute(
+                "INSERT INTO game_stats (session_id, game_name, swaps, time_spent, extra) "
+                "SELECT ?, game_name, swaps, time_spent, extra FROM game_stats WHERE session_id = ?",
+                (new_id, source_id))
+            if save_states is not None:
+                connection.executemany("UPDATE games SET save_state = ? WHERE session_id = ? AND path = ?",
+                                       [(digest, new_id, path) for path, digest in save_states.items()])
+        return True
+
+    def referenced_savestates(self):
+        return {digest for digest, in self._connect().execute(
+            "SELECT DISTINCT save_state FROM games WHERE save_state IS NOT NULL")}
+
+    def get_swap_events(self, name, after_id=0, limit=None):
+        """``(id, time, previous_path, game_path, latency_ms)`` rows of a session, oldest first."""
+        session_id = self._session_id(self._connect(), name)
+        if session_id is None:
+            return []
+        return self._connect().execute(
+            "SELECT id, time, previous_path, game_path, latency_ms FROM swap_events "
+            "WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (session_id, after_id, -1 if limit is None else limit)).fetchall()
+
+
+def swap_event(previous_path, game_path, latency_ms=None):
+    return time.time(), previous_path, game_path, latency_ms
@@ -1,16 +1,314 @@
-import json, os, logging, shutil
+import json, os, time, logging, shutil, threading
+from session_database import SessionDatabase
+from file_utils import write_json_atomic
+
+SESSION_BACKENDS = ('json', 'sqlite')
+DATABASE_FILE = 'sessions.db'
+
+
+class SessionWriter:
+    """Write-behind persistence for sessions.
+
+    ``mark_dirty`` only records which session changed and how to write it,
+    so callers never serialise anything. A background thread writes a session
+    once it has been quiet for ``delay`` seconds, or at the latest ``max_delay``
+    seconds after it first became dirty, however often it keeps changing.
+    ``flush`` writes everything pending right away and waits for it.
+    """
+
+    def __init__(self, delay=1.0, max_delay=5.0):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.writes = 0
+        self.coalesced = 0
+        self._pending = {}  # {session name: (write, first dirty time, last dirty time)}
+        self._writing = set()
+        self._flush_requested = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def mark_dirty(self, name, write):
+        """``write()`` is called on the writer thread and does the actual save."""
+        now = time.monotonic()
+        with self._condition:
+            if name in self._pending:
+                self.coalesced += 1
+                first_dirty = self._pending[name][1]
+            else:
+                first_dirty = now
+            self._pending[name] = (write, first_dirty, now)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="SessionWriter", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def is_dirty(self, name=None):
+        with self._condition:
+            return bool(self._pending or self._writing) if name is None else (
+                name in self._pending or name in self._writing)
+
+    def discard(self, name):
+        """Forget pending changes of a session, e.g. one being deleted."""
+        with self._condition:
+            self._pending.pop(name, None)
+
+    def flush(self, name=None, timeout=30.0):
+        """Write pending changes (of every session, or just ``name``) now and wait until they are on disk."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if self._thread is None:
+                return True
+            self._flush_requested = True
+            self._condition.notify_all()
+            while (self._pending or self._writing) if name is None else (name in self._pending or name in self._writing):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.error("Timed out waiting for session files to be written")
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def _due(self):
+        if self._flush_requested:
+            return [name for name in self._pending], 0
+        now, due, waits = time.monotonic(), [], []
+        for name, (_, first_dirty, last_dirty) in self._pending.items():
+            write_at = min(last_dirty + self.delay, first_dirty + self.max_delay)
+            if write_at <= now:
+                due.append(name)
+            else:
+                waits.append(write_at - now)
+        return due, min(waits, default=None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due, wait = self._due()
+                while not due:
+                    self._flush_requested = False
+                    self._condition.notify_all()
+                    self._condition.wait(wait)
+                    due, wait = self._due()
+                batch = {name: self._pending.pop(name)[0] for name in due}
+                self._writing.update(batch)
+            for name, write in batch.items():
+                try:
+                    write()
+                    self.writes += 1
+                except RuntimeError as e:
+                    # The session changed size while it was serialised here; write it again
+                    logging.debug(f"Session '{name}' changed while being written, retrying: {e}")
+                    self.mark_dirty(name, write)
+                except Exception as e:
+                    logging.error(f"Error writing session '{name}': {e}")
+            with self._condition:
+                self._writing.difference_update(batch)
+                self._condition.notify_all()
+
+
+class SessionSummary:
+    """The handful of numbers the session info panel shows, worked out once per version of a session file."""
+
+    __slots__ = ('name', 'game_count', 'completed_count', 'total_swaps', 'total_time', 'shuffle_seed')
+
+    def __init__(self, name, game_count, completed_count, total_swaps, total_time, shuffle_seed):
+        self.name = name
+        self.game_count = game_count
+        self.completed_count = completed_count
+        self.total_swaps = total_swaps
+        self.total_time = total_time
+        self.shuffle_seed = shuffle_seed
+
+    @classmethod
+    def from_session_data(cls, session_data):
+        games = session_data.get('games') or {}
+        stats = session_data.get('stats')
+        _, total_swaps, total_time = stats if isinstance(stats, list) and len(stats) == 3 else ({}, 0, 0)
+        return cls(session_data.get('name'), len(games),
+                   sum(bool(game.get('completed', False)) for game in games.values()),
+                   total_swaps, total_time, session_data.get('shuffle_seed'))
+
 
 class SessionManager:
-    def __init__(self, directory='sessions'):
+    """Sessions on disk: a folder per session for its savestates and stats files, plus its data.
+
+    With the default 'json' backend the data is the folder's session.json. The
+    'sqlite' backend keeps it in ``<directory>/sessions.db`` instead (see
+    SessionDatabase), importing any session.json it doesn't know yet when it
+    opens; ``export_session_json``/``import_session_json`` convert either way.
+    """
+
+    def __init__(self, directory='sessions', backend='json'):
         self.directory = directory
         os.makedirs(directory, exist_ok=True)
+        self.writer = SessionWriter()
+        self.summary_parses = 0
+        self._summaries = {}  # {session name: ((mtime_ns, size) of session.json, SessionSummary)}
+        self._summaries_lock = threading.Lock()
+        self._swap_events = {}  # {session name: [swap event tuples not written yet]}
+        self._swap_events_lock = threading.Lock()
+        self._after_write = {}  # {session name: [callbacks waiting for its next write]}
+        self._after_write_lock = threading.Lock()
+        self.database = None
+        if backend == 'sqlite':
+            self.database = SessionDatabase(os.path.join(directory, DATABASE_FILE))
+            self.import_json_sessions()
+        elif backend != 'json':
+            logging.warning(f"Unknown session backend '{backend}', using 'json'")
+
+    def get_session_file(self, name):
+        return os.path.join(self.directory, name, 'session.json')
+
+    def list_sessions(self):
+        if self.database is not None:
+            return self.database.list_sessions()
+        try:
+            return sorted(name for name in os.listdir(self.directory) if os.path.isfile(self.get_session_file(name)))
+        except FileNotFoundError:
+            return []
+
+    def session_exists(self, name):
+        self.flush(name)
+        if self.database is not None:
+            return self.database.has_session(name)
+        return os.path.isfile(self.get_session_file(name))
+
+    def create_session(self, name, shuffle_seed=None):
+        """Create an empty session and its savestates folder."""
+        os.makedirs(os.path.join(self.directory, name, 'savestates'), exist_ok=True)
+        self.save_session(name, {}, [{}, 0, 0], {}, None, shuffle_seed=shuffle_seed)
+
+    @staticmethod
+    def _file_signature(file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_session_summary(self, session_name):
+        """Cheap enough to call every second: a stat of session.json, and a parse only after someone else changed it."""
+        if self.database is not None:
+            row = self.database.get_summary(session_name)
+            return SessionSummary(session_name, *row) if row else None
+        file_path = self.get_session_file(session_name)
+        signature = self._file_signature(file_path)
+        with self._summaries_lock:
+            cached = self._summaries.get(session_name)
+        if signature is None:
+            with self._summaries_lock:
+                self._summaries.pop(session_name, None)
+            return None
+        if cached and (cached[0] == signature or self.writer.is_dirty(session_name)):
+            # Unchanged, or our own write is about to record the new version
+            return cached[1]
+        session_data = self.get_session_info(session_name)
+        if session_data is None:
+            return cached[1] if cached else None
+        self.summary_parses += 1
+        summary = SessionSummary.from_session_data(session_data)
+        with self._summaries_lock:
+            self._summaries[session_name] = (signature, summary)
+        return summary
+
+    def save_session_later(self, name, game_manager, shuffle_seed=None):
+        """Queue a write of session ``name`` from the game manager's current games, stats and savestates.
+
+        Nothing is copied or serialised here; that happens on the writer thread,
+        and with the sqlite backend only the games changed since the last write
+        are written. The writer copies what it writes under the game manager's
+        and stats tracker's locks, so it never sees a change half made.
+        """
+        stats_tracker = game_manager.stats_tracker
+
+        def write():
+            with game_manager.lock, stats_tracker.lock:
+                changed_games, changed_stats = game_manager.take_changes(), stats_tracker.take_changes()
+                if game_manager.written_session != name or self.database is None:
+                    # Last written to another session (or never): that one's rows say nothing about this one
+                    changed_games = changed_stats = None
+                games, save_states = game_manager.snapshot(changed_games)
+                game_stats, total_swaps, total_time = stats_tracker.snapshot(changed_stats)
+                with self._after_write_lock:
+                    after_write = self._after_write.pop(name, [])
+            if self.database is None:
+                try:
+                    self.save_session(name, games, [game_stats, total_swaps, total_time], save_states,
+                                      None, shuffle_seed=shuffle_seed)
+                except Exception:
+                    self._restore_after_write(name, after_write)
+                    raise
+                self._run_after_write(name, after_write)
+                return
+            with self._swap_events_lock:
+                swap_events = self._swap_events.pop(name, [])
+            try:
+                self.save_session(name, games, [game_stats, total_swaps, total_time], save_states, None,
+                                  shuffle_seed=shuffle_seed, changed_games=changed_games,
+                                  changed_stats=changed_stats, swap_events=swap_events)
+                game_manager.written_session = name
+            except Exception:
+                # Nothing was committed; write everything next time
+                game_manager.all_games_changed = stats_tracker.all_games_changed = True
+                with self._swap_events_lock:
+                    self._swap_events.setdefault(name, [])[:0] = swap_events
+                self._restore_after_write(name, after_write)
+                raise
+            self._run_after_write(name, after_write)
+        self.writer.mark_dirty(name, write)
+
+    def save_swap_later(self, name, game_manager, shuffle_seed=None):
+        """Queue what a swap changed; see ``save_session_later``.
+
+        A swap only changes stats, and a session with an event log already has
+        them there. So with the json backend, which would rewrite the whole
+        session.json, the swap waits for the session's next write instead.
+        """
+        if self.database is None and game_manager.stats_tracker.event_log is not None:
+            return
+        self.save_session_later(name, game_manager, shuffle_seed)
+
+    def after_write(self, name, callback):
+        """Call ``callback()`` on the writer thread once session ``name`` has been written with what it holds now.
+
+        Only takes effect with a following ``save_session_later``.
+        """
+        with self._after_write_lock:
+            self._after_write.setdefault(name, []).append(callback)
+
+    def _restore_after_write(self, name, callbacks):
+        with self._after_write_lock:
+            self._after_write.setdefault(name, [])[:0] = callbacks
+
+    @staticmethod
+    def _run_after_write(name, callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Error after writing session '{name}': {e}")
+
+    def record_swap(self, name, event):
+        """Keep a swap event (see session_database.swap_event) for the session's next write; sqlite backend only."""
+        if self.database is not None:
+            with self._swap_events_lock:
+                self._swap_events.setdefault(name, []).append(event)
+
+    def flush(self, name=None):
+        return self.writer.flush(name)
 
 # Update the save_session method in the SessionManager class to include the 'file_path' argument
-    def save_session(self, name, games, stats, save_states, goals, file_path=None):
+    def save_session(self, name, games, stats, save_states, goals, file_path=None, shuffle_seed=None,
+                     changed_games=None, changed_stats=None, swap_events=()):
         """Save a session to disk within a dedicated folder for the session."""
         # Create the session folder if it doesn't exist
         session_folder = os.path.join(self.directory, name)
         os.makedirs(session_folder, exist_ok=True)
+
+        if self.database is not None and not file_path:
+            self.database.save_session(name, games, stats, save_states, goals, shuffle_seed,
+                                       changed_games, changed_stats, swap_events)
+            return
     
         # If a custom file_path is not provided, define the default path
         if not file_path:
@@ -24,11 +322,22 @@ class SessionManager:
             'save_states': save_states,
             'goals': goals
         }
-        with open(file_path, 'w') as file:
-            json.dump(session_data, file, indent=4)
+        if shuffle_seed is not None:
+            session_data['shuffle_seed'] = shuffle_seed
+        summary = SessionSummary.from_session_data(session_data)
+        write_json_atomic(file_path, session_data)
+        if file_path == os.path.join(session_folder, 'session.json'):
+            with self._summaries_lock:
+                self._summaries[name] = (self._file_signature(file_path), summary)
 
     def load_session(self, name):
-        file_path = os.path.join(self.directory, name, 'session.json')
+        self.flush(name)
+        if self.database is not None:
+            session_data = self.database.load_session(name)
+            if session_data is None:
+                logging.error(f"Session '{name}' not found in {self.database.file_path}.")
+            return session_data
+        file_path = self.get_session_file(name)
         try:
             with open(file_path, 'r') as file:
                 return json.load(file)
@@ -44,7 +353,13 @@ class SessionManager:
 
     
     def delete_session(self, session_name):
+        self.writer.discard(session_name)
+        with self._after_write_lock:
+            self._after_write.pop(session_name, None)
+        self.flush(session_name)  # Let a write already under way finish first
         session_folder = os.path.join(self.directory, session_name)
+        if self.database is not None:
+            self.database.delete_session(session_name)
         try:
             if os.path.isdir(session_folder):
                 shutil.rmtree(session_folder)  # Delete the directory and all its contents
@@ -56,6 +371,7 @@ class SessionManager:
             return False
         
     def rename_session(self, old_name, new_name):
+        self.flush(old_name)
         old_folder = os.path.join(self.directory, old_name)
         new_folder = os.path.join(self.directory, new_name)
 
@@ -63,6 +379,18 @@ class SessionManager:
             logging.error(f"Session folder '{new_name}' already exists.")
             return False
 
+        if self.database is not None:
+            if not self.database.rename_session(old_name, new_name):
+                return False
+            try:
+                if os.path.isdir(old_folder):
+                    os.rename(old_folder, new_folder)
+                return True
+            except OSError as e:
+                logging.exception(f"Error while renaming session folder: {e}")
+                self.database.rename_session(new_name, old_name)
+                return False
+
         try:
             return self.rename_session_logic(old_folder, new_folder, new_name)
         except OSError as e:
@@ -76,12 +404,10 @@ class SessionManager:
         # Update the 'name' inside the session.json file
         session_file = os.path.join(new_folder, 'session.json')
         if os.path.isfile(session_file):
-            with open(session_file, 'r+') as file:
+            with open(session_file, 'r') as file:
                 session_data = json.load(file)
-                session_data['name'] = new_name  # Update the session name
-                file.seek(0)  # Move to the start of the file
-                json.dump(session_data, file, indent=4)
-                file.truncate()  # Remove any remaining part of the old content
+            session_data['name'] = new_name  # Update the session name
+            write_json_atomic(session_file, session_data)
 
         # Rename the savestates folder if it exists
         old_savestates_folder = os.path.join(old_folder, 'savestates')
@@ -91,12 +417,82 @@ class SessionManager:
 
         return True
 
+    def clone_session(self, source_name, new_name, save_states=None):
+        """Copy a session's metadata only; savestates stay shared through their blob references."""
+        if self.database is not None:
+            self.flush(source_name)
+            if not self.database.clone_session(source_name, new_name, save_states):
+                return False
+            os.makedirs(os.path.join(self.directory, new_name, 'savestates'), exist_ok=True)
+            return True
+        session_data = self.load_session(source_name)
+        if session_data is None:
+            return False
+        session_data['name'] = new_name
+        if save_states is not None:
+            session_data['save_states'] = save_states
+        new_folder = os.path.join(self.directory, new_name)
+        os.makedirs(os.path.join(new_folder, 'savestates'), exist_ok=True)
+        write_json_atomic(os.path.join(new_folder, 'session.json'), session_data)
+        return True
+
+    def referenced_savestates(self):
+        """Digests of every savestate blob referenced by any session."""
+        self.flush()
+        if self.database is not None:
+            return self.database.referenced_savestates()
+        digests = set()
+        for name in os.listdir(self.directory):
+            session_data = self.get_session_info(name)
+            if session_data:
+                digests.update(digest for digest in session_data.get('save_states', {}).values()
+                               if isinstance(digest, str))
+        return digests
+
     def get_session_info(self, session_name):
-        session_file = os.path.join(self.directory, session_name, 'session.json')
+        if self.database is not None:
+            return self.database.load_session(session_name)
+        session_file = self.get_session_file(session_name)
         try:
             with open(session_file, 'r') as file:
                 return json.load(file)
         except (FileNotFoundError, json.JSONDecodeError):
             return None
 
+    def import_session_json(self, file_path, name=None):
+        """Add a session from a session.json file (under ``name``, or the name it was saved with)."""
+        with open(file_path, 'r') as file:
+            session_data = json.load(file)
+        name = name or session_data['name']
+        os.makedirs(os.path.join(self.directory, name, 'savestates'), exist_ok=True)
+        self.save_session(name, session_data.get('games', {}), session_data.get('stats', [{}, 0, 0]),
+                          session_data.get('save_states', {}), session_data.get('goals'),
+                          shuffle_seed=session_data.get('shuffle_seed'))
+        return name
+
+    def export_session_json(self, name, file_path):
+        """Write a session out in the session.json layout; returns False if it doesn't exist."""
+        session_data = self.load_session(name)
+        if session_data is None:
+            return False
+        write_json_atomic(file_path, session_data)
+        return True
+
+    def import_json_sessions(self):
+        """Bring session folders that only have a session.json into the database."""
+        imported = 0
+        known = set(self.database.list_sessions())
+        for name in os.listdir(self.directory):
+            session_file = self.get_session_file(name)
+            if name in known or not os.path.isfile(session_file):
+                continue
+            try:
+                self.import_session_json(session_file, name)
+                imported += 1
+            except (OSError, ValueError, KeyError) as e:
+                logging.error(f"Could not import session '{name}' into the database: {e}")
+        if imported:
+            logging.info(f"Imported {imported} session.json files into {self.database.file_path}")
+        return imported
+
      
\ No newline at end of file
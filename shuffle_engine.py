@@ -0,0 +1,315 @@
+import os, time, random, logging
+from collections import defaultdict
+from shuffle_plan import ShufflePlan
+from shuffle_policy import RandomPolicy
+from Python_Client import CommandTimeout, DEFAULT_TIMEOUT
+
+# Reasons passed with the "paused" event
+PAUSE_REQUESTED = 'requested'
+PAUSE_EMULATOR_MISSING = 'emulator_missing'
+PAUSE_EMULATOR_UNRESPONSIVE = 'emulator_unresponsive'
+
+# Reasons passed with the "unavailable" event
+NO_GAMES = 'no_games'
+ONE_GAME = 'one_game'
+ALL_COMPLETED = 'all_completed'
+
+
+class ShuffleEngine:
+    """Decides when to swap and to which game, without any GUI.
+
+    The next swap is an absolute deadline on ``clock`` (time.monotonic by
+    default), so pauses and force swaps never make the countdown drift. The
+    engine has no timer of its own: its owner calls ``poll()`` once
+    ``time_until_swap()`` has elapsed, from a Qt timer, a loop or a simulated
+    clock.
+
+    Which game comes next is up to ``policy`` (a ShufflePolicy, random by
+    default), which can be swapped out with ``set_policy``. All randomness
+    comes from ``rng``; ``reseed`` makes a run reproducible.
+
+    ``emulator`` needs ``swap(save_path, rom_path, state_path, timeout, callback)``,
+    which calls ``callback(future)`` once the swap finishes. ``is_emulator_running``
+    is checked before each swap. Subscribers registered with ``subscribe`` are
+    told about everything that happens:
+
+        started, stopped, resumed
+        paused(reason)
+        scheduled(seconds)            - a new deadline was set
+        planned(upcoming_paths)       - the lookahead plan changed
+        swap_started(game_path, state_path)
+        swapped(previous_path, game_path, result)
+        swap_failed(game_path, error)
+        unavailable(reason)           - nothing left to shuffle to; the engine stopped
+    """
+
+    def __init__(self, game_manager, emulator, state_path_for, clock=time.monotonic, rng=None,
+                 min_interval=30, max_interval=60, lookahead=2, is_emulator_running=None,
+                 swap_timeout=DEFAULT_TIMEOUT, policy=None):
+        self.game_manager = game_manager
+        self.emulator = emulator
+        self.state_path_for = state_path_for
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.policy = policy or RandomPolicy(game_manager, self.rng)
+        self.plan = ShufflePlan(lookahead)
+        self.is_emulator_running = is_emulator_running or (lambda: True)
+        self.swap_timeout = swap_timeout
+        self.set_intervals(min_interval, max_interval)
+
+        self.running = False
+        self.paused = False
+        self.swap_in_flight = False
+        self.swap_cancelled = False  # The run that started the swap in flight was stopped
+        self.deadline = None
+        self.remaining = None  # Seconds left on the deadline when paused
+        self.current_game_path = None
+        self.last_swap_latency_ms = None
+        self._subscribers = defaultdict(list)
+
+    def subscribe(self, event, callback):
+        self._subscribers[event].append(callback)
+
+    def _emit(self, event, *args):
+        for callback in list(self._subscribers[event]):
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.error(f"Error in shuffle engine subscriber for '{event}': {e}")
+
+    def set_intervals(self, min_interval, max_interval):
+        if min_interval > max_interval:
+            logging.warning("Minimum interval is greater than maximum interval. Using default values.")
+            min_interval, max_interval = 30, 60
+        self.min_interval, self.max_interval = min_interval, max_interval
+
+    def set_policy(self, policy):
+        """Use another ShufflePolicy; games already planned are picked again by the new one."""
+        if policy is self.policy:
+            return
+        self.policy = policy
+        self.policy.reset()
+        self.plan.clear()
+        if self.running and self.current_game_path:
+            self.plan_upcoming()
+
+    def reseed(self, seed, step=0):
+        """Seed the engine's RNG (shared with its policy) for the run starting at swap ``step``.
+
+        Mixing in the step lets a session resumed later continue with fresh but
+        still reproducible draws instead of repeating its opening.
+        """
+        self.rng.seed(f"{seed}:{step}")
+
+    def next_interval(self):
+        interval = self.policy.next_interval(self.current_game_path)
+        if interval is None:
+            interval = self.rng.randint(self.min_interval, self.max_interval)
+        return interval
+
+    def time_until_swap(self):
+        """Seconds until the next swap is due, or None when none is scheduled."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - self.clock())
+
+    def start(self):
+        if self.running:
+            return False
+        self.running, self.paused = True, False
+        self.deadline = self.remaining = None
+        self.plan.clear()
+        self.policy.reset()
+        self._emit('started')
+        self.swap_now()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self.running = self.paused = False
+        self.deadline = self.remaining = None
+        self.swap_cancelled = self.swap_in_flight
+        self.game_manager.stats_tracker.end_game(self.game_manager.current_game)
+        self.game_manager.current_game = None
+        self._emit('stopped')
+        return True
+
+    def pause(self, reason=PAUSE_REQUESTED):
+        if not self.running or self.paused:
+            return False
+        self.paused = True
+        if self.deadline is not None:
+            self.remaining = max(0.0, self.deadline - self.clock())
+            self.deadline = None
+        self._emit('paused', reason)
+        return True
+
+    def resume(self):
+        if not self.running or not self.paused:
+            return False
+        self.paused = False
+        self._emit('resumed')
+        if self.remaining is not None:
+            logging.info("Resumed shuffle with %d seconds left", self.remaining)
+            self.deadline, self.remaining = self.clock() + self.remaining, None
+            self._emit('scheduled', self.deadline - self.clock())
+        else:
+            self.swap_now()
+        return True
+
+    def poll(self):
+        """Swap if the deadline has passed; returns whether a swap was started."""
+        if self.running and not self.paused and self.deadline is not None and self.clock() >= self.deadline:
+            return self.swap_now()
+        return False
+
+    def swap_now(self):
+        """Swap to the next planned game right away; also used for force swaps."""
+        if not self.running or self.paused:
+            return False
+        if self.swap_in_flight:
+            logging.info("A swap is already in progress.")
+            return False
+
+        games = self.game_manager.games
+        if not games:
+            logging.warning("No games available to shuffle.")
+            self._halt(NO_GAMES)
+            return False
+
+        if not self.is_emulator_running():
+            self.pause(PAUSE_EMULATOR_MISSING)
+            return False
+
+        index = self.game_manager.selection_index
+        if len(index) != len(games):
+            index.rebuild(games)  # The dict was replaced or edited behind GameManager's back
+        other_games = len(index) - (1 if self.current_game_path in index else 0)
+        anything_left = index.has_available(exclude=self.current_game_path)
+        if other_games <= 1 or not anything_left:
+            logging.info("Cannot shuffle: Only one game available or all games are completed.")
+            self._halt(ONE_GAME if anything_left else ALL_COMPLETED)
+            return False
+
+        next_game_path = self.plan.pop(self.policy, self.current_game_path)
+        if next_game_path is None:
+            self._halt(ALL_COMPLETED)
+            return False
+        self._switch_to_game(next_game_path)
+        return True
+
+    def _halt(self, reason):
+        self.running = self.paused = False
+        self.deadline = self.remaining = None
+        self._emit('unavailable', reason)
+
+    def _switch_to_game(self, next_game_path):
+        swap_started = time.perf_counter()
+        save_path = self.state_path_for(self.current_game_path) if self.current_game_path else None
+        state_path = self.state_path_for(next_game_path)
+        self._emit('swap_started', next_game_path, state_path)
+
+        self.swap_in_flight = True
+        self.deadline = None
+        self.emulator.swap(save_path, next_game_path, state_path, self.swap_timeout,
+                           lambda future: self._on_swap_finished(next_game_path, swap_started, future))
+
+    def _on_swap_finished(self, next_game_path, swap_started, future):
+        self.swap_in_flight = False
+        if self.swap_cancelled:
+            self._on_cancelled_swap_finished(next_game_path, future)
+            return
+        next_game_name = self.game_manager.games.get(next_game_path, {}).get('name', os.path.basename(next_game_path))
+        try:
+            result = future.result()
+            if result.status != 'ok':
+                raise RuntimeError(f"Emulator could not swap to {next_game_name}: {result.message}")
+        except CommandTimeout as e:
+            # Don't keep firing swaps into an emulator that stopped answering
+            logging.error(f"Emulator did not respond while switching games: {e}")
+            self.pause(PAUSE_EMULATOR_UNRESPONSIVE)
+            self._emit('swap_failed', next_game_path, e)
+            return
+        except Exception as e:
+            logging.error(f"Error switching to the next game: {e}")
+            self._emit('swap_failed', next_game_path, e)
+        else:
+            if result.message:
+                logging.warning(f"Swapped to {next_game_name} without its saved state: {result.message}")
+            self.game_manager.switch_game(next_game_name)
+            self.last_swap_latency_ms = (time.perf_counter() - swap_started) * 1000
+            logging.info("Swapped to %s in %.1f ms (emulator %.1f ms)", next_game_name,
+                         self.last_swap_latency_ms, result.elapsed_ms)
+            previous_game_path, self.current_game_path = self.current_game_path, next_game_path
+            self.policy.on_swapped(previous_game_path, next_game_path)
+            self._emit('swapped', previous_game_path, next_game_path, result)
+            self.plan_upcoming()
+
+        if self.running and not self.paused:
+            self.schedule_next_swap()
+
+    def _on_cancelled_swap_finished(self, next_game_path, future):
+        """A swap that finished after stop(): keep track of the ROM the emulator now runs, and nothing else."""
+        self.swap_cancelled = False
+        try:
+            swapped = future.result().status == 'ok'
+        except Exception:
+            swapped = False
+        if swapped:
+            # The next run saves the outgoing state of whatever is actually loaded
+            self.current_game_path = next_game_path
+        logging.info("Swap to %s finished after the shuffle stopped; not counting it", next_game_path)
+        if self.running and not self.paused:
+            # Restarted while the swap was in flight; that run's first swap was turned away
+            self.swap_now()
+
+    def plan_upcoming(self):
+        upcoming = self.plan.refill(self.policy, self.current_game_path)
+        self._emit('planned', upcoming)
+        return upcoming
+
+    def schedule_next_swap(self):
+        interval = self.next_interval()
+        logging.info("Scheduling next shuffle in %d seconds", interval)
+        self.deadline = self.clock() + interval
+        self._emit('scheduled', interval)
+
+        if not self.is_emulator_running():
+            self.pause(PAUSE_EMULATOR_MISSING)
+
+
+class SimulatedClock:
+    """A clock that only moves when told to, for running the engine faster than real time."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+class ConnectionEmulator:
+    """Adapts a Python_Client.EmulatorConnection to the engine's emulator interface.
+
+    With ``blocking`` the swap is waited for and the callback runs on the calling
+    thread; otherwise it runs on the connection's event loop thread.
+    """
+
+    def __init__(self, connection, blocking=False):
+        self.connection = connection
+        self.blocking = blocking
+
+    def swap(self, save_path, rom_path, state_path, timeout, callback):
+        future = self.connection.submit(self.connection.client.swap(save_path, rom_path, state_path, timeout))
+        if self.blocking:
+            try:
+                future.result()
+            except Exception:
+                pass  # Delivered through the future
+            callback(future)
+        else:
+            future.add_done_callback(callback)
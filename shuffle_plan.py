@@ -0,0 +1,107 @@
+import os, logging, threading, queue
+from collections import deque, OrderedDict
+
+
+class ShufflePlan:
+    """Upcoming games decided ahead of time, so their files can be warmed before the swap."""
+
+    def __init__(self, lookahead=2):
+        self.lookahead = max(1, lookahead)
+        self.upcoming = deque()
+
+    def clear(self):
+        self.upcoming.clear()
+
+    def peek(self):
+        return list(self.upcoming)
+
+    def refill(self, policy, current_path):
+        """Top the plan up to ``lookahead`` entries picked by a ShufflePolicy, never the same game twice in a row."""
+        previous = self.upcoming[-1] if self.upcoming else current_path
+        while len(self.upcoming) < self.lookahead:
+            path = policy.pick(previous, planned=[current_path, *self.upcoming])
+            if path is None:
+                break
+            previous = path
+            self.upcoming.append(previous)
+        return list(self.upcoming)
+
+    def pop(self, policy, current_path):
+        """Return the next planned game, dropping entries that were removed or completed since planning."""
+        while True:
+            if not self.upcoming:
+                self.refill(policy, current_path)
+                if not self.upcoming:
+                    return None
+            path = self.upcoming.popleft()
+            if policy.is_available(path) and path != current_path:
+                return path
+            logging.info("Dropping stale planned game: %s", path)
+
+
+class Prefetcher:
+    """Reads upcoming ROM and savestate files on a background thread so they are in the OS page cache.
+
+    BizHawk opens the files itself, so warming the page cache is what speeds up the
+    swap; nothing is kept in this process. Files already warmed recently are skipped.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, max_bytes_per_file=1024 * 1024 * 1024, remember=64):
+        self.max_bytes_per_file = max_bytes_per_file
+        self.remember = remember
+        self._warm = OrderedDict()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="Prefetcher", daemon=True)
+        self._thread.start()
+
+    def prefetch(self, paths):
+        for path in paths:
+            if path:
+                self._queue.put(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                for file_path in self.related_files(path):
+                    self._warm_file(file_path)
+            except Exception as e:
+                logging.debug("Prefetch of %s failed: %s", path, e)
+
+    def related_files(self, path):
+        """The file itself plus, for .cue sheets, the tracks they reference."""
+        files = [path]
+        if path.lower().endswith('.cue') and os.path.isfile(path):
+            directory = os.path.dirname(path)
+            with open(path, 'r', errors='replace') as cue:
+                for line in cue:
+                    line = line.strip()
+                    if line.upper().startswith('FILE') and '"' in line:
+                        files.append(os.path.join(directory, line.split('"')[1]))
+        return files
+
+    def _warm_file(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        key = (path, stat.st_mtime, stat.st_size)
+        if key in self._warm:
+            self._warm.move_to_end(key)
+            return
+
+        with open(path, 'rb') as file:
+            if hasattr(os, 'posix_fadvise'):
+                # Let the kernel read ahead asynchronously instead of copying through Python
+                os.posix_fadvise(file.fileno(), 0, min(stat.st_size, self.max_bytes_per_file), os.POSIX_FADV_WILLNEED)
+            else:
+                remaining = self.max_bytes_per_file
+                while remaining > 0 and file.read(min(self.CHUNK_SIZE, remaining)):
+                    remaining -= self.CHUNK_SIZE
+
+        self._warm[key] = True
+        if len(self._warm) > self.remember:
+            self._warm.popitem(last=False)
+        logging.debug("Prefetched %s", path)
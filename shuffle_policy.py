@@ -0,0 +1,142 @@
+import heapq, random, logging
+
+
+class ShufflePolicy:
+    """Decides which game the shuffle engine plays next.
+
+    ``pick(previous, planned)`` returns an available game other than
+    ``previous``; ``planned`` lists games already lined up (and the running
+    one), which a policy may avoid too. ``on_swapped`` is called after every
+    successful swap so a policy can update what it knows, and ``next_interval``
+    may dictate how long the game just swapped to is played.
+    """
+    name = None
+    label = None
+
+    def __init__(self, game_manager, rng=None):
+        self.game_manager = game_manager
+        self.rng = rng or random
+
+    def is_available(self, path):
+        return self.game_manager.selection_index.is_available(path)
+
+    def reset(self):
+        """Forget cached state; called when a shuffle starts."""
+
+    def pick(self, previous, planned=()):
+        raise NotImplementedError
+
+    def on_swapped(self, previous_path, game_path):
+        pass
+
+    def next_interval(self, game_path):
+        """Seconds to play ``game_path`` for, or None to let the engine draw an interval."""
+        return None
+
+
+class RandomPolicy(ShufflePolicy):
+    """Weighted random pick from the selection index, never the same game twice in a row."""
+    name = 'random'
+    label = "Random"
+
+    def pick(self, previous, planned=()):
+        return self.game_manager.selection_index.sample(self.rng, exclude=previous)
+
+
+class FairSharePolicy(ShufflePolicy):
+    """Deficit scheduling: the game with the least play time so far goes next.
+
+    Games sit in a min-heap keyed by (time_spent, swaps) from the StatsTracker,
+    with a random tie-breaker so equal games are not always played in the same
+    order. Updating a game pushes a fresh entry and bumps its version; stale
+    entries are discarded when they reach the top, and unavailable games are
+    parked until they become available again, so a pick stays O(log n).
+    """
+    name = 'fair_share'
+    label = "Fair Share (least played first)"
+
+    def __init__(self, game_manager, rng=None):
+        super().__init__(game_manager, rng)
+        self._heap = []
+        self._versions = {}
+        self._parked = set()
+        self._revision = None
+        self._availability_revision = None
+
+    def reset(self):
+        games = self.game_manager.games
+        self._revision = self.game_manager.selection_index.revision
+        self._availability_revision = self.game_manager.selection_index.availability_revision
+        self._versions = dict.fromkeys(games, 0)
+        self._heap = [self._entry(path, 0) for path in games]
+        heapq.heapify(self._heap)
+        self._parked = set()
+
+    def _entry(self, path, version):
+        name = self.game_manager.games[path]['name']
+        stats = self.game_manager.stats_tracker.game_stats.get(name, {})
+        return stats.get('time_spent', 0), stats.get('swaps', 0), self.rng.random(), path, version
+
+    def refresh(self, path):
+        """Re-key a game after its stats changed."""
+        if path not in self.game_manager.games:
+            return
+        version = self._versions.get(path, 0) + 1
+        self._versions[path] = version
+        self._parked.discard(path)
+        heapq.heappush(self._heap, self._entry(path, version))
+
+    def on_swapped(self, previous_path, game_path):
+        for path in (previous_path, game_path):
+            if path:
+                self.refresh(path)
+
+    def _sync(self):
+        if self._revision != self.game_manager.selection_index.revision:
+            self.reset()  # Games were added or removed
+            return
+        if len(self._heap) > 2 * len(self._versions) + 64:
+            self.reset()  # Mostly stale entries by now; start over compactly
+            return
+        index = self.game_manager.selection_index
+        if self._availability_revision != index.availability_revision:
+            # Games were completed or un-completed; bring back every parked one that can be played again
+            self._availability_revision = index.availability_revision
+            for path in [path for path in self._parked if self.is_available(path)]:
+                self.refresh(path)
+
+    def pick(self, previous, planned=()):
+        self._sync()
+        excluded = set(planned)
+        excluded.add(previous)
+        set_aside = []
+        choice = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            path, version = entry[3], entry[4]
+            if self._versions.get(path) != version:
+                continue  # Superseded by a newer entry
+            if not self.is_available(path):
+                self._parked.add(path)
+                continue
+            set_aside.append(entry)
+            if path not in excluded:
+                choice = path
+                break
+        for entry in set_aside:
+            heapq.heappush(self._heap, entry)
+        if choice is None:
+            logging.debug("Fair share policy found no game to pick")
+        return choice
+
+
+POLICIES = {policy.name: policy for policy in (RandomPolicy, FairSharePolicy)}
+DEFAULT_POLICY = RandomPolicy.name
+
+
+def create_policy(name, game_manager, rng=None):
+    policy_class = POLICIES.get(name)
+    if policy_class is None:
+        logging.warning(f"Unknown shuffle policy '{name}', using {DEFAULT_POLICY}")
+        policy_class = POLICIES[DEFAULT_POLICY]
+    return policy_class(game_manager, rng)
@@ -0,0 +1,141 @@
+import json, random, logging
+from collections import deque
+from itertools import islice
+from selection_index import SelectionIndex
+from shuffle_policy import ShufflePolicy, RandomPolicy, POLICIES, DEFAULT_POLICY, create_policy
+
+SCHEDULE_FORMAT = 'retro-roulette-schedule'
+SCHEDULE_VERSION = 1
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(63)
+
+
+def generate_schedule(games, seed, min_interval=30, max_interval=60, steps=None):
+    """Yield (game_path, interval) pairs from ``seed``, lazily and forever unless ``steps`` is given.
+
+    Games are indexed in (name, path) order, so runners with the same library
+    get the same sequence of games even when their ROMs live in different
+    places. Completed games are left out and no game follows itself. Each step
+    is O(log n), and nothing is kept between steps.
+
+    A seeded session running the Random policy plays exactly this sequence
+    (see ``SeededRandomPolicy``); other policies only replay it through
+    ``ReplayPolicy``.
+    """
+    rng = random.Random(seed)
+    ordered = sorted(games.items(), key=lambda item: (item[1].get('name', ''), item[0]))
+    index = SelectionIndex(dict(ordered))
+    previous, step = None, 0
+    while steps is None or step < steps:
+        path = index.sample(rng, exclude=previous)
+        if path is None:
+            return
+        yield path, rng.randint(min_interval, max_interval)
+        previous, step = path, step + 1
+
+
+def export_schedule(file_path, games, seed, min_interval=30, max_interval=60, steps=1000):
+    """Write a schedule as JSON lines: a header, then one ``[game_name, interval]`` per step.
+
+    Steps are streamed to the file as they are generated. Returns how many were written.
+    A live run with the same seed, intervals and games under the Random policy
+    follows the exported plan step for step.
+    """
+    header = {'format': SCHEDULE_FORMAT, 'version': SCHEDULE_VERSION, 'seed': seed,
+              'min_interval': min_interval, 'max_interval': max_interval, 'steps': steps}
+    written = 0
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(header) + '\n')
+        for path, interval in generate_schedule(games, seed, min_interval, max_interval, steps):
+            file.write(json.dumps([games[path].get('name', path), interval]) + '\n')
+            written += 1
+    return written
+
+
+def read_schedule_header(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        header = json.loads(file.readline() or '{}')
+    if header.get('format') != SCHEDULE_FORMAT:
+        raise ValueError(f"{file_path} is not a shuffle schedule")
+    return header
+
+
+def read_schedule(file_path):
+    """Yield the (game_name, interval) steps of an exported schedule, one line at a time."""
+    read_schedule_header(file_path)
+    with open(file_path, 'r', encoding='utf-8') as file:
+        file.readline()
+        for line in file:
+            if line.strip():
+                game, interval = json.loads(line)
+                yield game, interval
+
+
+class ReplayPolicy(ShufflePolicy):
+    """Plays a precomputed schedule of (game, interval) steps in order.
+
+    Steps may name a game by path or by name. Steps whose game is missing,
+    completed or already running are skipped, so a replay only matches the
+    original while the same games are available.
+    """
+    name = 'replay'
+    label = "Replay"
+
+    def __init__(self, game_manager, schedule, rng=None):
+        super().__init__(game_manager, rng)
+        self._schedule = iter(schedule)
+        self._intervals = deque()  # (game_path, interval) of picked steps not yet started
+        self._paths_by_name = None
+        self._revision = None
+
+    def _resolve(self, game):
+        if game in self.game_manager.games:
+            return game
+        index = self.game_manager.selection_index
+        if self._revision != index.revision:
+            self._paths_by_name = {}
+            for path, info in self.game_manager.games.items():
+                self._paths_by_name.setdefault(info.get('name'), path)
+            self._revision = index.revision
+        return self._paths_by_name.get(game)
+
+    def pick(self, previous, planned=()):
+        for game, interval in self._schedule:
+            path = self._resolve(game)
+            if path is None or path == previous or not self.is_available(path):
+                logging.info("Skipping scheduled game that cannot be played now: %s", game)
+                continue
+            self._intervals.append((path, interval))
+            return path
+        return None
+
+    def next_interval(self, game_path):
+        while self._intervals:
+            path, interval = self._intervals.popleft()
+            if path == game_path:
+                return interval
+        return None
+
+
+class SeededRandomPolicy(ReplayPolicy):
+    """The Random policy of a seeded session, drawn from ``generate_schedule``.
+
+    Live runs thus make the same picks and intervals as a schedule exported
+    with the same seed. ``step`` skips the swaps a resumed session already made.
+    Games added after the run starts are not in the schedule until it restarts.
+    """
+    name = RandomPolicy.name
+    label = RandomPolicy.label
+
+    def __init__(self, game_manager, seed, min_interval=30, max_interval=60, step=0, rng=None):
+        schedule = generate_schedule(game_manager.games, seed, min_interval, max_interval)
+        super().__init__(game_manager, islice(schedule, step, None), rng)
+
+
+def create_seeded_policy(name, game_manager, seed, min_interval=30, max_interval=60, step=0, rng=None):
+    """Like ``create_policy``, but a seeded Random run follows the schedule ``export_schedule`` writes."""
+    if seed is not None and POLICIES.get(name, POLICIES[DEFAULT_POLICY]) is RandomPolicy:
+        return SeededRandomPolicy(game_manager, seed, min_interval, max_interval, step, rng)
+    return create_policy(name, game_manager, rng)
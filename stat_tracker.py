@@ -1,31 +1,149 @@
-import time, os, logging
+import time, os, logging, threading
 
 class StatsTracker:
-    def __init__(self, initial_stats=None):
+    """Swap counts and play time per game.
+
+    Play time comes from the emulated frames the emulator reports through
+    ``add_emulated_frames``, so loading screens, pauses and stalls don't count.
+    Until the first report of a stint arrives (or with servers that don't send
+    any) the time is measured with the monotonic clock instead.
+
+    With an ``event_log`` (event_log.SessionEventLog) every start, end and
+    reset is also appended to it. A new log is seeded from ``initial_stats``;
+    an existing one is reconciled with them (see ``_reconcile_with_log``) when
+    the stats are first used, so loading a session doesn't replay its log.
+    """
+
+    def __init__(self, initial_stats=None, event_log=None):
         if initial_stats is not None:
-            self.game_stats = initial_stats.get('game_stats', {})
-            self.total_swaps = initial_stats.get('total_swaps', 0)
-            self.total_shuffling_time = initial_stats.get('total_shuffling_time', 0)
+            self._game_stats = initial_stats.get('game_stats', {})
+            self._total_swaps = initial_stats.get('total_swaps', 0)
+            self._total_shuffling_time = initial_stats.get('total_shuffling_time', 0)
         else:
-            self.game_stats = {}
-            self.total_swaps = 0
-            self.total_shuffling_time = 0
-        self.start_time = time.time()
+            self._game_stats = {}
+            self._total_swaps = 0
+            self._total_shuffling_time = 0
+        # Held while the stats change, so the session writer thread never copies a half-updated game
+        self.lock = threading.RLock()
+        self.event_log = event_log
+        self._reconcile_pending = None  # Whether there were initial stats, until the log has been reconciled
+        if event_log is not None and not event_log.seed(self._game_stats, self._total_swaps,
+                                                        self._total_shuffling_time):
+            self._reconcile_pending = initial_stats is not None
+        self.start_time = time.monotonic()
+        self.emulated_time = None
+        # Game names whose stats changed since the session was last written
+        self.changed_games = set()
+        self.all_games_changed = True
+
+    def _reconcile_once(self):
+        if self._reconcile_pending is not None:
+            with self.lock:
+                if self._reconcile_pending is not None:
+                    has_initial_stats, self._reconcile_pending = self._reconcile_pending, None
+                    self._reconcile_with_log(has_initial_stats)
+
+    @property
+    def game_stats(self):
+        self._reconcile_once()
+        return self._game_stats
+
+    @game_stats.setter
+    def game_stats(self, value):
+        self._game_stats = value
+
+    @property
+    def total_swaps(self):
+        self._reconcile_once()
+        return self._total_swaps
+
+    @total_swaps.setter
+    def total_swaps(self, value):
+        self._total_swaps = value
+
+    @property
+    def total_shuffling_time(self):
+        self._reconcile_once()
+        return self._total_shuffling_time
+
+    @total_shuffling_time.setter
+    def total_shuffling_time(self, value):
+        self._total_shuffling_time = value
+
+    def _reconcile_with_log(self, has_initial_stats):
+        """Pick between the stats the session was saved with and what its existing event log adds up to.
+
+        The log may legitimately be ahead: swaps appended after the session's
+        last write, before a crash. Anything else (the session imported,
+        replaced or edited elsewhere) means the saved stats are the ones to
+        keep, and the log is rebased onto them.
+        """
+        log_stats, log_swaps, log_time = self.event_log.aggregate()
+        log_path = self.event_log.log_path
+        if not has_initial_stats or (log_swaps == self._total_swaps and
+                                     abs(log_time - self._total_shuffling_time) < 1):
+            pass
+        elif log_swaps >= self._total_swaps and log_time >= self._total_shuffling_time:
+            logging.warning(f"{log_path} is ahead of the saved session ({log_swaps} swaps against "
+                            f"{self._total_swaps}); using the log's stats")
+        else:
+            logging.warning(f"{log_path} does not match the saved session ({log_swaps} swaps against "
+                            f"{self._total_swaps}); keeping the session's stats and rebasing the log on them")
+            self.event_log.rebase(self._game_stats, self._total_swaps, self._total_shuffling_time)
+            return
+        self._game_stats, self._total_swaps, self._total_shuffling_time = log_stats, log_swaps, log_time
+
+    def take_changes(self):
+        """Game names changed since the last call, or None when every game's stats have to be written."""
+        if self.all_games_changed:
+            self.all_games_changed = False
+            self.changed_games.clear()
+            return None
+        changed = set()
+        while self.changed_games:
+            changed.add(self.changed_games.pop())
+        return changed
+
+    def snapshot(self, game_names=None):
+        """A copy of (game_stats, total_swaps, total_time), with only ``game_names`` when given."""
+        with self.lock:
+            names = self.game_stats if game_names is None else [name for name in game_names if name in self.game_stats]
+            return ({name: dict(self.game_stats[name]) for name in names}, self.total_swaps,
+                    self.total_shuffling_time)
 
     def start_game(self, game_name):
-        self.total_swaps += 1
-        self.start_time = time.time()
-        if game_name not in self.game_stats:
-            self.game_stats[game_name] = {'swaps': 0, 'time_spent': 0}
-        self.game_stats[game_name]['swaps'] += 1
+        with self.lock:
+            self.total_swaps += 1
+            self.start_time = time.monotonic()
+            self.emulated_time = None
+            if game_name not in self.game_stats:
+                self.game_stats[game_name] = {'swaps': 0, 'time_spent': 0}
+            self.game_stats[game_name]['swaps'] += 1
+            self.changed_games.add(game_name)
+        if self.event_log is not None:
+            self.event_log.record_start(game_name)
+
+    def add_emulated_frames(self, frames, frame_rate):
+        if frame_rate > 0:
+            self.emulated_time = (self.emulated_time or 0.0) + frames / frame_rate
+
+    def current_time_spent(self):
+        """Play time of the game started last, up to now."""
+        if self.emulated_time is not None:
+            return self.emulated_time
+        return time.monotonic() - self.start_time if self.start_time else 0
 
     def end_game(self, game_name):
         if game_name in self.game_stats and self.start_time:
-            time_spent = time.time() - self.start_time
-            self.game_stats[game_name]['time_spent'] += time_spent
-            self.game_stats[game_name]['formatted_time_spent'] = self.format_time(time_spent)
-            self.total_shuffling_time += time_spent
-            self.total_formatted_shuffling_time = self.format_time(self.total_shuffling_time)
+            time_spent = self.current_time_spent()
+            with self.lock:
+                self.game_stats[game_name]['time_spent'] += time_spent
+                self.game_stats[game_name]['formatted_time_spent'] = self.format_time(time_spent)
+                self.total_shuffling_time += time_spent
+                self.total_formatted_shuffling_time = self.format_time(self.total_shuffling_time)
+                self.changed_games.add(game_name)
+            if self.event_log is not None:
+                self.event_log.record_end(game_name, time_spent)
 
     def format_time(self, seconds):
         hours, remainder = divmod(int(seconds), 3600)
@@ -36,12 +154,19 @@ class StatsTracker:
         return self.game_stats, self.total_swaps, self.total_shuffling_time
 
     def reset_all_stats(self):
-        for game_name in self.game_stats:
-            self.game_stats[game_name] = {'swaps': 0, 'time_spent': 0}
-        self.total_swaps = 0
-        self.total_shuffling_time = 0
-        self.start_time = time.time()
+        with self.lock:
+            for game_name in self.game_stats:
+                self.game_stats[game_name] = {'swaps': 0, 'time_spent': 0}
+            self.total_swaps = 0
+            self.total_shuffling_time = 0
+            self.all_games_changed = True
+        self.start_time = time.monotonic()
+        if self.emulated_time is not None:
+            self.emulated_time = 0.0
         self.total_formatted_shuffling_time = self.format_time(self.total_shuffling_time)
+        if self.event_log is not None:
+            self.event_log.record_reset()
+            self.event_log.checkpoint()
         
 
 
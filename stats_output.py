@@ -0,0 +1,270 @@
+import os, json, base64, hashlib, asyncio, logging, threading, struct
+
+OVERLAY_HOST = "127.0.0.1"
+OVERLAY_PORT = 8765
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_CLIENT_BUFFER = 256 * 1024  # Bytes queued for an overlay that stopped reading before it is dropped
+
+# Stat keys, in display order, with their overlay labels; each is also written to <key>.txt
+STAT_LABELS = {
+    'current_game': "Current Game",
+    'current_game_swaps': "Current Game Swaps",
+    'current_game_time': "Current Game Time",
+    'total_swaps': "Total Swaps",
+    'total_time': "Total Time",
+}
+
+
+class StatsFileWriter:
+    """Writes each stat to ``<directory>/<key>.txt`` for OBS text sources, only when it changed.
+
+    Files are replaced atomically so OBS never reads a half-written value. If a
+    file is locked (OBS reading it on Windows), the write is retried on the
+    next update.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._written = {}
+
+    def write(self, stats):
+        changed = {key: str(value) for key, value in stats.items() if self._written.get(key) != str(value)}
+        if not changed:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        for key, value in changed.items():
+            path = os.path.join(self.directory, f"{key}.txt")
+            temp_path = path + '.tmp'
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as file:
+                    file.write(value)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logging.debug(f"Could not write {path}, will retry: {e}")
+                continue
+            self._written[key] = value
+        return len(changed)
+
+
+class OverlayServer:
+    """Local HTTP + WebSocket server for an OBS browser source.
+
+    ``GET /`` serves an overlay page, ``GET /stats.json`` the current stats, and
+    ``/ws`` is a WebSocket that gets a ``snapshot`` message on connecting and
+    ``delta`` messages with only the stats that changed afterwards. ``publish``
+    may be called from any thread; the server runs its own event loop thread
+    and needs nothing outside the standard library. An overlay that stops
+    reading (a hidden or stalled browser source) is disconnected once
+    ``max_client_buffer`` bytes are queued for it; it gets a fresh snapshot
+    when it reconnects.
+    """
+
+    def __init__(self, host=OVERLAY_HOST, port=OVERLAY_PORT, max_client_buffer=MAX_CLIENT_BUFFER):
+        self.host = host
+        self.port = port
+        self.max_client_buffer = max_client_buffer
+        self.stats = {}
+        self.messages_sent = 0
+        self.clients_dropped = 0
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return self.port
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="OverlayServer", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if self._server is None:
+            self._thread = None
+            raise OSError(f"Could not start the overlay server on {self.host}:{self.port}")
+        return self.port
+
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            logging.info(f"Overlay server listening on http://{self.host}:{self.port}/")
+        except OSError as e:
+            logging.error(f"Could not start the overlay server: {e}")
+            self._server = None
+            ready.set()
+            return
+        ready.set()
+        self._loop.run_forever()
+
+    def stop(self):
+        if self._loop is None or self._server is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            self._loop.stop()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join(timeout=2)
+        self._thread = self._server = None
+
+    def client_count(self):
+        return len(self._clients)
+
+    def publish(self, stats):
+        """Push the stats that changed since the last call to every connected overlay."""
+        with self._lock:
+            delta = {key: value for key, value in stats.items() if self.stats.get(key) != value}
+            if not delta:
+                return {}
+            self.stats.update(delta)
+        if self._loop is not None and self._server is not None:
+            # _clients belongs to the loop thread; the broadcast checks and encodes there too
+            self._loop.call_soon_threadsafe(self._broadcast, delta)
+        return delta
+
+    def _broadcast(self, delta):
+        if not self._clients:
+            return
+        frame = encode_websocket_frame(json.dumps({'type': 'delta', 'stats': delta}).encode())
+        for writer in list(self._clients):
+            if writer.is_closing():
+                self._clients.discard(writer)
+                continue
+            if writer.transport.get_write_buffer_size() > self.max_client_buffer:
+                logging.warning("Dropping an overlay client that stopped reading updates")
+                self._clients.discard(writer)
+                self.clients_dropped += 1
+                writer.transport.abort()  # close() would wait to send everything still queued
+                continue
+            writer.write(frame)
+            self.messages_sent += 1
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2 or request_line[0] != 'GET':
+                self._respond(writer, 405, 'text/plain', b"Method not allowed")
+                return
+            path = request_line[1].split('?')[0]
+            if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self._serve_websocket(reader, writer, headers)
+            elif path == '/':
+                self._respond(writer, 200, 'text/html; charset=utf-8', OVERLAY_PAGE.encode())
+            elif path == '/stats.json':
+                with self._lock:
+                    body = json.dumps(self.stats).encode()
+                self._respond(writer, 200, 'application/json', body)
+            else:
+                self._respond(writer, 404, 'text/plain', b"Not found")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.error(f"Overlay server error: {e}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, status, content_type, body):
+        reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nCache-Control: no-store\r\nConnection: close\r\n\r\n"
+                     .encode() + body)
+
+    async def _serve_websocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1((headers.get('sec-websocket-key', '') + WEBSOCKET_GUID)
+                                               .encode()).digest()).decode()
+        writer.write(f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode())
+        with self._lock:
+            snapshot = json.dumps({'type': 'snapshot', 'stats': self.stats})
+        writer.write(encode_websocket_frame(snapshot.encode()))
+        self._clients.add(writer)
+        # Overlays only listen; read frames just to answer pings and notice closes
+        while True:
+            opcode, payload = await read_websocket_frame(reader)
+            if opcode == 0x8:
+                writer.write(encode_websocket_frame(payload[:2], opcode=0x8))
+                await writer.drain()
+                return
+            if opcode == 0x9:
+                writer.write(encode_websocket_frame(payload, opcode=0xA))
+
+
+def encode_websocket_frame(payload, opcode=0x1):
+    """An unmasked, unfragmented server frame (RFC 6455)."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack(">BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_websocket_frame(reader):
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack(">H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack(">Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return first & 0x0F, payload
+
+
+# Add ?show=current_game,total_time to the URL to pick stats; style it with OBS's custom CSS
+OVERLAY_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Retro Roulette Overlay</title>
+<style>
+  body { margin: 0; background: transparent; color: #fff; font: 28px sans-serif; text-shadow: 0 0 4px #000; }
+  .stat .label { opacity: 0.8; }
+</style>
+</head>
+<body>
+<div id="stats"></div>
+<script>
+const LABELS = """ + json.dumps(STAT_LABELS) + """;
+const show = new URLSearchParams(location.search).get("show");
+const keys = show ? show.split(",") : Object.keys(LABELS);
+const container = document.getElementById("stats");
+const values = {};
+for (const key of keys) {
+  const row = document.createElement("div");
+  row.className = "stat " + key;
+  row.innerHTML = '<span class="label"></span> <span class="value"></span>';
+  row.querySelector(".label").textContent = (LABELS[key] || key) + ":";
+  container.appendChild(row);
+  values[key] = row.querySelector(".value");
+}
+function connect() {
+  const socket = new WebSocket("ws://" + location.host + "/ws");
+  socket.onmessage = (event) => {
+    const stats = JSON.parse(event.data).stats;
+    for (const key in stats) {
+      if (values[key]) values[key].textContent = stats[key];
+    }
+  };
+  socket.onclose = () => setTimeout(connect, 2000);
+}
+connect();
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,118 @@
+from shuffle_engine import SimulatedClock
+from action_queue import ActionQueue, FORCE_SWAP, PAUSE, TOGGLE_COMPLETION
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+        self.swap_result = True
+
+    def force_swap(self):
+        self.calls.append('swap')
+        return self.swap_result
+
+    def pause(self):
+        self.calls.append('pause')
+
+    def resume(self):
+        self.calls.append('resume')
+
+    def toggle(self):
+        self.calls.append('toggle')
+
+
+def make_queue(**options):
+    clock, recorder = SimulatedClock(), Recorder()
+    queue = ActionQueue(recorder.force_swap, recorder.pause, recorder.resume, recorder.toggle, clock=clock, **options)
+    return queue, recorder, clock
+
+
+def test_burst_of_force_swaps_collapses_into_one():
+    queue, recorder, clock = make_queue(swap_cooldown=5)
+    assert queue.submit_force_swap()
+    assert not any(queue.submit_force_swap() for _ in range(9))
+    queue.process()
+    assert recorder.calls == ['swap']
+    assert queue.submit_force_swap() is False  # Within the cooldown of the swap just made
+    assert queue.coalesced[FORCE_SWAP] == 10
+    assert queue.next_wakeup() is None
+
+
+def test_queued_swaps_wait_for_the_cooldown():
+    queue, recorder, clock = make_queue(swap_cooldown=5, max_queued_swaps=1)
+    queue.submit_force_swap()
+    queue.process()
+    assert queue.submit_force_swap()
+    assert not queue.submit_force_swap()
+    queue.process()
+    assert recorder.calls == ['swap']
+    assert queue.next_wakeup() == 5
+    clock.advance(5)
+    queue.process()
+    assert recorder.calls == ['swap', 'swap']
+
+
+def test_refused_swap_is_retried_then_dropped_when_stale():
+    queue, recorder, clock = make_queue(stale_after=2)
+    recorder.swap_result = False
+    queue.submit_force_swap()
+    queue.process()
+    assert queue.next_wakeup() == ActionQueue.RETRY_INTERVAL
+    assert queue.depth() == 1
+    clock.advance(3)
+    queue.process()
+    assert queue.depth() == 0
+    assert queue.dropped[FORCE_SWAP] == 1
+    assert queue.executed[FORCE_SWAP] == 0
+
+
+def test_overlapping_pauses_merge_until_the_latest_end():
+    queue, recorder, clock = make_queue()
+    assert queue.submit_pause(10)
+    queue.process()
+    clock.advance(4)
+    assert not queue.submit_pause(10)  # Now lasts until 14
+    clock.advance(6)
+    queue.process()
+    assert recorder.calls == ['pause']
+    assert queue.next_wakeup() == 4
+    clock.advance(4)
+    queue.process()
+    assert recorder.calls == ['pause', 'resume']
+    assert queue.executed[PAUSE] == 1
+    assert queue.coalesced[PAUSE] == 1
+
+
+def test_toggle_key_repeat_is_debounced():
+    queue, recorder, clock = make_queue(debounce=0.5)
+    assert queue.submit_toggle_completion()
+    clock.advance(0.1)
+    assert not queue.submit_toggle_completion()
+    clock.advance(0.5)
+    assert queue.submit_toggle_completion()
+    queue.process()
+    assert recorder.calls == ['toggle', 'toggle']
+    assert queue.coalesced[TOGGLE_COMPLETION] == 1
+
+
+def test_clear_drops_everything_pending():
+    queue, recorder, clock = make_queue()
+    queue.submit_force_swap()
+    queue.submit_pause(5)
+    queue.submit_toggle_completion()
+    queue.clear()
+    queue.process()
+    assert recorder.calls == []
+    assert queue.get_metrics()['dropped'] == {FORCE_SWAP: 1, PAUSE: 1, TOGGLE_COMPLETION: 1}
+
+
+def test_failing_callback_is_counted_as_dropped():
+    queue, recorder, clock = make_queue()
+
+    def broken():
+        raise RuntimeError("emulator went away")
+    queue.force_swap = broken
+    queue.submit_force_swap()
+    queue.process()
+    assert queue.depth() == 0
+    assert queue.dropped[FORCE_SWAP] == 1
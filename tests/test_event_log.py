@@ -0,0 +1,129 @@
+import json
+
+from event_log import SessionEventLog, LOG_FILE, CHECKPOINT_FILE
+from session_manager import SessionWriter
+from stat_tracker import StatsTracker
+
+
+def play(log, *games):
+    for game in games:
+        log.record_start(game)
+        log.record_end(game, 2.0)
+
+
+def test_aggregate_adds_up_the_records(tmp_path):
+    log = SessionEventLog(str(tmp_path))
+    play(log, 'a', 'b', 'a')
+    log.close()
+    game_stats, total_swaps, total_time = SessionEventLog(str(tmp_path)).aggregate()
+    assert total_swaps == 3 and total_time == 6.0
+    assert {name: stats['swaps'] for name, stats in game_stats.items()} == {'a': 2, 'b': 1}
+
+
+def test_torn_trailing_record_is_skipped_then_truncated(tmp_path):
+    log = SessionEventLog(str(tmp_path))
+    play(log, 'a')
+    log.close()
+    with open(tmp_path / LOG_FILE, 'a') as file:
+        file.write('["s",123.0,"b"')  # A crash mid-write
+    reopened = SessionEventLog(str(tmp_path))
+    assert reopened.aggregate()[1] == 1
+    play(reopened, 'c')
+    reopened.close()
+    lines = (tmp_path / LOG_FILE).read_text().splitlines()
+    assert all(json.loads(line) for line in lines)
+    assert SessionEventLog(str(tmp_path)).aggregate()[1] == 2
+
+
+def test_reset_zeroes_the_totals(tmp_path):
+    log = SessionEventLog(str(tmp_path))
+    log.aggregate()
+    play(log, 'a', 'b')
+    log.record_reset()
+    play(log, 'b')
+    log.close()
+    game_stats, total_swaps, total_time = SessionEventLog(str(tmp_path)).aggregate()
+    assert (total_swaps, total_time) == (1, 2.0)
+    assert game_stats['a'] == {'swaps': 0, 'time_spent': 0}
+
+
+def test_checkpoint_bounds_the_replay(tmp_path):
+    log = SessionEventLog(str(tmp_path), checkpoint_every=10)
+    log.aggregate()
+    play(log, *['a'] * 12)  # 24 records: checkpoints after 10 and 20
+    log.close()
+    reopened = SessionEventLog(str(tmp_path))
+    assert reopened.aggregate()[1] == 12
+    assert reopened.replayed == 4
+
+
+def test_checkpoint_goes_through_the_writer(tmp_path):
+    writer = SessionWriter(delay=30, max_delay=60)
+    log = SessionEventLog(str(tmp_path), checkpoint_every=4, writer=writer)
+    log.aggregate()
+    play(log, 'a', 'b')
+    assert writer.is_dirty(log.checkpoint_path)
+    assert not (tmp_path / CHECKPOINT_FILE).exists()
+    log.close()  # Flushes the pending checkpoint
+    checkpoint = json.loads((tmp_path / CHECKPOINT_FILE).read_text())
+    assert checkpoint['total_swaps'] == 2
+    assert checkpoint['offset'] == (tmp_path / LOG_FILE).stat().st_size
+
+
+def test_checkpoint_beyond_the_log_replays_from_the_start(tmp_path):
+    log = SessionEventLog(str(tmp_path), checkpoint_every=2)
+    log.aggregate()
+    play(log, 'a', 'b')
+    log.close()
+    (tmp_path / LOG_FILE).write_text('["s",1.0,"a"]\n')  # Lost everything but the first record
+    assert SessionEventLog(str(tmp_path)).aggregate()[1] == 1
+
+
+def test_seed_only_starts_a_new_log(tmp_path):
+    log = SessionEventLog(str(tmp_path))
+    assert log.seed({'a': {'swaps': 3, 'time_spent': 30}}, 3, 30)
+    assert not log.seed({}, 0, 0)
+    play(log, 'a')
+    log.close()
+    game_stats, total_swaps, total_time = SessionEventLog(str(tmp_path)).aggregate()
+    assert (total_swaps, total_time, game_stats['a']['swaps']) == (4, 32.0, 4)
+
+
+def saved(swaps, time_spent, name='a'):
+    return {'game_stats': {name: {'swaps': swaps, 'time_spent': time_spent}},
+            'total_swaps': swaps, 'total_shuffling_time': time_spent}
+
+
+def test_tracker_prefers_a_log_that_is_ahead(tmp_path):
+    log = SessionEventLog(str(tmp_path))
+    log.seed({'a': {'swaps': 2, 'time_spent': 4}}, 2, 4)
+    play(log, 'a')
+    log.close()
+    tracker = StatsTracker(saved(2, 4), event_log=SessionEventLog(str(tmp_path)))
+    assert (tracker.total_swaps, tracker.total_shuffling_time) == (3, 6.0)
+
+
+def test_tracker_rebases_a_log_that_disagrees_with_the_saved_stats(tmp_path, caplog):
+    log = SessionEventLog(str(tmp_path))
+    play(log, 'a', 'a')
+    log.close()
+    # The session was imported or replaced: its stats are what counts now
+    tracker = StatsTracker(saved(50, 500, name='b'), event_log=SessionEventLog(str(tmp_path)))
+    assert tracker.total_swaps == 50
+    assert "does not match" in caplog.text
+    tracker.start_game('b')
+    tracker.event_log.close()
+    game_stats, total_swaps, _ = SessionEventLog(str(tmp_path)).aggregate()
+    assert total_swaps == 51 and game_stats['b']['swaps'] == 51 and 'a' not in game_stats
+
+
+def test_tracker_reads_the_log_only_when_its_stats_are_first_used(tmp_path):
+    log = SessionEventLog(str(tmp_path))
+    log.seed({'a': {'swaps': 2, 'time_spent': 4}}, 2, 4)
+    play(log, 'a')
+    log.close()
+    reopened = SessionEventLog(str(tmp_path))
+    tracker = StatsTracker(saved(2, 4), event_log=reopened)
+    assert reopened._stats is None
+    assert tracker.game_stats['a']['swaps'] == 3
+    assert reopened._stats is not None
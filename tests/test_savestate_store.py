@@ -0,0 +1,64 @@
+import os, hashlib
+
+import pytest
+
+from savestate_store import SavestateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SavestateStore(str(tmp_path / 'store'), max_workers=1)
+    yield store
+    store.shutdown()
+
+
+def write_state(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_put_and_materialize_round_trip(store, tmp_path):
+    state_path = write_state(tmp_path / 'a.state', b'state a' * 1000)
+    digest, size, newly_stored = store.put_async(state_path).result()
+    assert digest == hashlib.sha256(b'state a' * 1000).hexdigest() and size == 7000 and newly_stored
+    assert store.put_async(state_path).result()[2] is False
+    store.materialize(digest, str(tmp_path / 'out' / 'a.state'))
+    assert (tmp_path / 'out' / 'a.state').read_bytes() == b'state a' * 1000
+    assert not [name for name in os.listdir(tmp_path / 'out') if name.endswith('.tmp')]
+
+
+def test_garbage_collection_keeps_digests_until_released(store, tmp_path):
+    future = store.put_async(write_state(tmp_path / 'a.state', b'a'))
+    digest = future.result()[0]
+    assert store.collect_garbage(set()) == 0
+    assert store.has(digest)
+    store.release(future)
+    assert store.collect_garbage({digest}) == 0
+    assert store.collect_garbage(set()) == 1
+    assert not store.has(digest)
+
+
+def test_release_drops_the_working_file_unless_it_changed(store, tmp_path):
+    state_path = write_state(tmp_path / 'a.state', b'a')
+    future = store.put_async(state_path)
+    future.result()
+    store.release(future, drop_source=True)
+    assert not os.path.exists(state_path)
+
+    state_path = write_state(tmp_path / 'b.state', b'b')
+    future = store.put_async(state_path)
+    future.result()
+    write_state(tmp_path / 'b.state', b'newer b')  # The emulator saved again meanwhile
+    store.release(future, drop_source=True)
+    assert os.path.exists(state_path)
+
+
+def test_put_many_async_resolves_to_every_ingest(store, tmp_path):
+    paths = [write_state(tmp_path / f'{name}.state', name.encode()) for name in 'abc']
+    ingests = store.put_many_async(paths + [str(tmp_path / 'missing.state')]).result(timeout=30)
+    assert sorted(ingests) == sorted(paths)
+    assert {future.result()[0] for future in ingests.values()} == {
+        hashlib.sha256(name.encode()).hexdigest() for name in 'abc'}
+    assert store.put_many_async([]).result() == {}
+    assert store.put_many(paths) == {path: hashlib.sha256(name.encode()).hexdigest()
+                                     for path, name in zip(paths, 'abc')}
@@ -0,0 +1,89 @@
+import random
+from collections import Counter
+
+from selection_index import SelectionIndex
+
+
+def games(count, completed=()):
+    return {f"/roms/{i}.nes": {'name': f"Game {i}", 'completed': i in completed} for i in range(count)}
+
+
+def prefix_sums(index):
+    return [index._prefix_sum(count) for count in range(len(index._weights) + 1)]
+
+
+def test_prefix_sums_match_the_weights():
+    index = SelectionIndex(games(37, completed={3, 8}))
+    expected, total = [0.0], 0.0
+    for weight in index._weights:
+        total += weight
+        expected.append(total)
+    assert prefix_sums(index) == expected
+    assert index.available_count() == 35
+
+
+def test_find_lands_on_the_slot_owning_the_target():
+    index = SelectionIndex({f"/roms/{i}.nes": {'name': str(i), 'weight': i + 1} for i in range(10)})
+    for slot in range(10):
+        start = index._prefix_sum(slot)
+        assert index._find(start) == slot
+        assert index._find(start + index._weights[slot] - 0.5) == slot
+
+
+def test_completed_games_are_never_sampled():
+    library = games(20, completed=set(range(0, 20, 2)))
+    index = SelectionIndex(library)
+    rng = random.Random(7)
+    picks = {index.sample(rng) for _ in range(500)}
+    assert picks == {path for path, game in library.items() if not game['completed']}
+
+
+def test_sample_excludes_the_given_game_and_leaves_the_tree_intact():
+    index = SelectionIndex(games(3))
+    before = prefix_sums(index)
+    rng = random.Random(1)
+    assert all(index.sample(rng, exclude="/roms/0.nes") != "/roms/0.nes" for _ in range(200))
+    assert prefix_sums(index) == before
+
+
+def test_sample_follows_the_weights():
+    index = SelectionIndex({"/a": {'name': 'a', 'weight': 1}, "/b": {'name': 'b', 'weight': 3}})
+    rng = random.Random(3)
+    counts = Counter(index.sample(rng) for _ in range(4000))
+    assert 0.7 < counts["/b"] / 4000 < 0.8
+
+
+def test_nothing_left_to_pick():
+    index = SelectionIndex(games(2, completed={1}))
+    assert index.has_available()
+    assert not index.has_available(exclude="/roms/0.nes")
+    assert index.sample(exclude="/roms/0.nes") is None
+    assert SelectionIndex().sample() is None
+
+
+def test_update_completion_and_availability_revision():
+    library = games(4)
+    index = SelectionIndex(library)
+    revision, availability = index.revision, index.availability_revision
+    library["/roms/2.nes"]['completed'] = True
+    index.update("/roms/2.nes", library["/roms/2.nes"])
+    assert not index.is_available("/roms/2.nes")
+    assert index.available_count() == 3
+    assert index.revision == revision
+    assert index.availability_revision == availability + 1
+    index.update("/roms/2.nes", library["/roms/2.nes"])  # No change, no new revision
+    assert index.availability_revision == availability + 1
+
+
+def test_removed_slots_are_reused_and_growth_keeps_sums():
+    index = SelectionIndex(games(16))
+    index.remove("/roms/5.nes")
+    assert "/roms/5.nes" not in index
+    assert len(index) == 15
+    index.add("/new.nes", {'name': 'new'})
+    assert index._slots["/new.nes"] == 5
+    for i in range(40):  # Past the initial capacity
+        index.add(f"/more/{i}.nes", {'name': str(i)})
+    assert len(index) == 56
+    assert index.available_count() == 56
+    assert prefix_sums(index)[-1] == 56.0
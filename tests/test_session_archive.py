@@ -0,0 +1,187 @@
+import json, os, zlib, hashlib, zipfile
+
+import pytest
+
+from savestate_store import SavestateStore
+from session_manager import SessionManager
+from session_archive import (export_session, import_session, read_manifest, ArchiveError, ArchiveCancelled,
+                             ARCHIVE_FORMAT, ARCHIVE_VERSION, MANIFEST_NAME, SESSION_NAME)
+
+
+@pytest.fixture
+def setup(tmp_path):
+    manager = SessionManager(str(tmp_path / 'sessions'))
+    store = SavestateStore(str(tmp_path / 'store'), max_workers=1)
+    yield manager, store, tmp_path
+    store.shutdown()
+
+
+def make_session(manager, store, tmp_path):
+    manager.create_session('S')
+    folder = os.path.join(manager.directory, 'S')
+    with open(os.path.join(folder, 'savestates', 'a.state'), 'wb') as file:
+        file.write(os.urandom(50_000))
+    # b's state only lives in the shared store
+    blob_source = tmp_path / 'b.state'
+    blob_source.write_bytes(b'b' * 10_000)
+    digest = store.put_many([str(blob_source)])[str(blob_source)]
+    games = {'/roms/a.nes': {'name': 'a', 'completed': False}, '/roms/b.nes': {'name': 'b', 'completed': True}}
+    manager.save_session('S', games, [{'a': {'swaps': 1, 'time_spent': 5}}, 1, 5], {'/roms/b.nes': digest}, None)
+    return digest
+
+
+def write_archive(path, files, manifest_files=None, **manifest):
+    manifest = dict({'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION, 'name': 'Evil'}, **manifest)
+    manifest['files'] = manifest_files if manifest_files is not None else {
+        name: {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+        for name, data in files.items()}
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest))
+    return str(path)
+
+
+def session_bytes(name='Evil'):
+    return json.dumps({'name': name, 'games': {}, 'stats': [{}, 0, 0], 'save_states': {}, 'goals': None}).encode()
+
+
+def test_round_trip_with_files_and_store_blobs(setup):
+    manager, store, tmp_path = setup
+    digest = make_session(manager, store, tmp_path)
+    archive = str(tmp_path / 'S.rrsession')
+    progress = []
+    manifest = export_session(manager, store, 'S', archive, progress=lambda done, total: progress.append(done))
+    assert f"blobs/{digest}.zz" in manifest['files']
+    assert progress[-1] == sum(entry['size'] for entry in manifest['files'].values())
+
+    assert import_session(manager, store, archive, name='Copy') == 'Copy'
+    copy = manager.load_session('Copy')
+    assert copy['name'] == 'Copy'
+    assert copy['stats'] == [{'a': {'swaps': 1, 'time_spent': 5}}, 1, 5]
+    assert copy['save_states'] == {'/roms/b.nes': digest}
+    with open(os.path.join(manager.directory, 'S', 'savestates', 'a.state'), 'rb') as original, \
+            open(os.path.join(manager.directory, 'Copy', 'savestates', 'a.state'), 'rb') as imported:
+        assert original.read() == imported.read()
+    assert not os.path.exists(os.path.join(manager.directory, 'Copy', 'session.import.json'))
+
+
+def test_import_refuses_an_existing_session(setup):
+    manager, store, tmp_path = setup
+    make_session(manager, store, tmp_path)
+    archive = str(tmp_path / 'S.rrsession')
+    export_session(manager, store, 'S', archive)
+    with pytest.raises(ArchiveError, match="already exists"):
+        import_session(manager, store, archive)
+
+
+def test_cancelled_export_and_import_leave_nothing_behind(setup):
+    manager, store, tmp_path = setup
+    make_session(manager, store, tmp_path)
+    archive = str(tmp_path / 'S.rrsession')
+    with pytest.raises(ArchiveCancelled):
+        export_session(manager, store, 'S', archive, cancelled=lambda: True)
+    assert not os.path.exists(archive) and not os.path.exists(archive + '.part')
+
+    export_session(manager, store, 'S', archive)
+    with pytest.raises(ArchiveCancelled):
+        import_session(manager, store, archive, name='Copy', cancelled=lambda: True)
+    assert sorted(os.listdir(manager.directory)) == ['S']
+
+
+def test_rejects_files_that_are_not_session_archives(setup):
+    manager, store, tmp_path = setup
+    not_zip = tmp_path / 'plain.rrsession'
+    not_zip.write_text("hello")
+    with pytest.raises(ArchiveError, match="not a session archive"):
+        read_manifest(str(not_zip))
+    with pytest.raises(ArchiveError, match="this version"):
+        read_manifest(write_archive(tmp_path / 'other.rrsession', {SESSION_NAME: session_bytes()}, format='other'))
+    with pytest.raises(ArchiveError, match="this version"):
+        read_manifest(write_archive(tmp_path / 'newer.rrsession', {SESSION_NAME: session_bytes()},
+                                    version=ARCHIVE_VERSION + 1))
+    with pytest.raises(ArchiveError, match="no session.json"):
+        import_session(manager, store, write_archive(tmp_path / 'empty.rrsession', {'stats/x.txt': b'1'}))
+
+
+@pytest.mark.parametrize('unsafe', ['../escape.txt', '/etc/passwd', 'savestates/..\\x.state', 'C:/x.state',
+                                    'savestates/../../x.state'])
+def test_rejects_unsafe_paths(setup, unsafe):
+    manager, store, tmp_path = setup
+    archive = write_archive(tmp_path / 'evil.rrsession', {SESSION_NAME: session_bytes(), unsafe: b'x'})
+    with pytest.raises(ArchiveError, match="Unsafe path"):
+        import_session(manager, store, archive)
+    assert os.listdir(manager.directory) == []
+
+
+def test_rejects_a_bad_blob_name(setup):
+    manager, store, tmp_path = setup
+    archive = write_archive(tmp_path / 'evil.rrsession', {SESSION_NAME: session_bytes(), 'blobs/nothex.zz': b'x'})
+    with pytest.raises(ArchiveError, match="Unexpected savestate blob"):
+        import_session(manager, store, archive)
+
+
+def test_rejects_checksum_mismatch_and_missing_entries(setup):
+    manager, store, tmp_path = setup
+    files = {SESSION_NAME: session_bytes(), 'savestates/a.state': b'state'}
+    listed = {name: {'size': len(data), 'sha256': '0' * 64} for name, data in files.items()}
+    with pytest.raises(ArchiveError, match="checksum mismatch"):
+        import_session(manager, store, write_archive(tmp_path / 'bad.rrsession', files, listed))
+    listed = {name: {'size': 1, 'sha256': '0' * 64} for name in [*files, 'savestates/gone.state']}
+    with pytest.raises(ArchiveError, match="incomplete"):
+        import_session(manager, store, write_archive(tmp_path / 'short.rrsession', files, listed))
+    assert os.listdir(manager.directory) == []
+
+
+@pytest.mark.parametrize('hostile', ['../escaped', '..', '.hidden', 'a/b', 'a\\b', 'C:evil', ''])
+def test_rejects_a_hostile_session_name(setup, hostile):
+    manager, store, tmp_path = setup
+    archive = write_archive(tmp_path / 'evil.rrsession', {SESSION_NAME: session_bytes()}, name=hostile)
+    with pytest.raises(ArchiveError, match="Unsafe session name"):
+        import_session(manager, store, archive)
+    with pytest.raises(ArchiveError, match="Unsafe session name"):
+        import_session(manager, store, archive, name='../renamed')
+    assert os.listdir(manager.directory) == []
+    assert sorted(os.listdir(tmp_path)) == ['evil.rrsession', 'sessions', 'store']
+
+
+def test_rejects_a_blob_that_does_not_hold_its_digest(setup):
+    manager, store, tmp_path = setup
+    planted = zlib.compress(b'planted state')
+    claimed = hashlib.sha256(b'some other state').hexdigest()
+    blob_name = f"blobs/{claimed}.zz"
+    archive = write_archive(tmp_path / 'evil.rrsession', {SESSION_NAME: session_bytes(), blob_name: planted})
+    with pytest.raises(ArchiveError, match="does not hold the savestate"):
+        import_session(manager, store, archive)
+    assert not store.has(claimed)
+    assert os.listdir(manager.directory) == []
+
+    honest = f"blobs/{hashlib.sha256(b'planted state').hexdigest()}.zz"
+    archive = write_archive(tmp_path / 'good.rrsession', {SESSION_NAME: session_bytes(), honest: planted})
+    import_session(manager, store, archive)
+    assert store.has(hashlib.sha256(b'planted state').hexdigest())
+
+
+def test_export_stops_at_the_sizes_it_started_with(setup, monkeypatch):
+    manager, store, tmp_path = setup
+    make_session(manager, store, tmp_path)
+    log_path = os.path.join(manager.directory, 'S', 'events.jsonl')
+    with open(log_path, 'w') as file:
+        file.write('["s",1.0,"a"]\n')
+    import session_archive
+    copy_stream = session_archive._copy_stream
+
+    def shuffle_meanwhile(source, target, progress, limit=None):
+        # The running shuffle appends a swap and drops a working state as the export reads
+        with open(log_path, 'a') as file:
+            file.write('["e",2.0,"a",1.0]\n')
+        state_path = os.path.join(manager.directory, 'S', 'savestates', 'a.state')
+        if os.path.exists(state_path) and source.name != state_path:
+            os.remove(state_path)
+        return copy_stream(source, target, progress, limit)
+    monkeypatch.setattr(session_archive, '_copy_stream', shuffle_meanwhile)
+    archive = str(tmp_path / 'S.rrsession')
+    manifest = export_session(manager, store, 'S', archive)
+    with zipfile.ZipFile(archive) as exported:
+        assert exported.read('events.jsonl') == b'["s",1.0,"a"]\n'
+    assert 'savestates/a.state' not in manifest['files']
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from session_database import SessionDatabase, swap_event
+from session_manager import SessionManager
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = SessionDatabase(str(tmp_path / 'sessions.db'))
+    yield database
+    database.close()
+
+
+def library(count):
+    return {f"/roms/{i}.nes": {'name': f"Game {i}", 'completed': False, 'goals': None} for i in range(count)}
+
+
+def save(database, games, stats=({}, 0, 0), save_states=None, **options):
+    database.save_session('S', games, list(stats), save_states or {}, None, **options)
+
+
+def test_round_trip_keeps_the_session_json_layout(database):
+    games = library(3)
+    games["/roms/1.nes"].update(completed=True, weight=2.5)
+    stats = {'Game 0': {'swaps': 4, 'time_spent': 12.5, 'formatted_time_spent': '00:00:12'}}
+    database.save_session('S', games, [stats, 4, 12.5], {"/roms/0.nes": 'ab' * 32}, {'any': 1}, shuffle_seed=99)
+    data = database.load_session('S')
+    assert data['games'] == games
+    assert data['stats'] == [stats, 4, 12.5]
+    assert data['save_states'] == {"/roms/0.nes": 'ab' * 32}
+    assert data['goals'] == {'any': 1}
+    assert data['shuffle_seed'] == 99
+    assert database.get_summary('S') == (3, 1, 4, 12.5, 99)
+
+
+def test_delta_write_only_touches_the_changed_rows(database):
+    games = library(4)
+    save(database, games)
+    games["/roms/2.nes"]['completed'] = True
+    games["/roms/3.nes"]['name'] = "Renamed"  # Not listed as changed, so not written
+    save(database, games, changed_games={"/roms/2.nes"}, changed_stats=set())
+    loaded = database.load_session('S')['games']
+    assert loaded["/roms/2.nes"]['completed'] is True
+    assert loaded["/roms/3.nes"]['name'] == "Game 3"
+    assert database.get_summary('S')[:2] == (4, 1)
+
+
+def test_delta_counts_follow_added_and_removed_games(database):
+    games = library(3)
+    save(database, games)
+    del games["/roms/0.nes"]
+    games["/roms/new.nes"] = {'name': 'New', 'completed': True}
+    save(database, games, changed_games={"/roms/0.nes", "/roms/new.nes"}, changed_stats=set())
+    assert database.get_summary('S')[:2] == (3, 1)
+    assert set(database.load_session('S')['games']) == {"/roms/1.nes", "/roms/2.nes", "/roms/new.nes"}
+
+
+def test_changed_stats_are_upserted_and_deleted(database):
+    save(database, library(1), stats=({'a': {'swaps': 1, 'time_spent': 1}, 'b': {'swaps': 2, 'time_spent': 2}}, 3, 3))
+    save(database, library(1), stats=({'a': {'swaps': 5, 'time_spent': 9}}, 5, 9),
+         changed_games=set(), changed_stats={'a', 'b'})
+    assert database.load_session('S')['stats'] == [{'a': {'swaps': 5, 'time_spent': 9}}, 5, 9]
+
+
+def test_first_write_of_a_new_session_writes_every_row(database):
+    save(database, library(5), changed_games=set(), changed_stats=set())
+    assert len(database.load_session('S')['games']) == 5
+
+
+def test_swap_events_are_appended_in_order(database):
+    save(database, library(2), swap_events=[swap_event(None, "/roms/0.nes", 3.0)])
+    save(database, library(2), changed_games=set(), changed_stats=set(),
+         swap_events=[swap_event("/roms/0.nes", "/roms/1.nes", 4.0)])
+    events = database.get_swap_events('S')
+    assert [(previous, game, latency) for _, _, previous, game, latency in events] == [
+        (None, "/roms/0.nes", 3.0), ("/roms/0.nes", "/roms/1.nes", 4.0)]
+    assert database.get_swap_events('S', after_id=events[0][0]) == events[1:]
+
+
+def test_rename_clone_and_delete(database):
+    save(database, library(2), save_states={"/roms/0.nes": 'a' * 64})
+    assert database.clone_session('S', 'Copy', {"/roms/0.nes": 'b' * 64})
+    assert not database.clone_session('S', 'Copy')
+    assert database.load_session('Copy')['save_states'] == {"/roms/0.nes": 'b' * 64}
+    assert database.referenced_savestates() == {'a' * 64, 'b' * 64}
+    assert not database.rename_session('S', 'Copy')
+    assert database.rename_session('S', 'Renamed')
+    assert database.list_sessions() == ['Copy', 'Renamed']
+    assert database.delete_session('Copy')
+    assert database.referenced_savestates() == {'a' * 64}
+
+
+def test_manager_imports_existing_session_json_files(tmp_path):
+    folder = tmp_path / 'Old'
+    folder.mkdir()
+    (folder / 'session.json').write_text(json.dumps(
+        {'name': 'Old', 'games': library(2), 'stats': [{}, 6, 60], 'save_states': {}, 'goals': None}))
+    manager = SessionManager(str(tmp_path), backend='sqlite')
+    try:
+        assert manager.list_sessions() == ['Old']
+        assert manager.get_session_summary('Old').total_swaps == 6
+        exported = tmp_path / 'export.json'
+        assert manager.export_session_json('Old', str(exported))
+        assert json.loads(exported.read_text())['games'] == library(2)
+    finally:
+        manager.database.close()
@@ -0,0 +1,148 @@
+import json, threading, time
+
+from file_utils import write_json_atomic
+from session_manager import SessionWriter, SessionManager
+
+
+def test_changes_coalesce_into_one_write():
+    writer = SessionWriter(delay=0.05, max_delay=1.0)
+    written = []
+    for version in range(20):
+        writer.mark_dirty('a', lambda version=version: written.append(version))
+    assert writer.flush(timeout=5)
+    assert written == [19]
+    assert writer.coalesced == 19
+    assert not writer.is_dirty()
+
+
+def test_write_happens_after_the_quiet_delay_without_a_flush():
+    writer = SessionWriter(delay=0.05, max_delay=1.0)
+    done = threading.Event()
+    writer.mark_dirty('a', done.set)
+    assert done.wait(2)
+
+
+def test_max_delay_bounds_a_session_that_keeps_changing():
+    writer = SessionWriter(delay=0.2, max_delay=0.3)
+    done = threading.Event()
+    started = time.monotonic()
+    while not done.is_set() and time.monotonic() - started < 3:
+        writer.mark_dirty('a', done.set)
+        time.sleep(0.02)
+    assert done.is_set()
+    assert time.monotonic() - started < 1.5
+
+
+def test_discarded_session_is_not_written():
+    writer = SessionWriter(delay=30, max_delay=60)
+    written = []
+    writer.mark_dirty('a', lambda: written.append('a'))
+    writer.mark_dirty('b', lambda: written.append('b'))
+    writer.discard('b')
+    assert writer.is_dirty('a') and not writer.is_dirty('b')
+    assert writer.flush('a', timeout=5)
+    assert written == ['a']
+
+
+def test_write_that_saw_the_session_change_size_is_retried():
+    writer = SessionWriter(delay=0.01, max_delay=0.1)
+    attempts = []
+
+    def write():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("dictionary changed size during iteration")
+    writer.mark_dirty('a', write)
+    assert writer.flush(timeout=5)
+    assert len(attempts) == 2
+    assert writer.writes == 1
+
+
+def test_failing_write_is_logged_and_not_retried(caplog):
+    writer = SessionWriter(delay=0.01, max_delay=0.1)
+    attempts = []
+
+    def write():
+        attempts.append(1)
+        raise OSError("disk full")
+    writer.mark_dirty('a', write)
+    assert writer.flush(timeout=5)
+    assert attempts == [1]
+    assert "disk full" in caplog.text
+
+
+def test_write_json_atomic_leaves_no_temp_file(tmp_path):
+    path = tmp_path / 'session.json'
+    write_json_atomic(str(path), {'name': 'a'})
+    write_json_atomic(str(path), {'name': 'b'})
+    assert json.loads(path.read_text()) == {'name': 'b'}
+    assert [p.name for p in tmp_path.iterdir()] == ['session.json']
+
+
+def test_save_later_writes_the_latest_state(tmp_path):
+    from game_manager import GameManager
+    manager = SessionManager(str(tmp_path))
+    manager.create_session('S')
+    games = GameManager()
+    games.load_games({'/a.nes': {'name': 'a', 'completed': False}})
+    manager.save_session_later('S', games, shuffle_seed=7)
+    games.stats_tracker.start_game('a')
+    manager.save_session_later('S', games, shuffle_seed=7)
+    data = manager.load_session('S')  # Flushes first
+    assert data['stats'][1] == 1
+    assert data['shuffle_seed'] == 7
+    assert manager.get_session_summary('S').total_swaps == 1
+
+
+def test_snapshots_are_detached_from_the_live_state():
+    from game_manager import GameManager
+    games = GameManager()
+    games.load_games({'/a.nes': {'name': 'a', 'completed': False}, '/b.nes': {'name': 'b', 'completed': False}})
+    games.set_save_state('/a.nes', 'digest')
+    games.switch_game('a')
+    game_copy, state_copy = games.snapshot()
+    stats_copy, swaps, _ = games.stats_tracker.snapshot()
+    games.games['/a.nes']['completed'] = True
+    games.set_save_state('/a.nes', 'other')
+    games.switch_game('a')
+    assert game_copy['/a.nes']['completed'] is False and state_copy == {'/a.nes': 'digest'}
+    assert stats_copy['a']['swaps'] == 1 and swaps == 1
+    assert games.snapshot(['/b.nes', '/gone.nes']) == ({'/b.nes': {'name': 'b', 'completed': False}}, {})
+    assert list(games.stats_tracker.snapshot(['a', 'gone'])[0]) == ['a']
+
+
+def test_stats_snapshot_never_sees_a_half_made_swap():
+    from game_manager import GameManager
+    games = GameManager()
+    games.load_games({'/a.nes': {'name': 'a', 'completed': False}})
+    stop = threading.Event()
+
+    def swap_forever():
+        while not stop.is_set():
+            games.switch_game('a')
+
+    swapper = threading.Thread(target=swap_forever)
+    swapper.start()
+    try:
+        for _ in range(200):
+            stats, total_swaps, _ = games.stats_tracker.snapshot()
+            assert stats.get('a', {}).get('swaps', 0) == total_swaps
+    finally:
+        stop.set()
+        swapper.join()
+
+
+def test_a_swap_waits_for_the_next_write_when_the_event_log_has_it(tmp_path):
+    from game_manager import GameManager
+    from event_log import SessionEventLog
+    from stat_tracker import StatsTracker
+    manager = SessionManager(str(tmp_path))
+    manager.create_session('S')
+    games = GameManager()
+    manager.save_swap_later('S', games)
+    assert manager.writer.is_dirty('S')
+    manager.flush()
+    games.stats_tracker = StatsTracker(event_log=SessionEventLog(str(tmp_path / 'S')))
+    manager.save_swap_later('S', games)
+    assert not manager.writer.is_dirty('S')
+    games.stats_tracker.event_log.close()
@@ -0,0 +1,60 @@
+from concurrent.futures import Future
+from itertools import islice
+
+from game_manager import GameManager
+from Python_Client import CommandResult
+from shuffle_engine import ShuffleEngine, SimulatedClock
+from shuffle_schedule import generate_schedule, create_seeded_policy, SeededRandomPolicy, ReplayPolicy
+from shuffle_policy import FairSharePolicy
+
+
+class InstantEmulator:
+    def swap(self, save_path, rom_path, state_path, timeout, callback):
+        future = Future()
+        future.set_result(CommandResult(None, 'ok', 1.0, 1.0, None))
+        callback(future)
+
+
+def library(count=12):
+    # Listed out of (name, path) order, so the schedule has to sort them
+    return {f"/roms/{i}.nes": {'name': f"Game {count - i:02d}", 'completed': False} for i in range(count)}
+
+
+def live_run(seed, swaps, step=0, min_interval=5, max_interval=50):
+    game_manager = GameManager()
+    game_manager.load_games(library())
+    for _ in range(step):
+        game_manager.stats_tracker.total_swaps += 1
+    clock = SimulatedClock()
+    engine = ShuffleEngine(game_manager, InstantEmulator(), lambda path: path + '.state', clock=clock,
+                           min_interval=min_interval, max_interval=max_interval)
+    engine.reseed(seed, step)
+    engine.set_policy(create_seeded_policy('random', game_manager, seed, engine.min_interval, engine.max_interval,
+                                           game_manager.stats_tracker.total_swaps, engine.rng))
+    played = []
+    engine.subscribe('swapped', lambda previous, path, result: played.append(path))
+    engine.subscribe('scheduled', lambda interval: played.append(interval))
+    engine.start()
+    while len(played) < swaps * 2:
+        clock.advance(engine.time_until_swap())
+        engine.poll()
+    return list(zip(played[::2], played[1::2]))
+
+
+def test_a_seeded_live_run_plays_the_generated_schedule():
+    expected = list(generate_schedule(library(), 1234, 5, 50, steps=40))
+    assert live_run(1234, 40) == expected
+    assert live_run(99, 40) != expected
+
+
+def test_a_resumed_run_continues_the_schedule():
+    expected = list(islice(generate_schedule(library(), 1234, 5, 50), 15, 40))
+    assert live_run(1234, 25, step=15) == expected
+
+
+def test_only_seeded_random_runs_follow_the_schedule():
+    game_manager = GameManager()
+    game_manager.load_games(library())
+    assert isinstance(create_seeded_policy('random', game_manager, 1), SeededRandomPolicy)
+    assert isinstance(create_seeded_policy('fair_share', game_manager, 1), FairSharePolicy)
+    assert not isinstance(create_seeded_policy('random', game_manager, None), ReplayPolicy)
@@ -0,0 +1,189 @@
+"""Stand-in for bizhawk_server.lua that runs anywhere Python does.
+
+Speaks the same protocols, the text lines ("#<id> <command> <args>" in,
+"#<id> <status> <elapsed_ms> [message]" out) and the binary frames a client can
+switch to, and simulates how long BizHawk takes for each command. Savestates are real files of a configurable size, so disk usage can be
+measured. Run it directly to point the app at it:
+
+    python -m tools.mock_bizhawk_server --port 65432
+"""
+import argparse, asyncio, logging, os, random, threading
+
+import Python_Client
+
+# Simulated (mean, standard deviation) in milliseconds for each command
+DEFAULT_LATENCIES = {
+    'loadrom': (180.0, 60.0),
+    'savestate': (25.0, 10.0),
+    'loadstate': (20.0, 8.0),
+}
+
+
+class MockBizHawkServer:
+    def __init__(self, host=Python_Client.HOST, port=Python_Client.PORT, latencies=None,
+                 state_size=256 * 1024, time_scale=1.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.state_size = state_size
+        self.time_scale = time_scale  # 0 reports simulated times without sleeping
+        self.rng = random.Random(seed)
+        self.current_rom = None
+        self.commands_handled = 0
+        self.bytes_written = 0
+        self.server = None
+        self._loop = None
+        self._lock = None
+
+    def _simulate(self, command):
+        mean, deviation = self.latencies.get(command, (0.0, 0.0))
+        return max(0.0, self.rng.gauss(mean, deviation))
+
+    async def _spend(self, elapsed_ms):
+        if self.time_scale:
+            await asyncio.sleep(elapsed_ms * self.time_scale / 1000)
+
+    def _save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(os.urandom(self.state_size))
+        self.bytes_written += self.state_size
+        return self._simulate('savestate')
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError("state file not found")
+        return self._simulate('loadstate')
+
+    def _open_rom(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ROM not found: {path}")
+        self.current_rom = path
+        return self._simulate('loadrom')
+
+    def run_command(self, command, args):
+        """Apply a command to its argument list; returns (ok, simulated elapsed ms, message)."""
+        if command == 'loadrom':
+            return True, self._open_rom(args[0]), None
+        if command == 'savestate':
+            return True, self._save(args[0]), None
+        if command == 'loadstate':
+            return True, self._load(args[0]), None
+        if command == 'swap':
+            save_path, rom_path, state_path = args
+            elapsed = self._save(save_path) if save_path else 0.0
+            elapsed += self._open_rom(rom_path)
+            elapsed += self._load(state_path) if os.path.exists(state_path) else self._save(state_path)
+            return True, elapsed, None
+        if command in ('statepool', 'flush', 'forget', 'ping'):
+            return True, 0.0, None
+        if command == 'status':
+            return True, 0.0, f"queued=0 dropped=0 bytes_written={self.bytes_written}"
+        return False, 0.0, f"unknown command {command}"
+
+    async def _execute(self, command, args):
+        async with self._lock:  # BizHawk runs one command at a time
+            try:
+                ok, elapsed_ms, message = self.run_command(command, args)
+            except Exception as e:
+                ok, elapsed_ms, message = False, 0.0, str(e)
+            await self._spend(elapsed_ms)
+            self.commands_handled += 1
+        return ok, elapsed_ms, message
+
+    def _parse_line(self, text):
+        request_id = None
+        if text.startswith('#') and ' ' in text:
+            tag, text = text.split(' ', 1)
+            request_id = int(tag[1:])
+        command, _, argument = text.partition(' ')
+        return request_id, command, Python_Client.split_arguments(command, argument)
+
+    async def _handle_client(self, reader, writer):
+        binary = False
+        while not binary and (line := await reader.readline()):
+            request_id, command, args = self._parse_line(line.decode(errors='replace').rstrip('\r\n'))
+            if command == 'binary':
+                binary = args == [str(Python_Client.PROTOCOL_VERSION)]
+                ok, elapsed_ms, message = binary, 0.0, None if binary else "unsupported protocol version"
+            else:
+                ok, elapsed_ms, message = await self._execute(command, args)
+            if request_id is not None:
+                reply = f"#{request_id} {'ok' if ok else 'error'} {elapsed_ms:.3f}"
+                if message:
+                    reply += f" {message}"
+                writer.write((reply + "\n").encode())
+                await writer.drain()
+        if binary:
+            await self._handle_frames(reader, writer)
+        writer.close()
+
+    async def _handle_frames(self, reader, writer):
+        commands = {opcode: command for command, opcode in Python_Client.OPCODES.items()}
+        header = Python_Client.FRAME_HEADER
+        while True:
+            try:
+                length, opcode, request_id = header.unpack(await reader.readexactly(header.size))
+                payload = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:
+                return
+            if opcode == Python_Client.OP_TEXT:
+                _, command, args = self._parse_line(payload.decode(errors='replace'))
+            else:
+                command = commands.get(opcode, f"opcode {opcode}")
+                args = payload.decode(errors='replace').split('\0') if payload else []
+            ok, elapsed_ms, message = await self._execute(command, args)
+            if request_id:
+                reply = Python_Client.REPLY_HEADER.pack(0 if ok else 1, elapsed_ms) + (message or "").encode()
+                writer.write(Python_Client.encode_frame(Python_Client.OP_REPLY, request_id, reply))
+                await writer.drain()
+
+    async def start(self):
+        self._lock = asyncio.Lock()
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info("Mock BizHawk server listening on %s:%d", self.host, self.port)
+        return self.port
+
+    def start_in_thread(self):
+        """Serve from a daemon thread; returns the bound port (use port=0 for any free port)."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name="MockBizHawkServer", daemon=True).start()
+        started.wait()
+        return self.port
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=Python_Client.HOST)
+    parser.add_argument('--port', type=int, default=Python_Client.PORT)
+    parser.add_argument('--state-size', type=int, default=256 * 1024, help="Bytes written per savestate")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Multiplier for simulated latencies (0 = none)")
+    parser.add_argument('--seed', type=int)
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockBizHawkServer(options.host, options.port, state_size=options.state_size,
+                               time_scale=options.time_scale, seed=options.seed)
+
+    async def serve():
+        await server.start()
+        await server.server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Swap-path benchmark against the mock BizHawk server.
+
+Runs ShuffleEngine on a simulated clock against the mock server, saving the
+session after every swap the way MainWindow does, and reports swap latency
+percentiles and the bytes written per swap:
+
+    python -m tools.swap_benchmark --games 200 --swaps 5000 --time-scale 0
+"""
+import argparse, json, logging, os, random, statistics, tempfile, time
+
+import Python_Client
+from game_manager import GameManager
+from session_manager import SessionManager, SESSION_BACKENDS
+from session_database import swap_event
+from shuffle_engine import ShuffleEngine, SimulatedClock, ConnectionEmulator
+from shuffle_policy import POLICIES, DEFAULT_POLICY, create_policy
+from tools.mock_bizhawk_server import MockBizHawkServer
+
+
+def percentiles(samples):
+    cut_points = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cut_points[49], 'p95': cut_points[94], 'p99': cut_points[98]}
+
+
+def run_benchmark(games=100, swaps=1000, state_size=256 * 1024, time_scale=0.0, seed=1, work_dir=None,
+                  policy=DEFAULT_POLICY, backend='json'):
+    """Returns the results as a dict; without a ``work_dir`` the files go to a temporary folder removed afterwards."""
+    if work_dir is None:
+        with tempfile.TemporaryDirectory(prefix='swap_benchmark_') as temp_dir:
+            return _run_benchmark(games, swaps, state_size, time_scale, seed, temp_dir, policy, backend)
+    return _run_benchmark(games, swaps, state_size, time_scale, seed, work_dir, policy, backend)
+
+
+def _run_benchmark(games, swaps, state_size, time_scale, seed, work_dir, policy, backend):
+    rom_dir = os.path.join(work_dir, 'games')
+    os.makedirs(rom_dir, exist_ok=True)
+
+    server = MockBizHawkServer(port=0, state_size=state_size, time_scale=time_scale, seed=seed)
+    connection = Python_Client.EmulatorConnection(port=server.start_in_thread())
+
+    game_manager = GameManager(os.path.join(work_dir, 'games.json'))
+    library = {}
+    for index in range(games):
+        rom_path = os.path.join(rom_dir, f"game_{index:05d}.nes")
+        with open(rom_path, 'wb') as file:
+            file.write(b'\0' * 1024)
+        library[os.path.abspath(rom_path)] = {'name': f"Game {index}", 'completed': False, 'goals': "Beat the Game"}
+    game_manager.load_games(library)
+
+    session_manager = SessionManager(os.path.join(work_dir, 'sessions'), backend=backend)
+    session_name = 'Benchmark'
+    session_file = os.path.join(session_manager.directory, session_name, 'session.json')
+    state_dir = os.path.join(session_manager.directory, session_name, 'savestates')
+    os.makedirs(state_dir, exist_ok=True)
+
+    def state_path(rom_path):
+        return os.path.join(state_dir, os.path.splitext(os.path.basename(rom_path))[0] + '.state')
+
+    clock = SimulatedClock()
+    rng = random.Random(seed)
+    engine = ShuffleEngine(game_manager, ConnectionEmulator(connection, blocking=True), state_path,
+                           clock=clock, rng=rng, policy=create_policy(policy, game_manager, rng))
+    latencies, emulator_times, failures = [], [], []
+
+    def on_swapped(previous_path, game_path, result):
+        # As in the app: the swap only marks the session dirty, the writer thread saves it
+        session_manager.record_swap(session_name, swap_event(previous_path, game_path, engine.last_swap_latency_ms))
+        session_manager.save_session_later(session_name, game_manager)
+        emulator_times.append(result.elapsed_ms)
+
+    engine.subscribe('swapped', on_swapped)
+    engine.subscribe('swap_failed', lambda game_path, error: failures.append(error))
+
+    started = time.perf_counter()
+    for index in range(swaps):
+        swap_started = time.perf_counter()
+        if index == 0:
+            swapped = engine.start()
+        else:
+            clock.advance(engine.time_until_swap() or 0.0)
+            swapped = engine.poll()
+        if failures or not swapped:
+            raise RuntimeError(f"Swap failed: {failures[0] if failures else 'engine stopped'}")
+        latencies.append((time.perf_counter() - swap_started) * 1000)
+    wall_time = time.perf_counter() - started
+    engine.stop()
+    session_manager.flush()
+    # Only session.json has a size per write; SQLite writes just the changed pages
+    session_bytes = session_manager.writer.writes * os.path.getsize(session_file) if backend == 'json' else None
+
+    state_bytes = connection.run(connection.client.get_status())['bytes_written']
+    connection.close()
+    server.stop()
+    return {
+        'games': games,
+        'swaps': swaps,
+        'wall_seconds': wall_time,
+        'swaps_per_second': swaps / wall_time,
+        'latency_ms': percentiles(latencies),
+        'simulated_emulator_ms': percentiles(emulator_times),
+        'savestate_bytes_per_swap': state_bytes / swaps,
+        'session_writes': session_manager.writer.writes,
+        'session_bytes_per_swap': session_bytes / swaps if session_bytes is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--swaps', type=int, default=1000)
+    parser.add_argument('--state-size', type=int, default=256 * 1024, help="Bytes written per savestate")
+    parser.add_argument('--time-scale', type=float, default=0.0,
+                        help="Multiplier for the mock's simulated latencies (0 = measure overhead only)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default=DEFAULT_POLICY)
+    parser.add_argument('--backend', choices=SESSION_BACKENDS, default='json', help="Session storage")
+    parser.add_argument('--work-dir', help="Where to create games and sessions (default: a temp dir)")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmark(options.games, options.swaps, options.state_size, options.time_scale,
+                           options.seed, options.work_dir, options.policy, options.backend)
+    if options.json:
+        print(json.dumps(report, indent=4))
+        return
+    print(f"{report['swaps']} swaps over {report['games']} games in {report['wall_seconds']:.2f} s "
+          f"({report['swaps_per_second']:.1f} swaps/s)")
+    for label, key in (("Swap latency", 'latency_ms'), ("Simulated emulator time", 'simulated_emulator_ms')):
+        values = report[key]
+        print(f"{label}: p50 {values['p50']:.2f} ms, p95 {values['p95']:.2f} ms, p99 {values['p99']:.2f} ms")
+    if report['session_bytes_per_swap'] is None:
+        print(f"Bytes written per swap: {report['savestate_bytes_per_swap']:.0f} savestate; "
+              f"{report['session_writes']} session writes")
+    else:
+        print(f"Bytes written per swap: {report['savestate_bytes_per_swap']:.0f} savestate, "
+              f"{report['session_bytes_per_swap']:.0f} session.json")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+from PySide6.QtCore import QObject, Signal
+import Python_Client
+import logging
+
+
+class EmulatorBridge(QObject):
+    """Runs emulator requests on the asyncio client loop and hands the results back to the GUI thread."""
+    _completed = Signal(object, object)
+    event_received = Signal(str, object)  # Event name and its argument list
+
+    def __init__(self, connection=None, parent=None):
+        super().__init__(parent)
+        self.connection = connection or Python_Client.connection
+        self.client = self.connection.client
+        # Emitted from the client loop thread, so Qt queues the slot onto this object's thread
+        self._completed.connect(self._deliver)
+        self.connection.call_soon(self.client.add_event_handler, self.event_received.emit)
+
+    def call(self, coroutine, callback=None):
+        """Schedule ``coroutine`` without blocking; ``callback(future)`` runs on the GUI thread."""
+        future = self.connection.submit(coroutine)
+        if callback is not None:
+            self.watch(future, callback)
+        return future
+
+    def swap(self, save_path, rom_path, state_path, timeout, callback):
+        """The emulator interface ShuffleEngine expects; ``callback(future)`` runs on the GUI thread."""
+        return self.call(self.client.swap(save_path, rom_path, state_path, timeout), callback)
+
+    def watch(self, future, callback):
+        """Run ``callback(future)`` on the GUI thread once any concurrent.futures.Future finishes."""
+        future.add_done_callback(lambda done: self._completed.emit(callback, done))
+
+    def _deliver(self, callback, future):
+        try:
+            callback(future)
+        except Exception as e:
+            logging.error(f"Error handling emulator response: {e}")
@@ -1,18 +1,37 @@
 from PySide6.QtWidgets import (QMainWindow, QTabWidget, QWidget, QVBoxLayout, QMessageBox, QInputDialog, QLabel, QLineEdit, QGroupBox,
-                               QPushButton, QListWidget, QFileDialog, QMenu, QComboBox, QHBoxLayout, QFormLayout, QCheckBox, QSpinBox)
-from PySide6.QtCore import Qt, QTimer
+                               QPushButton, QListWidget, QFileDialog, QMenu, QComboBox, QHBoxLayout, QFormLayout, QCheckBox, QSpinBox,
+                               QProgressDialog)
+from PySide6.QtCore import Qt, QTimer, Signal
 from game_manager import GameManager
 from config import ConfigManager
-from session_manager import SessionManager
+from session_manager import SessionManager, SessionSummary
+from file_utils import write_json_atomic
 from stat_tracker import StatsTracker
 from twitch.twitch_flask import flask_thread
 from twitch.twitch_integration import TwitchIntegration
 from ui.style import Style
+from ui.emulator_bridge import EmulatorBridge
+from shuffle_plan import Prefetcher
+from shuffle_engine import (ShuffleEngine, PAUSE_EMULATOR_MISSING, PAUSE_EMULATOR_UNRESPONSIVE,
+                            NO_GAMES, ALL_COMPLETED)
+from savestate_store import SavestateStore
+from savestate_history import SavestateHistory
+from action_queue import ActionQueue
+from emulator_supervisor import EmulatorSupervisor
+from stats_output import StatsFileWriter, OverlayServer, OVERLAY_PORT
+from shuffle_policy import POLICIES, DEFAULT_POLICY
+from session_database import swap_event
+from event_log import SessionEventLog
+from session_archive import (export_session, import_session, read_manifest, ArchiveError, ArchiveCancelled,
+                             ARCHIVE_SUFFIX)
+from shuffle_schedule import (new_seed, export_schedule, read_schedule, read_schedule_header, ReplayPolicy,
+                              create_seeded_policy)
 from pathlib import Path
 import Python_Client
 
-import os, random, subprocess, time, json, sys, logging
-import psutil, shutil, keyboard, threading
+import os, random, time, json, sys, logging
+import shutil, keyboard, threading
+from concurrent.futures import Future, wait
 
 SUPPORTED_EXTENSIONS = (
     '.nes', '.snes', '.gbc', '.gba', '.md', '.nds',
@@ -28,6 +47,14 @@ SUPPORTED_EXTENSIONS = (
 
 
 class MainWindow(QMainWindow):
+    # Emitted from any thread after an action was queued, so it is processed on the GUI thread
+    actions_submitted = Signal()
+    # Emitted from the supervisor's watcher thread when BizHawk exits
+    emulator_exited = Signal()
+    # Emitted from the session archive worker thread: progress as a fraction, then (result, error) when done
+    archive_progress = Signal(float)
+    archive_finished = Signal(object, object)
+
     def __init__(self, parent=None):
         try:
             super().__init__(parent)
@@ -42,14 +69,24 @@ class MainWindow(QMainWindow):
 
             self.game_manager = GameManager()
             self.config_manager = ConfigManager()     
-            self.session_manager = SessionManager()
             self.stat_tracker = StatsTracker()
-            self.is_shuffling = False
             self.twitch_integration = TwitchIntegration(self)
             self.style_setter = Style()
 
             # Load configuration
             self.config = self.config_manager.load_config()
+            self.session_manager = SessionManager(backend=self.config.get('session_backend', 'json'))
+
+            # The shuffle engine drives swaps; this window only subscribes to it
+            self.shuffle_timer = QTimer()
+            self.shuffle_timer.setSingleShot(True)
+            self.shuffle_timer.timeout.connect(self.on_shuffle_timer)
+            self.emulator = EmulatorBridge(parent=self)
+            self.emulator.event_received.connect(self.on_emulator_event)
+            self.emulator_supervisor = EmulatorSupervisor()
+            self.emulator_supervisor.subscribe('exited', lambda pid, returncode: self.emulator_exited.emit())
+            self.emulator_exited.connect(self.on_emulator_exited)
+            self.init_shuffle_engine()
 
             # Initialize UI tabs
             self.init_ui()
@@ -57,6 +94,8 @@ class MainWindow(QMainWindow):
 
             # Initialize session name with None
             self.current_session_name = None
+            self.shuffle_seed = None
+            self.replay_policy = None  # Set while a shuffle replays an exported plan
 
             # Load last session if it exists
             self.load_last_session()
@@ -65,14 +104,23 @@ class MainWindow(QMainWindow):
             self.refresh_ui()
             self.init_timer(self.update_stats_display, 1000)
             
-            self.shuffle_timer = QTimer()
-            self.shuffle_timer.timeout.connect(self.shuffle_games)
-            self.remaining_shuffle_time = None        
+            self.savestate_store = SavestateStore(self.config.get('savestate_store_dir', 'savestate_store'))
+            self.prefetcher = Prefetcher() if self.config.get('prefetch_enabled', True) else None
+            self.savestate_history = None
+            self.unflushed_game_paths = set()  # Swapped out while the state pool was on; snapshotted after the flush
+            self.savestate_ingests = {}  # {game path: future of its latest ingest}
+            self.stats_file_writer = None
+            self.overlay_server = None
+            self.apply_stats_output_config()
+            self.archive_job = None  # (progress dialog, success callback) while a session archive is exported or imported
+            self.archive_progress.connect(self.on_archive_progress)
+            self.archive_finished.connect(self.on_archive_finished)
             
 
 
 
-            self.twitch_integration.force_swap_signal.connect(self.force_swap)
+            self.init_action_queue()
+            self.twitch_integration.force_swap_signal.connect(self.request_force_swap)
             self.twitch_integration.pause_shuffle_signal.connect(self.pause_shuffle_for_duration)
 
             configured_hotkey = self.config_manager.load_hotkey_config()
@@ -214,6 +262,7 @@ class MainWindow(QMainWindow):
                 actions[menu.addAction("Mark as Completed")] = self.mark_game_as_completed
             actions[menu.addAction("Rename Selected Game")] = self.prompt_rename_game
             actions[menu.addAction("Set Goals for Selected Game")] = self.prompt_set_game_goals
+            actions[menu.addAction("Restore Earlier Savestate")] = self.prompt_restore_savestate
         except Exception as e:
             # Handle the exception here
             logging.error(f"Error occurred in game_context_menu_logic: {e}")
@@ -392,6 +441,24 @@ class MainWindow(QMainWindow):
                 logging.error(f"Error occurred while renaming game: {e}")
                 QMessageBox.critical(self, "Error", "An error occurred while renaming the game. Please try again.")         
 
+    def prompt_restore_savestate(self):
+        selected_items = self.game_list.selectedItems()
+        if not selected_items or not self.current_session_name:
+            QMessageBox.information(self, "Information", "No game selected for restoring a savestate")
+            return
+
+        game_path = self.find_game_path_by_name(self.clean_game_name(selected_items[0].text()))
+        snapshots = self.get_savestate_history().snapshots(Path(game_path).stem) if game_path else []
+        if not snapshots:
+            QMessageBox.information(self, "Information", "No earlier savestates recorded for this game")
+            return
+
+        labels = [f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))} ({size // 1024} KB)"
+                  for _, timestamp, size in snapshots]
+        label, ok = QInputDialog.getItem(self, "Restore Savestate", "Restore the savestate from:", labels, 0, False)
+        if ok and label:
+            self.restore_savestate(game_path, snapshots[labels.index(label)][0])
+
     def rename_selected_game(self, item, new_name):
         old_name = self.clean_game_name(item.text())
         if path := self.find_game_path_by_name(old_name):
@@ -468,18 +535,53 @@ class MainWindow(QMainWindow):
             ("Start Shuffle", self.start_shuffle),
             ("Pause Shuffle", self.pause_shuffle),
             ("Resume Shuffle", self.resume_shuffle),
-            ("Stop Shuffle", self.stop_shuffle)
+            ("Stop Shuffle", self.stop_shuffle),
+            ("Export Shuffle Plan...", self.export_shuffle_plan),
+            ("Replay Shuffle Plan...", self.replay_shuffle_plan)
         ]
         for text, slot in shuffle_buttons:
             button = self.create_button(text, slot)
             layout.addWidget(button)
 
-        # Initialize shuffle state
-        self.is_shuffling = False
-        self.current_game_path = None
+        # Scheduling policy, remembered per session
+        policy_layout = QHBoxLayout()
+        policy_layout.addWidget(QLabel("Shuffle Policy:"))
+        self.shuffle_policy_selector = QComboBox()
+        for name, policy_class in POLICIES.items():
+            self.shuffle_policy_selector.addItem(policy_class.label, name)
+        self.shuffle_policy_selector.currentIndexChanged.connect(self.on_shuffle_policy_selected)
+        policy_layout.addWidget(self.shuffle_policy_selector)
+        layout.addLayout(policy_layout)
 
         return tab
 
+    def get_shuffle_policy_name(self, session_name=None):
+        session_name = session_name or self.current_session_name
+        session_policies = self.config.get('session_shuffle_policies', {})
+        return session_policies.get(session_name, self.config.get('shuffle_policy', DEFAULT_POLICY))
+
+    def update_shuffle_policy_selector(self):
+        index = self.shuffle_policy_selector.findData(self.get_shuffle_policy_name())
+        self.shuffle_policy_selector.blockSignals(True)
+        self.shuffle_policy_selector.setCurrentIndex(max(0, index))
+        self.shuffle_policy_selector.blockSignals(False)
+
+    def on_shuffle_policy_selected(self, index):
+        policy_name = self.shuffle_policy_selector.itemData(index)
+        if not self.current_session_name or policy_name == self.get_shuffle_policy_name():
+            return
+        self.config.setdefault('session_shuffle_policies', {})[self.current_session_name] = policy_name
+        self.config_manager.save_config(self.config)
+        if self.shuffle_engine.running:
+            self.shuffle_engine.set_policy(self.create_shuffle_policy(policy_name))
+        logging.info(f"Shuffle policy for session '{self.current_session_name}' set to {policy_name}")
+
+
+    def create_shuffle_policy(self, policy_name):
+        """The policy for the run from the current swap on; seeded Random runs follow the exported plan."""
+        return create_seeded_policy(policy_name, self.game_manager, self.shuffle_seed,
+                                    self.shuffle_engine.min_interval, self.shuffle_engine.max_interval,
+                                    self.game_manager.stats_tracker.total_swaps, self.shuffle_engine.rng)
 
     def launch_bizhawk(self):        
         self.config = self.config_manager.load_config()
@@ -487,7 +589,7 @@ class MainWindow(QMainWindow):
         if not bizhawk_path:
             QMessageBox.critical(self, "Configuration Error", "BizHawk path is not set.")
             return        
-        if self.is_bizhawk_process_running():
+        if self.emulator_supervisor.refresh():
             QMessageBox.information(self, "BizHawk Running", "BizHawk is already running.")
             # Optional: Bring BizHawk window to the front if possible
             return
@@ -499,13 +601,41 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Launch Error", f"An error occurred while launching BizHawk: {e}")
             
     def is_bizhawk_process_running(self):
-        return any(
-            proc.info['name'] in ['EmuHawk.exe', 'BizHawk.exe']
-            for proc in psutil.process_iter(['name'])
-        )
+        return self.emulator_supervisor.is_running()
+
+    def on_emulator_exited(self):
+        if self.shuffle_engine.running:
+            self.shuffle_engine.pause(PAUSE_EMULATOR_MISSING)
+
+    @property
+    def is_shuffling(self):
+        return self.shuffle_engine.running and not self.shuffle_engine.paused
+
+    @property
+    def current_game_path(self):
+        return self.shuffle_engine.current_game_path
+
+    def init_shuffle_engine(self):
+        self.shuffle_engine = ShuffleEngine(
+            self.game_manager, self.emulator, self.get_state_path,
+            lookahead=self.config.get('shuffle_lookahead', 2),
+            is_emulator_running=self.is_bizhawk_process_running)
+        subscriptions = {
+            'paused': self.on_shuffle_paused,
+            'resumed': lambda: self.statusBar().showMessage("Shuffle resumed.", 5000),
+            'stopped': self.shuffle_timer.stop,
+            'scheduled': self.on_shuffle_scheduled,
+            'planned': self.on_upcoming_planned,
+            'swap_started': self.on_swap_started,
+            'swapped': self.on_game_swapped,
+            'swap_failed': self.on_swap_failed,
+            'unavailable': self.on_shuffle_unavailable,
+        }
+        for event, callback in subscriptions.items():
+            self.shuffle_engine.subscribe(event, callback)
 
     def start_shuffle(self):
-        if self.is_shuffling:
+        if self.shuffle_engine.running:
             self.statusBar().showMessage("Shuffle is already active.", 5000)
             return
 
@@ -516,11 +646,16 @@ class MainWindow(QMainWindow):
         try:
             if session_data := self.session_manager.load_session(self.current_session_name):
                 self.initialize_session_data(session_data)
-            self.shuffle_interval = self.determine_shuffle_interval()
-
-            if self.is_bizhawk_process_running():
-                self.is_shuffling = True
-                self.shuffle_games()
+            self.shuffle_engine.set_intervals(self.config.get('min_shuffle_interval', 30),
+                                              self.config.get('max_shuffle_interval', 60))
+            self.shuffle_engine.swap_timeout = self.get_emulator_timeout()
+            self.shuffle_engine.reseed(self.shuffle_seed, self.game_manager.stats_tracker.total_swaps)
+            self.shuffle_engine.set_policy(self.replay_policy or self.create_shuffle_policy(self.get_shuffle_policy_name()))
+
+            if self.emulator_supervisor.refresh():
+                Python_Client.connection.start_heartbeat()
+                self.configure_state_pool()
+                self.shuffle_engine.start()
             else:
                 logging.error("BizHawk/EmuHawk process is not running. Cannot start shuffle.")
         except Exception as e:
@@ -537,115 +672,178 @@ class MainWindow(QMainWindow):
             'total_swaps': session_data['stats'][1],
             'total_shuffling_time': session_data['stats'][2]
         }
-        self.game_manager.stats_tracker = StatsTracker(initial_stats)
-
-    def determine_shuffle_interval(self):
-        min_interval = self.config.get('min_shuffle_interval', 30)
-        max_interval = self.config.get('max_shuffle_interval', 60)
-
-        if min_interval > max_interval:
-            logging.warning("Minimum interval is greater than maximum interval. Using default values.")
-            min_interval, max_interval = 30, 60
+        self.close_event_log()
+        event_log = self.open_event_log(session_data.get('name', self.current_session_name))
+        self.game_manager.stats_tracker = StatsTracker(initial_stats, event_log=event_log)
+        self.load_shuffle_seed(session_data)
+
+    def open_event_log(self, session_name):
+        # Checkpoints are written on the session writer thread, away from the swap path
+        return SessionEventLog(self.get_session_path(session_name), writer=self.session_manager.writer)
+
+    def close_event_log(self):
+        """Close the stats tracker's event log (before its session folder is renamed or deleted)."""
+        event_log = self.game_manager.stats_tracker.event_log
+        if event_log is not None:
+            event_log.close()
+            self.game_manager.stats_tracker.event_log = None
+
+    def load_shuffle_seed(self, session_data):
+        """Use the session's seed, creating one the first time; it is saved with the session."""
+        self.shuffle_seed = session_data.get('shuffle_seed')
+        if self.shuffle_seed is None:
+            self.shuffle_seed = new_seed()
+
+    def export_shuffle_plan(self):
+        if not self.current_session_name:
+            QMessageBox.warning(self, "No Session", "No current session is set. Please load a session first.")
+            return
+        steps, ok = QInputDialog.getInt(self, "Export Shuffle Plan", "Number of swaps to plan:", 1000, 1, 100_000_000)
+        if not ok:
+            return
+        file_path = QFileDialog.getSaveFileName(self, "Export Shuffle Plan", f"{self.current_session_name} plan.jsonl",
+                                                "Shuffle Plans (*.jsonl)")[0]
+        if not file_path:
+            return
+        try:
+            written = export_schedule(file_path, self.game_manager.games, self.shuffle_seed,
+                                      self.config.get('min_shuffle_interval', 30),
+                                      self.config.get('max_shuffle_interval', 60), steps)
+            self.statusBar().showMessage(f"Exported a plan of {written} swaps (seed {self.shuffle_seed}).", 5000)
+        except Exception as e:
+            logging.error(f"Error exporting shuffle plan: {e}")
+            QMessageBox.critical(self, "Export Error", f"An error occurred while exporting the shuffle plan: {e}")
 
-        return random.randint(min_interval, max_interval) * 1000
+    def replay_shuffle_plan(self):
+        if self.shuffle_engine.running:
+            self.statusBar().showMessage("Stop the current shuffle before replaying a plan.", 5000)
+            return
+        file_path = QFileDialog.getOpenFileName(self, "Replay Shuffle Plan", "", "Shuffle Plans (*.jsonl)")[0]
+        if not file_path:
+            return
+        try:
+            header = read_schedule_header(file_path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Replay Error", f"Could not read the shuffle plan: {e}")
+            return
+        logging.info(f"Replaying shuffle plan {file_path} (seed {header.get('seed')})")
+        self.replay_policy = ReplayPolicy(self.game_manager, read_schedule(file_path))
+        self.start_shuffle()
+        if not self.shuffle_engine.running:
+            self.replay_policy = None
 
     def pause_shuffle(self):
-        self.is_shuffling = False
-        if self.shuffle_timer.isActive():
-            self.remaining_shuffle_time = self.shuffle_timer.remainingTime()
-            self.shuffle_timer.stop()
-            logging.info("Paused shuffle for %d seconds", self.remaining_shuffle_time // 1000)
-            self.statusBar().showMessage("Shuffle paused.", 5000)
+        self.shuffle_engine.pause()
 
     def resume_shuffle(self):
-        if not self.is_shuffling and self.game_manager.games:
-            self.is_shuffling = True
-            if self.remaining_shuffle_time is not None:
-                self.shuffle_timer.start(self.remaining_shuffle_time)
-                logging.info("Resumed shuffle for %d seconds", self.remaining_shuffle_time // 1000)
-                self.statusBar().showMessage("Shuffle resumed.", 5000)
-                self.remaining_shuffle_time = None
-            else:
-                self.shuffle_games()
+        if not self.shuffle_engine.running:
+            self.start_shuffle()
+        else:
+            self.emulator_supervisor.refresh()  # BizHawk may have been restarted outside the app
+            self.shuffle_engine.resume()
 
     def stop_shuffle(self):
-        if self.is_shuffling:
-            self.is_shuffling = False
-            self.shuffle_timer.stop()
-            self.game_manager.stats_tracker.end_game(self.game_manager.current_game)
-            self.remaining_shuffle_time = None
-            self.game_manager.current_game = None
+        self.replay_policy = None
+        self.action_queue.clear()
+        if self.shuffle_engine.stop():
+            self.flush_savestates()
+            if self.game_manager.stats_tracker.event_log is not None:
+                self.game_manager.stats_tracker.event_log.sync()
             self.update_and_save_session()
-            logging.info("Shuffle stopped.")
+            logging.info("Shuffle stopped. Emulator connection: %s, action queue: %s",
+                         Python_Client.connection.get_metrics(), self.action_queue.get_metrics())
             self.statusBar().showMessage("Shuffle stopped.", 5000)
         else:
             logging.warning("Shuffle is not active.")
             self.statusBar().showMessage("Shuffle is not active.", 5000)
-            
-    
-    def shuffle_games(self):
-        if not self.is_shuffling:
-            logging.info("Shuffling is disabled.")
-            return
-
-        if not self.game_manager.games:
-            logging.warning("No games available to shuffle.")
-            QMessageBox.warning(self, "Shuffle Error", "No games available to shuffle.")
-            self.is_shuffling = False
-            return
-
-        if not self.is_bizhawk_process_running():
-            self.pause_shuffle()
-            return
-
-        available_games = {path: game for path, game in self.game_manager.games.items() if path != self.current_game_path}
-        if len(available_games) <= 1 or all(game['completed'] for game in available_games.values()):
-            self._handle_shuffle_unavailability(available_games)
-            return
-
-        try:
-            next_game_path = random.choice(list(available_games.keys()))
-            self._switch_to_game(next_game_path)
-        except Exception as e:
-            logging.error(f"Error switching to the next game: {e}")
-            self.statusBar().showMessage(f"An error occurred while switching games: {e}")
-
-        self.current_game_path = next_game_path
-        shuffle_interval = self.determine_shuffle_interval()
-        logging.info("Scheduling next shuffle in %d seconds", shuffle_interval // 1000)
-        self.shuffle_timer.start(shuffle_interval)
-
-        if not self.is_bizhawk_process_running():
-            self.pause_shuffle()
 
     def force_swap(self):
         if self.is_shuffling:
-            self.shuffle_games()
-            shuffle_interval = self.determine_shuffle_interval()
+            # Force swaps take the planned game too, so its files are already warm
+            return self.shuffle_engine.swap_now()
+        logging.warning("Shuffling is not active. Cannot force swap.")
+        return False
+
+    def init_action_queue(self):
+        # Twitch redemptions and hotkeys go through here so bursts collapse into one action
+        self.action_queue = ActionQueue(
+            force_swap=self.force_swap,
+            pause=self.shuffle_engine.pause,
+            resume=self.shuffle_engine.resume,
+            toggle_completion=self.toggle_game_completion,
+            swap_cooldown=self.config.get('force_swap_cooldown', 5),
+            max_queued_swaps=self.config.get('max_queued_force_swaps', 0))
+        self.action_timer = QTimer(self)
+        self.action_timer.setSingleShot(True)
+        self.action_timer.timeout.connect(self.process_actions)
+        self.actions_submitted.connect(self.process_actions)
+
+    def process_actions(self):
+        self.action_timer.stop()
+        self.action_queue.process()
+        if (wait := self.action_queue.next_wakeup()) is not None:
+            self.action_timer.start(max(1, int(wait * 1000)))
+
+    def request_force_swap(self):
+        if not self.action_queue.submit_force_swap():
+            logging.info("Force swap merged into one already queued or just made")
+        self.actions_submitted.emit()
+
+    def on_shuffle_timer(self):
+        # QTimer can fire a little early; re-arm for whatever is left
+        if not self.shuffle_engine.poll() and (remaining := self.shuffle_engine.time_until_swap()) is not None:
+            self.shuffle_timer.start(max(1, int(remaining * 1000)))
+
+    def on_shuffle_scheduled(self, seconds):
+        self.shuffle_timer.start(max(1, int(seconds * 1000)))
+
+    def on_shuffle_paused(self, reason):
+        self.shuffle_timer.stop()
+        if self.shuffle_engine.remaining is not None:
+            logging.info("Paused shuffle with %d seconds left", self.shuffle_engine.remaining)
+        if reason == PAUSE_EMULATOR_UNRESPONSIVE:
+            self.statusBar().showMessage("Shuffle paused: emulator is not responding")
+        elif reason == PAUSE_EMULATOR_MISSING:
+            self.statusBar().showMessage("Shuffle paused: BizHawk is not running")
         else:
-            logging.warning("Shuffling is not active. Cannot force swap.")
+            self.statusBar().showMessage("Shuffle paused.", 5000)
 
-    def _handle_shuffle_unavailability(self, available_games):
-        logging.info("Cannot shuffle: Only one game available or all games are completed.")
-        if all(game['completed'] for game in available_games.values()):
+    def on_shuffle_unavailable(self, reason):
+        self.shuffle_timer.stop()
+        self.replay_policy = None
+        if reason == NO_GAMES:
+            QMessageBox.warning(self, "Shuffle Error", "No games available to shuffle.")
+        elif reason == ALL_COMPLETED:
             QMessageBox.information(self, "Congratulations!", "Amazing! You have completed all the games.")
         else:
             QMessageBox.information(self, "Shuffle Info", "Cannot shuffle: Only one game available.")
-        self.is_shuffling = False
 
-    def _switch_to_game(self, next_game_path):
-        next_game_name = self.game_manager.games[next_game_path]['name']
-        self.game_manager.switch_game(next_game_name)
-        if self.current_game_path:
-            self.save_game_state(self.current_game_path)
-            self.update_and_save_session()
-        self.load_game(next_game_path)
-        self.load_game_state(next_game_path)
-        self.update_and_save_session()
-        self.update_session_info()
+    def on_upcoming_planned(self, upcoming):
+        for game_path in upcoming:
+            self.materialize_savestate(game_path, wait=False)
+        if self.prefetcher:
+            self.prefetcher.prefetch([path for game_path in upcoming
+                                      for path in (game_path, self.get_state_path(game_path))])
 
+    def on_swap_started(self, game_path, state_path):
+        self.ensure_directory_exists(state_path)
+        self.materialize_savestate(game_path)
 
+    def on_game_swapped(self, previous_game_path, game_path, result):
+        self.session_manager.record_swap(self.current_session_name, swap_event(
+            previous_game_path, game_path, self.shuffle_engine.last_swap_latency_ms))
+        self.session_manager.save_swap_later(self.current_session_name, self.game_manager, self.shuffle_seed)
+        self.update_session_info()
+        if not self.state_pool_enabled():
+            self.store_savestate(previous_game_path, self.record_savestate_history(previous_game_path))
+        elif previous_game_path:
+            # With the in-memory pool the outgoing state may never have reached its file;
+            # flush_savestates ingests and snapshots it once the emulator has written it out
+            self.unflushed_game_paths.add(previous_game_path)
 
+    def on_swap_failed(self, game_path, error):
+        if not isinstance(error, Python_Client.CommandTimeout):
+            self.statusBar().showMessage(f"An error occurred while switching games: {error}")
 
     def ensure_directory_exists(self, state_path):
         directory = Path(state_path).parent
@@ -655,14 +853,168 @@ class MainWindow(QMainWindow):
         logging.error(f"{message}: {exception}")
         QMessageBox.critical(self, title, f"{message}: {exception}")
 
+    def on_emulator_event(self, name, args):
+        if name == 'frames':
+            # Only frames played during an active shuffle count towards the current game
+            if self.is_shuffling and self.game_manager.current_game and len(args) >= 2:
+                try:
+                    self.game_manager.stats_tracker.add_emulated_frames(int(args[0]), float(args[1]))
+                except ValueError:
+                    logging.warning(f"Malformed frames event from the emulator: {args}")
+        elif name in ('romloaded', 'stateloaded'):
+            logging.debug(f"Emulator event {name}: {args[0] if args else ''}")
+
+    def get_emulator_timeout(self):
+        return self.config.get('emulator_timeout', Python_Client.DEFAULT_TIMEOUT)
+
+    def state_pool_enabled(self):
+        return bool(self.config.get('memory_state_budget_mb', 0))
+
+    def configure_state_pool(self):
+        budget_mb = self.config.get('memory_state_budget_mb', 0)
+        self.emulator.call(self.emulator.client.configure_state_pool(budget_mb, self.get_emulator_timeout()),
+                           lambda future: self.log_emulator_failure(future, "Could not configure the in-memory savestate pool"))
+
+    def flush_savestates(self):
+        if not self.state_pool_enabled():
+            self.store_all_savestates()
+            return
+
+        def on_flushed(future):
+            self.log_emulator_failure(future, "Some savestates could not be written to disk")
+            recorded = {game_path: self.record_savestate_history(game_path) for game_path in self.unflushed_game_paths}
+            self.unflushed_game_paths.clear()
+            self.store_all_savestates(recorded)
+
+        self.emulator.call(self.emulator.client.flush_states(), on_flushed)
+
+    def store_savestate(self, game_path, recorded=None):
+        """Ingest a game's working state file into the shared store in a worker process.
+
+        Once the session on disk references the blob, and ``recorded`` (the
+        history snapshot of the file) is written, the working file is dropped;
+        materialize_savestate writes it out again before the game is played.
+        """
+        if not game_path or not os.path.isfile(state_path := self.get_state_path(game_path)):
+            return
+        session_name = self.current_session_name
+        future = self.savestate_store.put_async(state_path)
+        self.savestate_ingests[game_path] = future
+        self.emulator.watch(future, lambda done: self._on_savestate_stored(session_name, game_path, done, recorded))
+
+    def _on_savestate_stored(self, session_name, game_path, future, recorded=None):
+        latest = self.savestate_ingests.get(game_path) is future
+        if latest:
+            del self.savestate_ingests[game_path]
+        try:
+            digest, size, newly_stored = future.result()
+        except Exception as e:
+            logging.error(f"Error storing savestate for {game_path}: {e}")
+            return
+        if not latest or session_name != self.current_session_name or game_path not in self.game_manager.games:
+            # Superseded by a later ingest of the same game, or the session changed meanwhile
+            self.savestate_store.release(future)
+            return
+        self.game_manager.set_save_state(game_path, digest)
+        logging.info(f"Savestate for {game_path} stored as {digest[:12]} "
+                     f"({size} bytes, {'new' if newly_stored else 'deduplicated'})")
+        written = Future()
+
+        def on_written():
+            if recorded is not None:
+                wait([recorded], timeout=30)  # On the session writer thread, so the GUI doesn't wait
+            written.set_result(None)
+
+        self.session_manager.after_write(session_name, on_written)
+        self.emulator.watch(written, lambda _: self.release_savestate(game_path, future, recorded))
+        self.update_and_save_session()
+
+    def release_savestate(self, game_path, future, recorded=None):
+        """Let the store collect the blob now that the session references it, and drop the working file
+        unless the game is in play, its history snapshot isn't written yet or an export may be reading it."""
+        keep = (self.shuffle_engine.swap_in_flight or game_path == self.current_game_path
+                or game_path in self.shuffle_engine.plan.upcoming or (recorded is not None and not recorded.done())
+                or self.archive_job is not None)
+        self.savestate_store.release(future, drop_source=not keep)
+
+    def store_all_savestates(self, recorded=None):
+        for game_path in list(self.game_manager.games):
+            self.store_savestate(game_path, (recorded or {}).get(game_path))
+
+    def materialize_savestate(self, game_path, wait=True):
+        """Restore a game's working state file from the store when only its reference exists."""
+        state_path = self.get_state_path(game_path)
+        digest = self.game_manager.save_states.get(game_path)
+        if os.path.exists(state_path) or not isinstance(digest, str) or not self.savestate_store.has(digest):
+            return
+        try:
+            if wait:
+                self.savestate_store.materialize(digest, state_path)
+            else:
+                self.savestate_store.materialize_async(digest, state_path)
+        except Exception as e:
+            logging.error(f"Error restoring savestate for {game_path}: {e}")
+
+    def get_savestate_history(self):
+        history_dir = os.path.join(self.get_session_path(self.current_session_name), 'savestate_history')
+        if self.savestate_history is None or self.savestate_history.directory != history_dir:
+            if self.savestate_history is not None:
+                self.savestate_history.flush()
+            self.savestate_history = SavestateHistory(
+                history_dir, self.config.get('savestate_history_size', 5),
+                self.config.get('savestate_history_quota_mb', 512) * 1024 * 1024)
+        return self.savestate_history
+
+    def record_savestate_history(self, game_path):
+        """Snapshot a game's state file on the history writer thread; unchanged files are skipped."""
+        if game_path and self.current_session_name:
+            return self.get_savestate_history().record(Path(game_path).stem, self.get_state_path(game_path))
+        return None
+
+    def restore_savestate(self, game_path, snapshot_id):
+        """Put a snapshot back on the history writer thread; the emulator is told once the file is in place."""
+        state_path = self.get_state_path(game_path)
+        future = self.get_savestate_history().restore(Path(game_path).stem, snapshot_id, state_path)
+        self.emulator.watch(future, lambda done: self._on_savestate_restored(game_path, snapshot_id, state_path, done))
+
+    def _on_savestate_restored(self, game_path, snapshot_id, state_path, future):
+        try:
+            future.result()
+        except Exception as e:
+            self.display_critical_error("Restore Savestate Error", "Error restoring savestate", e)
+            return
+        # An in-memory copy in the emulator would win over the restored file on the next swap-in
+        self.emulator.call(self.emulator.client.forget_state(state_path, self.get_emulator_timeout()),
+                           lambda future: self.log_emulator_failure(future, "Could not drop the in-memory savestate"))
+        if self.is_shuffling and game_path == self.current_game_path:
+            self.emulator.call(self.emulator.client.load_state(state_path, self.get_emulator_timeout()),
+                               lambda future: self.log_emulator_failure(future, "Could not load the restored savestate"))
+        self.store_savestate(game_path)
+        logging.info(f"Restored savestate snapshot {snapshot_id} for {game_path}")
+        self.statusBar().showMessage("Savestate restored.", 5000)
+
+    def log_emulator_failure(self, future, message):
+        try:
+            result = future.result()
+            if result.status != 'ok':
+                logging.error(f"{message}: {result.message}")
+        except Exception as e:
+            logging.error(f"{message}: {e}")
+
     def save_game_state(self, game_path):
         if not game_path:
             return
         state_path = self.get_state_path(game_path)
         self.ensure_directory_exists(state_path)
         try:
-            Python_Client.save_state(state_path)
-            logging.info(f"Game state saved successfully to {state_path}")
+            result = Python_Client.save_state(state_path, self.get_emulator_timeout())
+            if result.status == 'ok':
+                logging.info(f"Game state saved successfully to {state_path} in {result.elapsed_ms:.1f} ms")
+                self.record_savestate_history(game_path)
+            else:
+                logging.error(f"Emulator failed to save state to {state_path}: {result.message}")
+        except Python_Client.CommandTimeout:
+            raise
         except Exception as e:
             self.display_critical_error("Save State Error", "Error saving game state", e)
 
@@ -670,7 +1022,11 @@ class MainWindow(QMainWindow):
         if not game_path:
             return
         try:
-            Python_Client.load_rom(game_path)
+            result = Python_Client.load_rom(game_path, self.get_emulator_timeout())
+            if result.status != 'ok':
+                logging.error(f"Emulator failed to load {game_path}: {result.message}")
+        except Python_Client.CommandTimeout:
+            raise
         except Exception as e:
             self.display_critical_error("Load Game Error", "An error occurred while loading the game", e)
 
@@ -679,8 +1035,13 @@ class MainWindow(QMainWindow):
         self.ensure_directory_exists(state_file)
         if Path(state_file).exists():
             try:
-                Python_Client.load_state(state_file)
-                logging.info(f"Game state loaded successfully from {state_file}")
+                result = Python_Client.load_state(state_file, self.get_emulator_timeout())
+                if result.status == 'ok':
+                    logging.info(f"Game state loaded successfully from {state_file} in {result.elapsed_ms:.1f} ms")
+                else:
+                    logging.error(f"Emulator failed to load state from {state_file}: {result.message}")
+            except Python_Client.CommandTimeout:
+                raise
             except Exception as e:
                 self.display_critical_error("Load Game State Error", "Error loading game state", e)
         else:
@@ -769,6 +1130,23 @@ class MainWindow(QMainWindow):
             ]
         )
 
+        self.stats_file_output_checkbox = QCheckBox("Write stats text files")
+        self.stats_file_output_checkbox.setChecked(self.config.get('stats_file_output', True))
+        self.overlay_enabled_checkbox = QCheckBox("Run overlay server for OBS browser sources")
+        self.overlay_enabled_checkbox.setChecked(self.config.get('overlay_server_enabled', False))
+        self.overlay_port_spinbox = QSpinBox()
+        self.overlay_port_spinbox.setRange(1024, 65535)
+        self.overlay_port_spinbox.setValue(self.config.get('overlay_port', OVERLAY_PORT))
+        stats_output_group_box = setup_group_box(
+            "Stats Output",
+            no_op,
+            [
+                self.stats_file_output_checkbox,
+                self.overlay_enabled_checkbox,
+                ("Overlay Port (http://127.0.0.1:<port>/):", self.overlay_port_spinbox),
+            ]
+        )
+
 
         save_config_button = QPushButton("Save Configuration")
         save_config_button.clicked.connect(self.save_configuration)
@@ -779,6 +1157,7 @@ class MainWindow(QMainWindow):
 
         [main_layout.addWidget(group_box) for group_box in [style_group_box, bizhawk_group_box, shuffle_interval_group_box]]
         main_layout.addWidget(hotkey_group_box)
+        main_layout.addWidget(stats_output_group_box)
         main_layout.addWidget(save_config_button)
         main_layout.addWidget(load_default_config_button)
         main_layout.addStretch()
@@ -810,7 +1189,7 @@ class MainWindow(QMainWindow):
 
         command = [str(bizhawk_exe), f"--lua={lua_script}"]
         try:
-            subprocess.Popen(command)
+            self.emulator_supervisor.launch(command)
             return True
         except Exception as e:
             QMessageBox.critical(self, "Execution Error", f"An error occurred while launching BizHawk: {e}")
@@ -819,7 +1198,9 @@ class MainWindow(QMainWindow):
     def register_global_hotkey(self, hotkey):
         """Registers a global hotkey to toggle game completion."""
         def hotkey_action():
-            self.toggle_game_completion()
+            # Runs on the keyboard hook's thread; the toggle itself happens on the GUI thread
+            self.action_queue.submit_toggle_completion()
+            self.actions_submitted.emit()
 
         keyboard.add_hotkey(hotkey, hotkey_action)
 
@@ -856,10 +1237,27 @@ class MainWindow(QMainWindow):
             'max_shuffle_interval': max_interval,
             'global_hotkey': global_hotkey,
             'style': self.style_selector.currentText().lower(),
-            'twitch_pause_duration': self.pause_duration_spinbox.value()
+            'twitch_pause_duration': self.pause_duration_spinbox.value(),
+            'emulator_timeout': self.config.get('emulator_timeout', Python_Client.DEFAULT_TIMEOUT),
+            'memory_state_budget_mb': self.config.get('memory_state_budget_mb', 0),
+            'shuffle_lookahead': self.config.get('shuffle_lookahead', 2),
+            'prefetch_enabled': self.config.get('prefetch_enabled', True),
+            'savestate_history_size': self.config.get('savestate_history_size', 5),
+            'savestate_history_quota_mb': self.config.get('savestate_history_quota_mb', 512),
+            'shuffle_policy': self.config.get('shuffle_policy', DEFAULT_POLICY),
+            'session_shuffle_policies': self.config.get('session_shuffle_policies', {}),
+            'force_swap_cooldown': self.config.get('force_swap_cooldown', 5),
+            'max_queued_force_swaps': self.config.get('max_queued_force_swaps', 0),
+            'stats_file_output': self.stats_file_output_checkbox.isChecked(),
+            'overlay_server_enabled': self.overlay_enabled_checkbox.isChecked(),
+            'overlay_port': self.overlay_port_spinbox.value(),
+            'session_backend': self.config.get('session_backend', 'json'),
+            'last_session': self.config.get('last_session')
         }
 
         self.config_manager.save_config(config_data)
+        self.config.update(config_data)
+        self.apply_stats_output_config()
         QMessageBox.information(self, "Success", "Configuration saved successfully.")
 
 
@@ -928,34 +1326,39 @@ class MainWindow(QMainWindow):
             self.output_stats_to_files(total_swaps, real_time_total, current_game, current_game_stats)
 
     def output_stats_to_files(self, total_swaps, real_time_total, current_game, current_game_stats):
-        session_dir = self.get_session_path(self.current_session_name)
-        stats_dir = os.path.join(session_dir, 'stats')
-        os.makedirs(stats_dir, exist_ok=True)  # Ensure the stats directory exists
-
-        # Define file paths
-        total_swaps_file = os.path.join(stats_dir, 'total_swaps.txt')
-        total_time_file = os.path.join(stats_dir, 'total_time.txt')
-        current_game_file = os.path.join(stats_dir, 'current_game.txt')
-        current_game_swaps_file = os.path.join(stats_dir, 'current_game_swaps.txt')
-        current_game_time_file = os.path.join(stats_dir, 'current_game_time.txt')
-
-        # Write stats to files
-        with open(total_swaps_file, 'w') as f:
-            f.write(str(total_swaps))
-        with open(total_time_file, 'w') as f:
-            f.write(self.format_time(real_time_total))
-        with open(current_game_file, 'w') as f:
-            f.write(current_game or "None")
-        with open(current_game_swaps_file, 'w') as f:
-            f.write(str(current_game_stats['swaps']))
-        with open(current_game_time_file, 'w') as f:
-            f.write(self.format_time(current_game_stats['time_spent'] + self.calculate_real_time_total(0) if current_game else 0))
+        stats = {
+            'total_swaps': str(total_swaps),
+            'total_time': self.format_time(real_time_total),
+            'current_game': current_game or "None",
+            'current_game_swaps': str(current_game_stats['swaps']),
+            'current_game_time': self.format_time(current_game_stats['time_spent'] + self.calculate_real_time_total(0) if current_game else 0),
+        }
+        # Both outputs only do work for values that changed since the last second
+        if self.overlay_server:
+            self.overlay_server.publish(stats)
+        if self.config.get('stats_file_output', True) and self.current_session_name:
+            stats_dir = os.path.join(self.get_session_path(self.current_session_name), 'stats')
+            if self.stats_file_writer is None or self.stats_file_writer.directory != stats_dir:
+                self.stats_file_writer = StatsFileWriter(stats_dir)
+            self.stats_file_writer.write(stats)
+
+    def apply_stats_output_config(self):
+        port = self.config.get('overlay_port', OVERLAY_PORT)
+        if self.overlay_server and (not self.config.get('overlay_server_enabled', False) or self.overlay_server.port != port):
+            self.overlay_server.stop()
+            self.overlay_server = None
+        if self.config.get('overlay_server_enabled', False) and not self.overlay_server:
+            try:
+                self.overlay_server = OverlayServer(port=port)
+                self.overlay_server.start()
+            except OSError as e:
+                logging.error(f"Overlay server could not start: {e}")
+                self.overlay_server = None
 
     def calculate_real_time_total(self, total_time):
-        start_time = self.game_manager.stats_tracker.start_time
-        if start_time is None:
-            start_time = time.time()  # Or some other appropriate value
-        return total_time + (time.time() - start_time if self.game_manager.current_game else 0)
+        if not self.game_manager.current_game:
+            return total_time
+        return total_time + self.game_manager.stats_tracker.current_time_spent()
 
     def set_label_text(self, label, prefix, value):
         label.setText(f"{prefix}: {value}")
@@ -985,7 +1388,10 @@ class MainWindow(QMainWindow):
             ("Create New Session", self.create_new_session),
             ("Rename Selected Session", self.rename_current_session),
             ("Delete Selected Session", self.delete_current_session),
-            ("Load Session...", self.load_session_from_file)
+            ("Load Session...", self.load_session_from_file),
+            ("Export Session...", self.export_session_to_file),
+            ("Export Session Archive...", self.export_session_archive),
+            ("Import Session Archive...", self.import_session_archive)
         ]
 
         [layout.addWidget(self.create_button(text, slot)) for text, slot in buttons_info]
@@ -1004,9 +1410,10 @@ class MainWindow(QMainWindow):
 
     def load_default_session(self):
         if session_data := self.session_manager.load_session('Default Session'):
-            self.game_manager.games = session_data['games']
+            self.game_manager.load_games(session_data['games'])
             self.game_manager.stats_tracker.get_stats()
             self.game_manager.load_save_states(session_data['save_states'])
+            self.load_shuffle_seed(session_data)
             self.current_session_name = 'Default Session'
 
     # def populate_session_dropdown(self):
@@ -1016,12 +1423,7 @@ class MainWindow(QMainWindow):
 
 
     def get_available_sessions(self):
-        sessions_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "sessions")
-        try:
-            return [name for name in os.listdir(sessions_dir) if os.path.isdir(os.path.join(sessions_dir, name))]
-        except FileNotFoundError:
-            logging.error("Sessions directory not found.")
-            return []
+        return self.session_manager.list_sessions()
     
     # def load_session_from_dropdown(self):
     #     selected_session_index = self.session_dropdown.currentIndex()
@@ -1036,43 +1438,135 @@ class MainWindow(QMainWindow):
             with open(session_file_path, 'r') as file:
                 self.session_data_load(file)            
         
+    def export_session_to_file(self):
+        if not self.current_session_name:
+            QMessageBox.warning(self, "Export Error", "No session is currently loaded.")
+            return
+        file_path = QFileDialog.getSaveFileName(self, "Export Session", f"{self.current_session_name}.json",
+                                                "Session Files (*.json)")[0]
+        if not file_path:
+            return
+        self.update_and_save_session()
+        if self.session_manager.export_session_json(self.current_session_name, file_path):
+            self.statusBar().showMessage(f"Session '{self.current_session_name}' exported to {file_path}.", 5000)
+        else:
+            QMessageBox.warning(self, "Export Error", f"Failed to export the session '{self.current_session_name}'.")
+
+    def export_session_archive(self):
+        if not self.current_session_name:
+            QMessageBox.warning(self, "Export Error", "No session is currently loaded.")
+            return
+        session_name = self.current_session_name
+        file_path = QFileDialog.getSaveFileName(self, "Export Session Archive", f"{session_name}{ARCHIVE_SUFFIX}",
+                                                f"Session Archives (*{ARCHIVE_SUFFIX})")[0]
+        if not file_path:
+            return
+        self.update_and_save_session()
+        if self.game_manager.stats_tracker.event_log is not None:
+            self.game_manager.stats_tracker.event_log.sync()
+        self.run_archive_job(
+            f"Exporting session '{session_name}'...",
+            lambda progress, cancelled: export_session(self.session_manager, self.savestate_store, session_name,
+                                                       file_path, progress, cancelled),
+            lambda manifest: self.statusBar().showMessage(
+                f"Session '{session_name}' exported to {file_path} ({len(manifest['files'])} files).", 5000))
+
+    def import_session_archive(self):
+        file_path = QFileDialog.getOpenFileName(self, "Import Session Archive", "",
+                                                f"Session Archives (*{ARCHIVE_SUFFIX})")[0]
+        if not file_path:
+            return
+        try:
+            session_name = read_manifest(file_path)['name']
+        except ArchiveError as e:
+            QMessageBox.warning(self, "Import Error", str(e))
+            return
+        if self.session_manager.session_exists(session_name) or os.path.exists(self.get_session_path(session_name)):
+            session_name, ok = QInputDialog.getText(
+                self, "Import Session Archive", f"A session named '{session_name}' already exists. Import it as:")
+            if not ok or not session_name:
+                return
+        self.run_archive_job(
+            f"Importing session '{session_name}'...",
+            lambda progress, cancelled: import_session(self.session_manager, self.savestate_store, file_path,
+                                                       session_name, progress, cancelled),
+            self.on_session_archive_imported)
+
+    def on_session_archive_imported(self, session_name):
+        self.statusBar().showMessage(f"Session '{session_name}' has been imported.", 5000)
+        if QMessageBox.question(self, "Session Imported", f"Load the imported session '{session_name}' now?",
+                                QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes:
+            self.load_session(session_name)
+
+    def run_archive_job(self, label, job, on_success):
+        """Run an export or import on a worker thread, with a progress dialog that can cancel it."""
+        if self.archive_job is not None:
+            self.statusBar().showMessage("Another session export or import is still running.", 5000)
+            return
+        dialog = QProgressDialog(label, "Cancel", 0, 1000, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(500)
+        cancel = threading.Event()
+        dialog.canceled.connect(cancel.set)
+        self.archive_job = (dialog, on_success)
+
+        def run():
+            result, error = None, None
+            try:
+                result = job(lambda done, total: self.archive_progress.emit(done / total if total else 1.0),
+                             cancel.is_set)
+            except Exception as e:
+                error = e
+            self.archive_finished.emit(result, error)
+        threading.Thread(target=run, name="SessionArchive", daemon=True).start()
+
+    def on_archive_progress(self, fraction):
+        if self.archive_job is not None:
+            self.archive_job[0].setValue(int(fraction * 1000))
+
+    def on_archive_finished(self, result, error):
+        dialog, on_success = self.archive_job
+        self.archive_job = None
+        dialog.reset()
+        if isinstance(error, ArchiveCancelled):
+            self.statusBar().showMessage("Session export or import cancelled.", 5000)
+        elif error is not None:
+            logging.error(f"Session archive error: {error}")
+            QMessageBox.warning(self, "Session Archive Error", str(error))
+        else:
+            on_success(result)
+
     def load_session(self, session_name):
-        session_folder = self.get_session_path(session_name)
-        session_file = os.path.join(session_folder, 'session.json')
+        # Writes of the session being left must land before the game manager switches to another one
+        self.session_manager.flush()
         try:
-            with open(session_file, 'r') as file:
-                self.session_data_load(file)
+            session_data = self.session_manager.load_session(session_name)
+            if session_data is None:
+                raise FileNotFoundError(f"Session '{session_name}' not found")
+            self.apply_session_data(session_data)
         except Exception as e:
             QMessageBox.warning(self, "Load Error", f"Failed to load the session '{session_name}'. It may be corrupted or missing. Error: {e}")          
 
 
     def session_data_load(self, file):
-        session_data = json.load(file)
+        self.apply_session_data(json.load(file))
+
+    def apply_session_data(self, session_data):
         self.current_session_name = session_data['name']
         self.game_manager.load_games(session_data['games'])
         self.game_manager.load_save_states(session_data.get('save_states', {}))
+        # Stats and their event log are this session's own from here on, so nothing lands in the one left behind
+        self.initialize_session_data(session_data)
         self.refresh_ui()
         self.statusBar().showMessage(f"Session '{self.current_session_name}' has been loaded successfully.", 5000)
         self.save_last_session(self.current_session_name)            
 
     def create_default_session(self):
         """Creates a default session if one doesn't already exist, or loads it if it already exists"""
-        default_session_path = self.get_session_path('Default Session')
-        default_session_file = os.path.join(default_session_path, 'session.json')
-    
-        if os.path.exists(default_session_file):
+        if self.session_manager.session_exists('Default Session'):
             self.load_default_session()
         else:
-            os.makedirs(default_session_path, exist_ok=True)  # Ensure the session folder exists
-            # Initialize session data with an empty structure
-            session_data = {
-                'name': 'Default Session',
-                'games': {},  # Use an empty dictionary for games
-                'stats': [],  # Use an empty list for stats
-                'save_states': {}  # Use an empty dictionary for save states
-            }
-            with open(default_session_file, 'w') as f:
-                json.dump(session_data, f, indent=4)
+            self.session_manager.create_session('Default Session')
             self.current_session_name = 'Default Session'
             self.update_session_info()  # Assuming update_session_info is implemented to refresh UI
         self.save_last_session(self.current_session_name)      
@@ -1086,26 +1580,15 @@ class MainWindow(QMainWindow):
         new_session_name, ok = QInputDialog.getText(self, 'Create New Session', 'Enter new session name:')
         if ok and new_session_name:
             new_session_path = self.get_session_path(new_session_name)
-            if os.path.exists(new_session_path):
+            if os.path.exists(new_session_path) or self.session_manager.session_exists(new_session_name):
                 QMessageBox.warning(self, "Session Creation Error", f"The session '{new_session_name}' already exists.")
                 return
     
-            os.makedirs(new_session_path, exist_ok=True)
-            save_states_path = os.path.join(new_session_path, 'savestates')
-            os.makedirs(save_states_path, exist_ok=True)
-    
-            session_file_path = os.path.join(new_session_path, 'session.json')
-            session_data = {
-                'name': new_session_name,
-                'games': {},
-                'stats': {},
-                'save_states': {}
-            }
-    
-            with open(session_file_path, 'w') as f:
-                json.dump(session_data, f, indent=4)
+            shuffle_seed = new_seed()
+            self.session_manager.create_session(new_session_name, shuffle_seed=shuffle_seed)
     
             self.current_session_name = new_session_name
+            self.shuffle_seed = shuffle_seed
             self.refresh_ui()
             self.populate_session_dropdown()
             self.session_dropdown.setCurrentText(new_session_name)
@@ -1142,8 +1625,11 @@ class MainWindow(QMainWindow):
                 available_sessions = self.get_available_sessions()  # Make sure this method returns a list of session names
                 is_last_session = len(available_sessions) == 1 and self.current_session_name in available_sessions
     
+                self.close_event_log()
                 if self.session_manager.delete_session(self.current_session_name):
                     self.current_session_name = None
+                    removed = self.savestate_store.collect_garbage(self.session_manager.referenced_savestates())
+                    logging.info(f"Removed {removed} savestate blobs no longer used by any session")
                     self.statusBar().showMessage("Session has been deleted successfully.", 5000)
                     self.populate_session_dropdown()
     
@@ -1168,7 +1654,12 @@ class MainWindow(QMainWindow):
             if self.current_session_name:
                 new_name, ok = QInputDialog.getText(self, "Rename Session", "Enter new name for the session:", text=self.current_session_name)
                 if ok and new_name:
+                    event_log = self.game_manager.stats_tracker.event_log
+                    if event_log is not None:
+                        event_log.close()  # Reopened by its next record if the rename fails
                     if self.session_manager.rename_session(self.current_session_name, new_name):
+                        if event_log is not None:
+                            self.game_manager.stats_tracker.event_log = self.open_event_log(new_name)
                         self.session_rename_result(new_name)
                     else:
                         QMessageBox.warning(self, "Rename Error", f"Failed to rename the session to '{new_name}'.")
@@ -1183,6 +1674,10 @@ class MainWindow(QMainWindow):
 
 
     def session_rename_result(self, new_name):
+        session_policies = self.config.get('session_shuffle_policies', {})
+        if self.current_session_name in session_policies:
+            session_policies[new_name] = session_policies.pop(self.current_session_name)
+            self.config_manager.save_config(self.config)
         self.current_session_name = new_name
         self.statusBar().showMessage(f"Session renamed to '{new_name}'.", 5000)
         self.refresh_ui()
@@ -1194,90 +1689,72 @@ class MainWindow(QMainWindow):
         return os.path.join('sessions', session_name)  # Adjust the path as necessary
             
     def update_session_info(self):
+        self.update_shuffle_policy_selector()
         if not self.current_session_name:
             self.session_info_label.setText("No session available.")
             logging.debug("update_session_info called with no current session name set.")
             return
 
-        session_data = self.session_manager.get_session_info(self.current_session_name)
+        summary = self.session_manager.get_session_summary(self.current_session_name)
 
-        if not session_data:
-            self.session_info_label.setText(f"Session file for '{self.current_session_name}' does not exist.")
+        if not summary:
+            self.set_session_info_text(f"Session file for '{self.current_session_name}' does not exist.")
             logging.debug(f"Session data for '{self.current_session_name}' could not be found.")
-# sourcery skip: simplify-constant-sum
             return
+        tracker = self.game_manager.stats_tracker
+        if tracker.changed_games:
+            # Swaps since the last write are only in the event log so far
+            summary = SessionSummary(summary.name, summary.game_count, summary.completed_count, tracker.total_swaps,
+                                     tracker.total_shuffling_time, summary.shuffle_seed)
         try:
-            self.sesson_info_values(session_data)
+            self.sesson_info_values(summary)
         except Exception as e:
             logging.error(f"An unexpected error occurred while updating the session info: {e}")
-            self.session_info_label.setText("An error occurred while loading session details.")
-
-
-    def sesson_info_values(self, session_data):
-        session_name = session_data['name']
-        games = session_data['games']
-        game_count = len(games)
+            self.set_session_info_text("An error occurred while loading session details.")
 
-        # Corrected line: Use games.values() to iterate over dictionary values
-        completed_game_count = sum(bool(game.get('completed', False))
-                               for game in games.values())
-
-        # Check if 'stats' has the expected three elements, otherwise use default values
-        if 'stats' in session_data and len(session_data['stats']) == 3:
-            game_stats, total_swaps, total_time = session_data['stats']
-        else:
-            game_stats = {}  # Default empty dictionary for game_stats
-            total_swaps = 0  # Default zero for total_swaps
-            total_time = 0   # Default zero for total_time
-            logging.debug(f"Session '{session_name}' stats are missing or incomplete. Using default values.")
 
+    def sesson_info_values(self, summary):
         # Formatting total_time to HH:MM:SS using a method assumed to be defined elsewhere in MainWindow
-        formatted_total_time = self.stat_tracker.format_time(total_time)
+        formatted_total_time = self.stat_tracker.format_time(summary.total_time)
+        seed = summary.shuffle_seed if summary.shuffle_seed is not None else 'not set'
 
-        self.session_info_label.setText(f"Session: {session_name}\n" +
-                                        f"Games: {game_count}\n" +
-                                        f"Completed: {completed_game_count}\n" +
-                                        f"Swaps: {total_swaps}\n" +
-                                        f"Time: {formatted_total_time}")
+        self.set_session_info_text(f"Session: {summary.name}\n" +
+                                   f"Games: {summary.game_count}\n" +
+                                   f"Completed: {summary.completed_count}\n" +
+                                   f"Swaps: {summary.total_swaps}\n" +
+                                   f"Time: {formatted_total_time}\n" +
+                                   f"Seed: {seed}")
 
+    def set_session_info_text(self, text):
+        # Called every second; only touch the label when the text actually changed
+        if self.session_info_label.text() != text:
+            self.session_info_label.setText(text)
 
 
-    def update_and_save_session(self):
-        # Gather the updated stats from the StatsTracker
-        current_game_stats, total_swaps, total_shuffling_time = self.game_manager.stats_tracker.get_stats()
 
-        # Update the session data with the current stats
-        session_data = {
-            'name': self.current_session_name,
-            'games': self.game_manager.games,
-            'stats': [
-                current_game_stats,
-                total_swaps,
-                total_shuffling_time
-            ],
-            'save_states': self.game_manager.save_states
-        }
-
-        session_folder = self.get_session_path(self.current_session_name)
-        os.makedirs(session_folder, exist_ok=True)  # Ensure the session folder exists
-        session_file_path = os.path.join(session_folder, 'session.json')
-
-        # Use the SessionManager to save the session to disk
-        self.session_manager.save_session(self.current_session_name, session_data['games'], 
-                                        session_data['stats'], session_data['save_states'], session_file_path)
+    def update_and_save_session(self):
+        # Only mark the session dirty; the session writer thread serialises and writes it shortly after
+        self.session_manager.save_session_later(self.current_session_name, self.game_manager, self.shuffle_seed)
         self.save_last_session(self.current_session_name)
         
     def save_last_session(self, session_name):
+        if self.config.get('last_session') == session_name:
+            return
         config_path = self.config_manager.get_config_path()  # Assuming this function correctly retrieves config file path
         try:
-            with open(config_path, 'r+') as file:
+            with open(config_path, 'r') as file:
                 config_data = json.load(file)
-                config_data['last_session'] = session_name
-                file.seek(0)
-                json.dump(config_data, file, indent=4)
-                file.truncate()
+            config_data['last_session'] = session_name
+            write_json_atomic(config_path, config_data)
+            self.config['last_session'] = session_name
         except Exception as e:
             logging.error(f"Error saving last session: {e}")       
+
+    def closeEvent(self, event):
+        # Session writes are queued on a background thread; make sure they reach the disk before exiting
+        self.session_manager.flush()
+        self.close_event_log()
+        super().closeEvent(event)
             
     def load_last_session(self):
         # Attempt to load the last session if its name exists in the config
@@ -1318,26 +1795,36 @@ class MainWindow(QMainWindow):
 
 
     def create_session_savestate_dir(self, new_session_path, new_session_name):
-        # Create new session directory and savestates subdirectory
-        os.makedirs(new_session_path, exist_ok=True)
-        save_states_path = os.path.join(new_session_path, 'savestates')
-        os.makedirs(save_states_path, exist_ok=True)
-
-        # Assuming you have a method to get the current session data
-        current_session_data = self.session_manager.get_session_info(self.current_session_name)
-
-        # Adjust the 'name' in the session data
-        current_session_data['name'] = new_session_name
-
-        # Save the session data to 'session.json' in the new session folder
-        session_file_path = os.path.join(new_session_path, 'session.json')
-        with open(session_file_path, 'w') as f:
-            json.dump(current_session_data, f, indent=4)
-
-        # Copy savestates from the current session to the new session
-        current_save_states_path = os.path.join(self.get_session_path(self.current_session_name), 'savestates')
-        shutil.copytree(current_save_states_path, save_states_path, dirs_exist_ok=True)
-
+        # Make sure every current state is in the shared store, then copy references instead of files.
+        # The states are ingested in worker processes; the clone happens once they are all stored.
+        session_name = self.current_session_name
+        state_paths = {self.get_state_path(game_path): game_path for game_path in self.game_manager.games}
+        self.statusBar().showMessage(f"Saving the current session as '{new_session_name}'...")
+        self.emulator.watch(self.savestate_store.put_many_async(state_paths),
+                            lambda done: self._on_session_states_stored(session_name, new_session_name,
+                                                                        state_paths, done.result()))
+
+    def _on_session_states_stored(self, session_name, new_session_name, state_paths, ingests):
+        try:
+            if session_name != self.current_session_name:
+                raise RuntimeError(f"Session '{session_name}' was closed before its savestates were stored")
+            for state_path, future in ingests.items():
+                try:
+                    self.game_manager.set_save_state(state_paths[state_path], future.result()[0])
+                except Exception as e:
+                    logging.error(f"Error storing savestate {state_path}: {e}")
+            self.update_and_save_session()
+            if not self.session_manager.clone_session(session_name, new_session_name,
+                                                      dict(self.game_manager.save_states)):
+                raise RuntimeError(f"Session '{session_name}' could not be read")
+        except Exception as e:
+            QMessageBox.warning(self, "Save Error", f"Failed to save the current session as '{new_session_name}'. Error: {e}")
+            return
+        finally:
+            # clone_session flushed the current session, so both sessions now reference the blobs
+            for future in ingests.values():
+                self.savestate_store.release(future)
+        self.statusBar().clearMessage()
         QMessageBox.information(self, "Session Saved", f"Current session has been saved as '{new_session_name}' successfully.")
 
      
@@ -1553,9 +2040,10 @@ class MainWindow(QMainWindow):
       
             
     def pause_shuffle_for_duration(self):
-        if self.is_shuffling:
-            self.pause_shuffle()
-            QTimer.singleShot(self.pause_duration_spinbox.value() * 1000, self.resume_shuffle)
+        if self.shuffle_engine.running:
+            # Overlapping pauses merge into one that ends with the latest of them
+            self.action_queue.submit_pause(self.pause_duration_spinbox.value())
+            self.actions_submitted.emit()
             logging.info("Shuffle paused for %d seconds", self.pause_duration_spinbox.value())
         else:
             logging.error("Cannot pause shuffle. Shuffling is not active.")   
\ No newline at end of file